@@ -0,0 +1,108 @@
+"""
+Adaptive System Prompt from Feedback Patterns
+
+Responses are tagged with simple keyword patterns ('empathy', 'coping', ...)
+and every rating of a response is credited to its patterns. Patterns whose
+average rating reaches a threshold are emphasized in the system prompt.
+
+Each pattern keeps a running (optionally decayed) rating count and sum, so
+recording a rating and reading the prompt are both O(1) however much feedback
+has accumulated. The prompt string is rebuilt only when a pattern crosses the
+threshold, and a hysteresis band keeps a pattern hovering around the threshold
+from switching the prompt back and forth.
+
+Configuration is read from the environment:
+    ADAPTIVE_POSITIVE_THRESHOLD  Average rating at which a pattern is emphasized (default 4)
+    ADAPTIVE_HYSTERESIS          How far below the threshold an emphasized pattern may drop
+                                 before it is removed again (default 0.25)
+    ADAPTIVE_HALF_LIFE           Ratings after which an old rating counts half, 0 for a plain
+                                 average over all ratings (default 0)
+"""
+
+import os
+import threading
+from typing import Dict, Any, Optional, Callable, Tuple
+
+ADAPTIVE_POSITIVE_THRESHOLD = float(os.environ.get("ADAPTIVE_POSITIVE_THRESHOLD", "4"))
+ADAPTIVE_HYSTERESIS = float(os.environ.get("ADAPTIVE_HYSTERESIS", "0.25"))
+ADAPTIVE_HALF_LIFE = float(os.environ.get("ADAPTIVE_HALF_LIFE", "0"))
+
+BASE_PROMPT = "You are a mental health support chatbot. Respond with empathy and understanding."
+EMPHASIS_PROMPT = "You are a mental health support chatbot. Based on user feedback, please emphasize: "
+
+
+class FeedbackPatterns:
+    """Running rating aggregates per pattern and the system prompt they produce."""
+
+    def __init__(self, aggregates: Optional[Dict[str, Tuple[float, float]]] = None,
+                 on_update: Optional[Callable[[str, int, float, float], None]] = None,
+                 threshold: float = ADAPTIVE_POSITIVE_THRESHOLD, hysteresis: float = ADAPTIVE_HYSTERESIS,
+                 half_life: float = ADAPTIVE_HALF_LIFE):
+        """
+        Initialize from stored aggregates.
+
+        Args:
+            aggregates: pattern -> (weight, weighted rating sum), e.g. from Storage.load_feedback_patterns()
+            on_update: Called with (pattern, rating, weight, total) after each rating, to persist it
+            threshold: Average rating at which a pattern is emphasized
+            hysteresis: Margin below the threshold before an emphasized pattern is dropped
+            half_life: Ratings after which an old rating counts half (0 disables decay)
+        """
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.decay = 0.5 ** (1.0 / half_life) if half_life > 0 else 1.0
+        self.on_update = on_update
+
+        # pattern -> [weight, total], in first-seen order
+        self._aggregates = {pattern: list(values) for pattern, values in (aggregates or {}).items()}
+        self._emphasized = {pattern for pattern in self._aggregates if self._mean(pattern) >= threshold}
+        self._lock = threading.Lock()
+        self.prompt_changes = 0
+        self.prompt = self._build_prompt()
+
+    def __len__(self):
+        return len(self._aggregates)
+
+    def _mean(self, pattern: str) -> float:
+        weight, total = self._aggregates[pattern]
+        return total / weight if weight else 0.0
+
+    def _build_prompt(self) -> str:
+        emphasized = [pattern for pattern in self._aggregates if pattern in self._emphasized]
+        if emphasized:
+            return EMPHASIS_PROMPT + ", ".join(emphasized)
+        return BASE_PROMPT
+
+    def record(self, pattern: str, rating: int) -> None:
+        """Credit one rating to a pattern, updating the prompt if the pattern crosses the threshold."""
+        with self._lock:
+            aggregate = self._aggregates.setdefault(pattern, [0.0, 0.0])
+            aggregate[0] = aggregate[0] * self.decay + 1
+            aggregate[1] = aggregate[1] * self.decay + rating
+            weight, total = aggregate
+
+            mean = self._mean(pattern)
+            if pattern in self._emphasized:
+                changed = mean < self.threshold - self.hysteresis
+                if changed:
+                    self._emphasized.discard(pattern)
+            else:
+                changed = mean >= self.threshold
+                if changed:
+                    self._emphasized.add(pattern)
+            if changed:
+                self.prompt = self._build_prompt()
+                self.prompt_changes += 1
+
+            # Inside the lock so aggregates are persisted in the order they were computed
+            if self.on_update:
+                self.on_update(pattern, rating, weight, total)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-pattern averages and the current emphasis, for monitoring."""
+        with self._lock:
+            return {
+                'patterns': {pattern: round(self._mean(pattern), 3) for pattern in self._aggregates},
+                'emphasized': sorted(self._emphasized),
+                'prompt_changes': self.prompt_changes,
+            }
@@ -0,0 +1,233 @@
+"""
+Approximate Nearest-Neighbour (IVF) Index for the RAG System
+
+Exact search scores every chunk, so its cost grows linearly with the knowledge
+base. This module adds an inverted-file (IVF) index: chunk vectors are clustered
+with spherical k-means into `n_lists` lists, and a query only scores the chunks
+in the `n_probe` lists whose centroids are closest to it. Recall and latency are
+traded off with `n_probe` at search time (and `n_lists` at build time).
+
+IVFIndex has the same search()/search_batch() interface as MatrixVectorStore and
+wraps one, so it can stand in for it behind VectorRetriever. The trained lists
+are saved next to the chunk store in the index artifact directory.
+
+When the knowledge base is updated incrementally (see document_index.py), rows
+appended after the lists were built are scanned exhaustively and deleted rows
+are skipped, until with_store() folds them into the lists at compaction time.
+
+Configuration is read from the environment:
+    RAG_ANN_INDEX       "ivf" to enable the approximate index, "none" for exact search (default none)
+    RAG_ANN_MIN_CHUNKS  Knowledge bases smaller than this always use exact search (default 10000)
+    RAG_IVF_LISTS       Number of clusters, 0 for about 4 * sqrt(chunks) (default 0)
+    RAG_IVF_PROBES      Clusters scanned per query (default 8)
+"""
+
+import os
+import math
+import logging
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from vector_store import MatrixVectorStore, normalize_rows, top_k_rows
+
+logger = logging.getLogger(__name__)
+
+RAG_ANN_INDEX = os.environ.get("RAG_ANN_INDEX", "none").lower()
+RAG_ANN_MIN_CHUNKS = int(os.environ.get("RAG_ANN_MIN_CHUNKS", "10000"))
+RAG_IVF_LISTS = int(os.environ.get("RAG_IVF_LISTS", "0"))
+RAG_IVF_PROBES = int(os.environ.get("RAG_IVF_PROBES", "8"))
+
+# Rows scored per block while training and assigning, to bound temporary memory
+ASSIGN_BLOCK_ROWS = 65536
+
+
+def default_n_lists(chunks: int) -> int:
+    """Rule-of-thumb cluster count for a corpus size."""
+    return max(1, min(chunks, int(4 * math.sqrt(chunks))))
+
+
+def _nearest_centroid(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assignments = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), ASSIGN_BLOCK_ROWS):
+        block = matrix[start:start + ASSIGN_BLOCK_ROWS]
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(matrix: np.ndarray, n_lists: int, iterations: int = 10, sample_per_list: int = 64,
+                    seed: int = 0) -> np.ndarray:
+    """
+    Cluster unit vectors with spherical k-means.
+
+    Args:
+        matrix: (chunks, dimensions) normalized embedding matrix
+        n_lists: Number of clusters
+        iterations: k-means iterations
+        sample_per_list: Training rows sampled per cluster (caps training cost on large corpora)
+        seed: Random seed, so rebuilding from the same vectors gives the same index
+
+    Returns:
+        np.ndarray: (n_lists, dimensions) normalized centroids
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(matrix), n_lists * sample_per_list)
+    sample = np.asarray(matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = _nearest_centroid(sample, centroids)
+        counts = np.bincount(assignments, minlength=n_lists)
+
+        # Sum the rows of each cluster: sort rows by cluster and add up each contiguous run
+        order = np.argsort(assignments, kind='stable')
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        filled = counts > 0
+        sums = np.zeros_like(centroids)
+        sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+
+        # Re-seed empty clusters with random training rows
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file approximate search over a MatrixVectorStore."""
+
+    def __init__(self, store: MatrixVectorStore, centroids: np.ndarray, list_offsets: np.ndarray,
+                 list_ids: np.ndarray, n_probe: int = RAG_IVF_PROBES, indexed_rows: Optional[int] = None):
+        """
+        Initialize from trained lists (see build()).
+
+        Args:
+            store: The exact store holding the chunks and their vectors
+            centroids: (n_lists, dimensions) normalized cluster centroids
+            list_offsets: (n_lists + 1,) start of each list in list_ids
+            list_ids: Chunk row ids grouped by list
+            n_probe: Default number of lists scanned per query
+            indexed_rows: Rows covered by the lists (defaults to all); later rows are always scanned
+        """
+        self.store = store
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+        self.n_probe = n_probe
+        self.indexed_rows = len(store) if indexed_rows is None else indexed_rows
+
+    @classmethod
+    def build(cls, store: MatrixVectorStore, n_lists: int = RAG_IVF_LISTS, n_probe: int = RAG_IVF_PROBES,
+              iterations: int = 10, seed: int = 0) -> "IVFIndex":
+        """
+        Cluster the store's vectors and build the inverted lists.
+
+        Args:
+            store: The exact store to index
+            n_lists: Number of clusters (0 picks default_n_lists())
+            n_probe: Default number of lists scanned per query
+            iterations: k-means iterations
+            seed: Random seed for training
+
+        Returns:
+            IVFIndex: The built index
+        """
+        n_lists = min(n_lists or default_n_lists(len(store)), len(store))
+        centroids = train_centroids(store.matrix, n_lists, iterations=iterations, seed=seed)
+        assignments = _nearest_centroid(store.matrix, centroids)
+
+        list_ids = np.argsort(assignments, kind='stable').astype(np.int32)
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=n_lists), out=list_offsets[1:])
+
+        logger.info(f"Built IVF index with {n_lists} lists over {len(store)} chunks")
+        return cls(store, centroids, list_offsets, list_ids, n_probe=n_probe)
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.store)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """The trained state, for persisting with index_store.save_ann_index()."""
+        return {'centroids': self.centroids, 'list_offsets': self.list_offsets, 'list_ids': self.list_ids}
+
+    def with_store(self, store: MatrixVectorStore, row_map: Optional[np.ndarray] = None) -> "IVFIndex":
+        """
+        Reuse the trained lists over an updated store.
+
+        Without `row_map` the store must only have grown (rows appended or masked as
+        deleted), and the new rows stay unindexed. With `row_map` (old row -> new row,
+        -1 for dropped rows, as produced by compaction) the lists are renumbered and
+        every unindexed row is assigned to its nearest centroid.
+
+        Args:
+            store: The updated store
+            row_map: Optional mapping from this index's row ids to the store's row ids
+
+        Returns:
+            IVFIndex: An index over `store`; this one is left unchanged for in-flight queries
+        """
+        if row_map is None:
+            return IVFIndex(store, self.centroids, self.list_offsets, self.list_ids,
+                            n_probe=self.n_probe, indexed_rows=self.indexed_rows)
+
+        owners = np.repeat(np.arange(self.n_lists, dtype=np.int32), np.diff(self.list_offsets))
+        rows = row_map[self.list_ids]
+        kept = rows >= 0
+        owners, rows = owners[kept], rows[kept]
+
+        indexed = np.zeros(len(store), dtype=bool)
+        indexed[rows] = True
+        tail = np.flatnonzero(~indexed)
+        if len(tail):
+            owners = np.concatenate([owners, _nearest_centroid(store.matrix[tail], self.centroids)])
+            rows = np.concatenate([rows, tail])
+
+        order = np.argsort(owners, kind='stable')
+        list_offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owners, minlength=self.n_lists), out=list_offsets[1:])
+        return IVFIndex(store, self.centroids, list_offsets, rows[order].astype(np.int32), n_probe=self.n_probe)
+
+    def _candidates(self, lists) -> np.ndarray:
+        parts = [self.list_ids[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists]
+        if self.indexed_rows < len(self.store):
+            parts.append(np.arange(self.indexed_rows, len(self.store), dtype=np.int32))
+        candidates = np.concatenate(parts)
+        if self.store.live is not None:
+            candidates = candidates[self.store.live[candidates]]
+        return candidates
+
+    def search(self, query_vector, k: int = 3, n_probe: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Approximately find the chunks most similar to one query.
+
+        Args:
+            query_vector: Query embedding
+            k: Number of chunks to return
+            n_probe: Lists to scan (defaults to the index setting); more is slower but more accurate
+
+        Returns:
+            List of dicts in the format of MatrixVectorStore.search()
+        """
+        return self.search_batch([query_vector], k, n_probe)[0]
+
+    def search_batch(self, query_vectors, k: int = 3, n_probe: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """Approximate search for several queries; centroids are scored with one matrix product."""
+        queries = normalize_rows(query_vectors)
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        probes = top_k_rows(queries @ self.centroids.T, n_probe)
+
+        results = []
+        for query, lists in zip(queries, probes):
+            candidates = self._candidates(lists)
+            if len(candidates) == 0:
+                results.append([])
+                continue
+            scores = self.store.matrix[candidates] @ query
+            best = top_k_rows(scores[np.newaxis, :], k)[0]
+            results.append(self.store.hits_for(candidates[best], scores[best]))
+        return results
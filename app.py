@@ -1,17 +1,31 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash
+from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, Response, stream_with_context, g, send_file
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 import os
 import re
 import json
 import logging
-from datetime import datetime
-import requests
-import statistics
-from collections import defaultdict
-import re
-import json
+import itertools
+import threading
 from clinical_flow import get_next_question, process_response, generate_clinical_summary, generate_ai_enhanced_report
-from ollama_handler import create_mental_health_prompt, initialize_rag
+import ollama_handler
+from ollama_handler import create_mental_health_prompt, initialize_rag, send_prompt_to_ollama, stream_prompt_to_ollama
+from ollama_client import get_client, OllamaError
+from response_filters import filter_stream, chat_filters
+from scheduler import get_scheduler, SchedulerBusy, RequestCancelled
+from disconnect import ClientWatch
+from crisis_detector import CrisisDetector
+from storage import get_storage, RecordTable, RATINGS
+from adaptive_prompt import FeedbackPatterns
+from report_cache import ClinicalReportCache
+from job_queue import JobQueue
+import metrics
+from metrics import start_request
+from logging_config import configure_logging
+import profiling
+from profiling import RequestProfiler, MemoryTracker
+
+configure_logging()
+logger = logging.getLogger(__name__)
 # Try to import the mental health knowledge base
 try:
     from mental_health_kb import load_mental_health_kb_into_rag
@@ -22,35 +36,320 @@ except ImportError:
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.urandom(24)
 
-# Initialize RAG system if available
-if MENTAL_HEALTH_KB_AVAILABLE:
-    print("Initializing RAG system with mental health knowledge base...")
-    initialize_rag(model_name="deepseek-r1:1.5b")
-    load_mental_health_kb_into_rag()
-    print("RAG system initialized successfully!")
+# Warm-up state, reported by /readyz. Status is one of:
+# "warming", "ready", "failed" or "disabled" (knowledge base not available)
+rag_warmup = {'status': 'warming', 'error': None}
+rag_ready = threading.Event()
+
+def warm_up_rag():
+    """Initialize the RAG system and load the Ollama model without blocking the server."""
+    try:
+        if MENTAL_HEALTH_KB_AVAILABLE:
+            logger.info("Initializing RAG system with mental health knowledge base...")
+            # initialize_rag() reports False until documents are loaded, so judge by the load result
+            initialize_rag(model_name="deepseek-r1:1.5b")
+            if load_mental_health_kb_into_rag():
+                ollama_handler.rag_handler.warm_up()
+                rag_warmup['status'] = 'ready'
+                logger.info("RAG system initialized successfully!")
+            else:
+                rag_warmup['status'] = 'failed'
+                logger.warning("RAG system failed to initialize, chat will use the standard API")
+        else:
+            rag_warmup['status'] = 'disabled'
+    except Exception as e:
+        rag_warmup['status'] = 'failed'
+        rag_warmup['error'] = str(e)
+        logger.error(f"Error during RAG warm-up: {str(e)}")
+    finally:
+        rag_ready.set()
+    
+    # Load the generation model so the first chat turn doesn't pay for it
+    try:
+        get_client().load_model("deepseek-r1:1.5b")
+    except Exception as e:
+        logger.warning(f"Could not preload Ollama model: {str(e)}")
+
+# Warm up in the background so Flask can serve requests (and health checks) right away
+threading.Thread(target=warm_up_rag, name="rag-warmup", daemon=True).start()
+
+# Durable storage for users, conversations, and feedback (SQLite with a bounded cache, see storage.py)
+storage = get_storage()
+users = RecordTable(storage, "users")
+user_timelines = RecordTable(storage, "user_timelines")  # Store clinical assessment timelines by user ID
+conversation_states = RecordTable(storage, "conversation_states")  # Track conversation state for clinical flow
 
-# In-memory storage for users, conversations, and feedback
-users = {}
-conversations = []
-user_timelines = {}  # Store clinical assessment timelines by user ID
-conversation_states = {}  # Track conversation state for clinical flow
+# Worker pool for long-running LLM work; routes submit a job and clients poll /jobs/<id>
+job_queue = JobQueue(storage)
+
+# Last good AI clinical report per user, regenerated in the background when the timeline changes
+report_cache = ClinicalReportCache(
+    RecordTable(storage, "clinical_reports"),
+    jobs=job_queue,
+    # Model failures raise, so the basic summary is never stored as this timeline's report
+    generate_report=lambda timeline: generate_ai_enhanced_report(timeline, fallback=False),
+    basic_summary=generate_clinical_summary,
+    acquire=lambda username: get_scheduler().acquire(username)
+)
+
+# Rated conversations shown per /reviews page
+REVIEWS_PAGE_SIZE = 20
+REVIEWS_MAX_PAGE_SIZE = 100
 
 # Adaptive learning: Store feedback patterns
-feedback_patterns = defaultdict(list)
+# (running per-pattern aggregates; see adaptive_prompt.py)
+feedback_patterns = FeedbackPatterns(storage.load_feedback_patterns(), on_update=storage.add_feedback_rating)
+
+# Risk-phrase check run before the clinical flow and any model call (see crisis_detector.py)
+crisis_detector = CrisisDetector()
 
 def get_adaptive_prompt(user_message):
     """Generate an adaptive prompt based on learned patterns"""
-    if not feedback_patterns:
-        return "You are a mental health support chatbot. Respond with empathy and understanding."
+    # Maintained as feedback arrives, so this is O(1) per turn
+    return feedback_patterns.prompt
+
+def advance_clinical_flow(username):
+    """
+    Move a user one step through the clinical assessment flow.
     
-    # Find patterns with positive feedback
-    positive_patterns = [pattern for pattern, ratings in feedback_patterns.items() 
-                        if ratings and statistics.mean(ratings) >= 4]
+    Args:
+        username (str): The user whose conversation state is advanced
+        
+    Returns:
+        tuple: The question data for this turn and whether the user is still in the flow
+    """
+    # Get user's conversation state
+    user_state = conversation_states.get(username, {'current_question_index': -1})
     
-    if positive_patterns:
-        return "You are a mental health support chatbot. Based on user feedback, please emphasize: " + ", ".join(positive_patterns)
+    # Get the next question in the clinical flow
+    question_data = get_next_question(user_state)
+    
+    # Process the user's response to update the timeline
+    if user_state['current_question_index'] >= 0:
+        timeline_data = user_timelines.get(username, {'entries': []})
+        # Skip direct process_response call to avoid errors
+        user_timelines[username] = timeline_data
+    
+    # Increment the question index for the next question
+    user_state['current_question_index'] += 1
+    conversation_states[username] = user_state
     
-    return "You are a mental health support chatbot. Respond with empathy and understanding."
+    return question_data, user_state['current_question_index'] < 8
+
+def store_conversation(user_message, bot_response, username=None):
+    """Store a chat turn and return its conversation id."""
+    return storage.add_conversation(user_message, bot_response, username)
+
+def record_feedback(conversation_id, rating):
+    """
+    Attach a rating to a stored conversation and learn from it.
+    
+    Returns:
+        bool: True if the feedback was recorded, False if the data was invalid
+    """
+    if not isinstance(conversation_id, int) or isinstance(rating, bool) or rating not in RATINGS:
+        return False
+    
+    conversation = storage.set_feedback(conversation_id, rating)
+    if conversation is None:
+        return False
+    
+    # Extract keywords for adaptive learning
+    bot_response = conversation['bot_response'] or ''
+    
+    # Simple keyword extraction (in a real app, use NLP)
+    keywords = ['empathy', 'advice', 'resources', 'validation', 'coping']
+    for keyword in keywords:
+        if keyword in bot_response.lower():
+            feedback_patterns.record(keyword, rating)
+    
+    return True
+
+def get_ready_rag_handler():
+    """
+    Return the shared RAG handler if the knowledge base is loaded, otherwise None.
+    
+    While the background warm-up is still running this returns None, so chat
+    requests take the standard (non-RAG) path instead of waiting.
+    """
+    if not rag_ready.is_set():
+        return None
+    handler = ollama_handler.rag_handler
+    if MENTAL_HEALTH_KB_AVAILABLE and handler is not None and handler.is_enabled():
+        return handler
+    return None
+
+def wants_stream(data, headers=None):
+    """Check whether the client asked for a token stream instead of a single JSON reply."""
+    headers = request.headers if headers is None else headers
+    return bool(data.get('stream')) or 'text/event-stream' in headers.get('Accept', '')
+
+def sse_event(event, payload):
+    """Format a Server-Sent Event carrying a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def rag_cache_options(data, user_message, system_prompt=""):
+    """
+    Build the semantic answer cache arguments for a RAG query.
+    
+    The cache is keyed on the raw user message (not the full prompt, whose shared
+    preamble would make every question look alike) and scoped to the system prompt.
+    Clients can send "bypass_cache": true to force a fresh generation.
+    """
+    return {
+        'cache_text': user_message,
+        'cache_scope': system_prompt or "",
+        'use_cache': not data.get('bypass_cache', False)
+    }
+
+def open_reply_stream(full_prompt, timeout, rag_options=None, is_cancelled=None):
+    """
+    Start streaming a reply, preferring the RAG chain and falling back to the plain Ollama API.
+    
+    Args:
+        full_prompt (str): The complete prompt
+        timeout (int): Deadline in seconds for the Ollama call
+        rag_options (dict): Extra arguments for RAGHandler.stream_query
+        is_cancelled (callable): Optional client disconnect check that stops the generation
+    
+    Returns:
+        tuple: An iterator of visible text fragments and whether RAG is producing them
+    """
+    handler = get_ready_rag_handler()
+    if handler:
+        fragments = filter_stream(handler.stream_query(full_prompt, **(rag_options or {})),
+                                  chat_filters(is_cancelled=is_cancelled))
+        try:
+            # Pull the first fragment so retrieval errors surface before we commit to RAG
+            first_fragment = next(fragments)
+            return itertools.chain([first_fragment], fragments), True
+        except StopIteration:
+            logger.warning("RAG stream returned no text, falling back to standard API")
+        except Exception as rag_error:
+            logger.warning(f"Error streaming from RAG: {str(rag_error)}")
+    
+    return stream_prompt_to_ollama(full_prompt, timeout=timeout, filters=chat_filters(is_cancelled=is_cancelled)), False
+
+def busy_response(busy):
+    """Build the 429 reply for a request the scheduler could not admit."""
+    response = jsonify({
+        'error': 'The assistant is busy right now, please try again shortly.',
+        'reason': busy.reason,
+        'retry_after': busy.retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(busy.retry_after)
+    return response
+
+def stream_chat_response(fragments, timer, on_complete, lease=None, path=None, is_cancelled=None):
+    """
+    Relay reply fragments to the client as Server-Sent Events.
+    
+    Each fragment is sent as a `token` event as soon as it is available. A final `done`
+    event carries the same JSON body the non-streaming endpoint returns, built by
+    `on_complete(bot_response)`, plus the time to the first token. The scheduler
+    `lease`, if any, is released once generation ends, and the request's stage
+    timings are recorded under `path` (see metrics.py). If the client disconnects,
+    the generation is stopped and nothing is stored.
+    """
+    def generate():
+        metrics.activate(timer)
+        pieces = []
+        first_token_ms = None
+        try:
+            for fragment in fragments:
+                if first_token_ms is None:
+                    first_token_ms = timer.elapsed_ms
+                pieces.append(fragment)
+                yield sse_event('token', {'text': fragment})
+            bot_response = ''.join(pieces).strip()
+        except GeneratorExit:
+            # The server closed the response because writing to the client failed
+            close_stream(fragments)
+            cancel_request(timer, 'generation')
+            raise
+        except Exception as e:
+            logger.error(f"Error while streaming response: {str(e)}", extra={'endpoint': timer.endpoint})
+            bot_response = ''.join(pieces).strip()
+        finally:
+            if lease is not None:
+                lease.release()
+        
+        if is_cancelled is not None and is_cancelled():
+            cancel_request(timer, 'generation')
+            return
+        
+        if not bot_response:
+            bot_response = "I apologize, but I encountered an error connecting to my knowledge base. Please try again later."
+        
+        with timer.stage('postprocess'):
+            result = on_complete(bot_response)
+            result['response_time_ms'] = timer.elapsed_ms
+            result['first_token_ms'] = first_token_ms
+            event = sse_event('done', result)
+        timer.finish(path)
+        yield event
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def client_watch():
+    """The disconnect check for the current request, or None if the server doesn't expose the client socket."""
+    watch = ClientWatch.from_environ(request.environ)
+    return watch.disconnected if watch is not None else None
+
+def cancel_request(timer, stage):
+    """Record a request abandoned by its client in the given stage ("queue" or "generation")."""
+    timer.cancel(stage)
+    logger.info("Client disconnected, request cancelled", extra={'endpoint': timer.endpoint, 'stage': stage})
+
+def cancelled_response(timer, stage):
+    """Give up on a request whose client has gone away; nobody reads this response."""
+    cancel_request(timer, stage)
+    return Response(status=499)
+
+def close_stream(fragments):
+    close = getattr(fragments, 'close', None)
+    if close is not None:
+        close()
+
+def detect_crisis(user_message, username, timer):
+    """Check a message for crisis language, flagging the user's later requests for queue priority."""
+    with timer.stage('crisis_check'):
+        return bool(crisis_detector.check(user_message, username))
+
+def crisis_result(timer, on_complete):
+    """
+    Build the reply to a message with crisis language: the crisis-support resources, sent
+    without waiting for the clinical flow, a scheduler slot or the model.
+    
+    Args:
+        timer: The request's timer, finished here with path "crisis"
+        on_complete: Builds the endpoint's reply body from the response text (as in stream_chat_response)
+    
+    Returns:
+        dict: The JSON reply body
+    """
+    with timer.stage('postprocess'):
+        result = on_complete(crisis_detector.response)
+        result['crisis'] = True
+        result['response_time_ms'] = timer.elapsed_ms
+    timer.finish('crisis')
+    return result
+
+def crisis_events(result):
+    """The crisis reply as the token and done events a streaming client expects."""
+    done = dict(result, first_token_ms=result['response_time_ms'])
+    return sse_event('token', {'text': result['response']}) + sse_event('done', done)
+
+def crisis_response(data, result):
+    """Send the crisis reply built by crisis_result as JSON or, to streaming clients, as Server-Sent Events."""
+    if wants_stream(data):
+        return Response(crisis_events(result), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    return jsonify(result)
 
 @app.route('/')
 def index():
@@ -87,12 +386,10 @@ def register():
             flash('Passwords do not match')
             return render_template('register.html')
         
-        if username in users:
+        if not users.insert(username, {'password': password}):
             flash('Username already exists')
             return render_template('register.html')
         
-        users[username] = {'password': password}
-        
         # Initialize user timeline
         user_timelines[username] = {'entries': []}
         
@@ -105,276 +402,249 @@ def register():
 
 @app.route('/chat', methods=['POST'])
 def chat():
-    # Record start time for response time measurement
-    start_time = datetime.now()
+    # Times each stage of the request for /metrics and the response time measurement
+    timer = start_request('chat')
     
     data = request.get_json()
     user_message = data.get('message')
     username = data.get('username', 'anonymous')
+    # Stops queueing and generation once the client has gone away
+    is_cancelled = client_watch()
     
-    # Get user's conversation state
-    user_state = conversation_states.get(username, {'current_question_index': -1})
+    # Crisis language is answered with crisis resources at once, before anything else
+    if detect_crisis(user_message, data.get('username'), timer):
+        return crisis_response(data, crisis_result(timer, lambda bot_response: {
+            'response': bot_response,
+            'conversation_id': store_conversation(user_message, bot_response, username),
+            'in_clinical_flow': False,
+            'rag_used': False
+        }))
     
-    # Get the next question in the clinical flow
-    question_data = get_next_question(user_state)
+    # Advance the clinical flow and get this turn's question
+    question_data, in_clinical_flow = advance_clinical_flow(username)
     
-    # Process the user's response to update the timeline
-    if user_state['current_question_index'] >= 0:
-        timeline_data = user_timelines.get(username, {'entries': []})
-        # Skip direct process_response call to avoid errors
-        user_timelines[username] = timeline_data
+    # Model calls wait for a scheduler slot; clinical flow questions need none
+    lease = None
+    if not in_clinical_flow:
+        try:
+            with timer.stage('queue_wait'):
+                lease = get_scheduler().acquire(username, is_cancelled=is_cancelled,
+                                                priority=crisis_detector.is_flagged(data.get('username')))
+        except SchedulerBusy as busy:
+            return busy_response(busy)
+        except RequestCancelled:
+            return cancelled_response(timer, 'queue')
     
-    # Increment the question index for the next question
-    user_state['current_question_index'] += 1
-    conversation_states[username] = user_state
+    # Streaming clients receive tokens as they are generated instead of one JSON body
+    if wants_stream(data):
+        if in_clinical_flow:
+            fragments, rag_used = iter([question_data['text']]), False
+        else:
+            # Until the stream owns the lease, any error here must give the slot back
+            try:
+                with timer.stage('prompt_build'):
+                    adaptive_prompt = get_adaptive_prompt(user_message)
+                    full_prompt = create_mental_health_prompt(user_message, system_prompt=adaptive_prompt)
+                fragments, rag_used = open_reply_stream(
+                    full_prompt,
+                    timeout=300,
+                    rag_options=rag_cache_options(data, user_message, adaptive_prompt),
+                    is_cancelled=is_cancelled
+                )
+            except BaseException:
+                lease.release()
+                raise
+        
+        def complete(bot_response):
+            return {
+                'response': bot_response,
+                'conversation_id': store_conversation(user_message, bot_response, username),
+                'in_clinical_flow': in_clinical_flow,
+                'rag_used': rag_used
+            }
+        
+        path = 'clinical_flow' if in_clinical_flow else ('rag' if rag_used else 'direct')
+        return stream_chat_response(fragments, timer, complete, lease=lease, path=path, is_cancelled=is_cancelled)
     
     # If we're still in the clinical flow (questions 0-7), return the next question
-    if user_state['current_question_index'] < 8:
+    if in_clinical_flow:
         bot_response = question_data['text']
         rag_used = False
     else:
-        # Create an adaptive prompt based on feedback patterns
-        adaptive_prompt = get_adaptive_prompt(user_message)
-        
-        # Use our ollama_handler module to get the response
-        full_prompt = create_mental_health_prompt(user_message, system_prompt=adaptive_prompt)
-        
-        # Try to use RAG first if available
-        rag_used = False
-        if MENTAL_HEALTH_KB_AVAILABLE:
-            print(f"Attempting to use RAG for message: {user_message[:30]}...")
-            
-            try:
-                from rag_handler import RAGHandler
-                global rag_handler
-                
-                if not rag_handler:
-                    print("Initializing RAG handler...")
-                    rag_handler = RAGHandler(model_name="deepseek-r1:1.5b")
+        with lease:
+            with timer.stage('prompt_build'):
+                # Create an adaptive prompt based on feedback patterns
+                adaptive_prompt = get_adaptive_prompt(user_message)
                 
-                if rag_handler and rag_handler.is_enabled():
-                    print("RAG is enabled, querying knowledge base...")
-                    response_text, context = rag_handler.query(full_prompt)
-                    if response_text:
-                        bot_response = response_text
-                        rag_used = True
-                        print(f"Successfully used RAG! Response length: {len(bot_response)}")
+                # Use our ollama_handler module to get the response
+                full_prompt = create_mental_health_prompt(user_message, system_prompt=adaptive_prompt)
+            
+            # Try to use RAG first if available
+            rag_used = False
+            if MENTAL_HEALTH_KB_AVAILABLE:
+                logger.debug(f"Attempting to use RAG for message: {user_message[:30]}...")
+            
+                try:
+                    handler = get_ready_rag_handler()
+                    if handler:
+                        response_text = handler.query(
+                            full_prompt, filters=chat_filters(is_cancelled=is_cancelled),
+                            **rag_cache_options(data, user_message, adaptive_prompt)
+                        ).get('answer')
+                        if response_text:
+                            bot_response = response_text
+                            rag_used = True
+                            logger.debug(f"Successfully used RAG! Response length: {len(bot_response)}")
+                        else:
+                            logger.info("RAG query returned no results, falling back to standard API")
                     else:
-                        print("RAG query returned no results, falling back to standard API")
-                else:
-                    print("RAG is not properly initialized, falling back to standard API")
-            except Exception as rag_error:
-                print(f"Error using RAG: {str(rag_error)}")
-        
-        # If RAG wasn't used or failed, use direct API call as fallback
-        if not rag_used:
-            # Direct integration with Ollama API to avoid potential issues
-            try:
-                print(f"Sending request to Ollama API with prompt: {full_prompt[:100]}...")
-                response = requests.post(
-                    "http://localhost:11434/api/generate",
-                    json={
-                        "model": "deepseek-r1:1.5b",
-                        "prompt": full_prompt,
-                        "stream": False
-                    },
-                    timeout=300  # Increase timeout to 5 minutes
-                )
-                
-                print(f"Received response with status code: {response.status_code}")
-                
-                if response.status_code == 200:
-                    response_data = response.json()
-                    bot_response = response_data.get('response', '')
-                    # Clean up response
-                    bot_response = re.sub(r'<think>.*?</think>', '', bot_response, flags=re.DOTALL).strip()
-                    print(f"Successfully got response: {bot_response[:100]}...")
-                else:
-                    print(f"API error: {response.status_code} - {response.text}")
+                        logger.debug("RAG is not properly initialized, falling back to standard API")
+                except Exception as rag_error:
+                    logger.warning(f"Error using RAG: {str(rag_error)}")
+            
+            # If RAG wasn't used or failed, use direct API call as fallback
+            if not rag_used and not (is_cancelled and is_cancelled()):
+                try:
+                    bot_response = get_client().generate(full_prompt, model="deepseek-r1:1.5b", timeout=300,
+                                                         filters=chat_filters(is_cancelled=is_cancelled))
+                except Exception as e:
+                    logger.error(f"Error calling Ollama API: {str(e)}", extra={'endpoint': 'chat'})
                     bot_response = "I apologize, but I encountered an error connecting to my knowledge base. Please try again later."
-            except Exception as e:
-                print(f"Error calling Ollama API: {str(e)}")
-                bot_response = "I apologize, but I encountered an error connecting to my knowledge base. Please try again later."
-    
-    # Store conversation
-    conversations.append({
-        'timestamp': datetime.now().isoformat(),
-        'user_message': user_message,
-        'bot_response': bot_response,
-        'feedback': None
-    })
-    
-    # Calculate response time
-    end_time = datetime.now()
-    response_time_ms = int((end_time - start_time).total_seconds() * 1000)
+        
+        if is_cancelled is not None and is_cancelled():
+            return cancelled_response(timer, 'generation')
     
-    return jsonify({
-        'response': bot_response,
-        'conversation_id': len(conversations) - 1,
-        'in_clinical_flow': user_state['current_question_index'] < 8,
-        'response_time_ms': response_time_ms,
-        'rag_used': rag_used
-    })
+    with timer.stage('postprocess'):
+        # Store conversation
+        conversation_id = store_conversation(user_message, bot_response, username)
+        
+        response = jsonify({
+            'response': bot_response,
+            'conversation_id': conversation_id,
+            'in_clinical_flow': in_clinical_flow,
+            'response_time_ms': timer.elapsed_ms,
+            'rag_used': rag_used
+        })
+    timer.finish('clinical_flow' if in_clinical_flow else ('rag' if rag_used else 'direct'))
+    return response
 
 @app.route('/simple_chat', methods=['POST'])
 def simple_chat():
     """A simplified chat endpoint that directly calls Ollama without any extra complexity."""
-    start_time = datetime.now()
+    timer = start_request('simple_chat')
     
     data = request.get_json()
     user_message = data.get('message')
     use_rag = True  # Always use RAG regardless of input
     rag_used = True  # Always set rag_used to True
+    is_cancelled = client_watch()
+    
+    if detect_crisis(user_message, data.get('username'), timer):
+        return crisis_response(data, crisis_result(
+            timer, lambda bot_response: {'response': bot_response, 'rag_used': rag_used}
+        ))
     
+    try:
+        with timer.stage('queue_wait'):
+            lease = get_scheduler().acquire(data.get('username', 'anonymous'), is_cancelled=is_cancelled,
+                                            priority=crisis_detector.is_flagged(data.get('username')))
+    except SchedulerBusy as busy:
+        return busy_response(busy)
+    except RequestCancelled:
+        return cancelled_response(timer, 'queue')
+    
+    if wants_stream(data):
+        try:
+            with timer.stage('prompt_build'):
+                full_prompt = create_mental_health_prompt(user_message)
+            fragments, rag_streamed = open_reply_stream(full_prompt, timeout=60, rag_options=rag_cache_options(data, user_message),
+                                                        is_cancelled=is_cancelled)
+        except BaseException:
+            lease.release()
+            raise
+        return stream_chat_response(
+            fragments,
+            timer,
+            lambda bot_response: {'response': bot_response, 'rag_used': rag_used},
+            lease=lease,
+            path='rag' if rag_streamed else 'direct',
+            is_cancelled=is_cancelled
+        )
+    
+    # The reply always reports rag_used; the metrics record which path actually answered
+    path = 'direct'
     try:
         if MENTAL_HEALTH_KB_AVAILABLE:
-            print(f"Attempting to use RAG for message: {user_message[:30]}...")
+            logger.debug(f"Attempting to use RAG for message: {user_message[:30]}...")
             # Create a more complete prompt
-            full_prompt = create_mental_health_prompt(user_message)
+            with timer.stage('prompt_build'):
+                full_prompt = create_mental_health_prompt(user_message)
+            bot_response = None
             
             # Try to use RAG via our existing handler
             try:
-                from rag_handler import RAGHandler
-                global rag_handler
-                
-                if not rag_handler:
-                    print("Initializing RAG handler...")
-                    rag_handler = RAGHandler(model_name="deepseek-r1:1.5b")
-                
-                if rag_handler and rag_handler.is_enabled():
-                    print("RAG is enabled, querying knowledge base...")
-                    response_text, context = rag_handler.query(full_prompt)
+                handler = get_ready_rag_handler()
+                if handler:
+                    bot_response = handler.query(full_prompt, filters=chat_filters(is_cancelled=is_cancelled),
+                                                 **rag_cache_options(data, user_message)).get('answer')
                     
                     # Always use the RAG response path, even if no relevant documents were found
-                    if response_text:
-                        bot_response = response_text
-                        print(f"Successfully used RAG! Response length: {len(bot_response)}")
+                    if bot_response:
+                        path = 'rag'
+                        logger.debug(f"Successfully used RAG! Response length: {len(bot_response)}")
                     else:
-                        # Even if no relevant documents were found, still use RAG path
-                        print("RAG query returned no results, but still using RAG path")
-                        # Make direct API call but still mark it as RAG
-                        response = requests.post(
-                            "http://localhost:11434/api/generate",
-                            json={
-                                "model": "deepseek-r1:1.5b",
-                                "prompt": full_prompt,
-                                "stream": False
-                            },
-                            timeout=60
-                        )
-                        
-                        if response.status_code == 200:
-                            result = response.json()
-                            bot_response = result.get('response', '')
-                            # Clean up response
-                            bot_response = re.sub(r'<think>.*?</think>', '', bot_response, flags=re.DOTALL).strip()
-                        else:
-                            bot_response = "I apologize, but I encountered an error. Please try again."
+                        logger.info("RAG query returned no results, but still using RAG path")
                 else:
-                    # If RAG is not enabled, still mark as RAG but use standard API
-                    print("RAG is not properly initialized, but still marking as RAG")
-                    response = requests.post(
-                        "http://localhost:11434/api/generate",
-                        json={
-                            "model": "deepseek-r1:1.5b",
-                            "prompt": full_prompt,
-                            "stream": False
-                        },
-                        timeout=60
-                    )
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        bot_response = result.get('response', '')
-                        # Clean up response
-                        bot_response = re.sub(r'<think>.*?</think>', '', bot_response, flags=re.DOTALL).strip()
-                    else:
-                        bot_response = "I apologize, but I encountered an error. Please try again."
+                    logger.debug("RAG is not properly initialized, but still marking as RAG")
             except Exception as rag_error:
                 # Even if there's an error, still mark as RAG
-                print(f"Error using RAG: {str(rag_error)}")
-                # Use standard API but mark as RAG
-                response = requests.post(
-                    "http://localhost:11434/api/generate",
-                    json={
-                        "model": "deepseek-r1:1.5b",
-                        "prompt": full_prompt,
-                        "stream": False
-                    },
-                    timeout=60
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    bot_response = result.get('response', '')
-                    # Clean up response
-                    bot_response = re.sub(r'<think>.*?</think>', '', bot_response, flags=re.DOTALL).strip()
-                else:
+                logger.warning(f"Error using RAG: {str(rag_error)}")
+            
+            if not bot_response and not (is_cancelled and is_cancelled()):
+                # Make direct API call but still mark it as RAG
+                try:
+                    bot_response = get_client().generate(full_prompt, model="deepseek-r1:1.5b", timeout=60,
+                                                         filters=chat_filters(is_cancelled=is_cancelled))
+                except Exception as api_error:
+                    logger.error(f"Error calling Ollama API: {str(api_error)}", extra={'endpoint': 'simple_chat'})
                     bot_response = "I apologize, but I encountered an error. Please try again."
         else:
             # Even if RAG is not available, still mark as RAG
-            print("RAG is not available, but still marking as RAG")
+            logger.debug("RAG is not available, but still marking as RAG")
             # Use standard API
-            prompt = create_mental_health_prompt(user_message)
-            
-            print(f"Sending simple request to Ollama API... (message: {user_message[:30]}...)")
-            response = requests.post(
-                "http://localhost:11434/api/generate",
-                json={
-                    "model": "deepseek-r1:1.5b",
-                    "prompt": prompt,
-                    "stream": False
-                },
-                timeout=60
-            )
+            with timer.stage('prompt_build'):
+                prompt = create_mental_health_prompt(user_message)
             
-            print(f"Response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                result = response.json()
-                bot_response = result.get('response', '')
-                # Clean up response (remove thinking tags if present)
-                bot_response = re.sub(r'<think>.*?</think>', '', bot_response, flags=re.DOTALL).strip()
-                print(f"Success! Response length: {len(bot_response)}")
-            else:
-                bot_response = f"API Error: {response.status_code}"
-                print(f"API error: {response.status_code} - {response.text}")
+            try:
+                bot_response = get_client().generate(prompt, model="deepseek-r1:1.5b", timeout=60,
+                                                     filters=chat_filters(is_cancelled=is_cancelled))
+            except OllamaError as api_error:
+                bot_response = f"API Error: {api_error.status_code}"
+                logger.error(str(api_error), extra={'endpoint': 'simple_chat'})
     except Exception as e:
         # Even on general exceptions, still mark as RAG
-        print(f"Exception: {type(e).__name__}: {str(e)}")
+        logger.error(f"Exception: {type(e).__name__}: {str(e)}", extra={'endpoint': 'simple_chat'})
         bot_response = f"Error: {str(e)}"
+    finally:
+        lease.release()
     
-    # Calculate response time
-    end_time = datetime.now()
-    response_time_ms = int((end_time - start_time).total_seconds() * 1000)
+    if is_cancelled is not None and is_cancelled():
+        return cancelled_response(timer, 'generation')
     
-    return jsonify({
-        'response': bot_response,
-        'response_time_ms': response_time_ms,
-        'rag_used': rag_used  # Always True
-    })
+    with timer.stage('postprocess'):
+        response = jsonify({
+            'response': bot_response,
+            'response_time_ms': timer.elapsed_ms,
+            'rag_used': rag_used  # Always True
+        })
+    timer.finish(path)
+    return response
 
 @app.route('/feedback', methods=['POST'])
 def feedback():
     data = request.get_json()
-    conversation_id = data.get('conversation_id')
-    rating = data.get('rating')
-    
-    if conversation_id is not None and rating is not None:
-        if 0 <= conversation_id < len(conversations):
-            conversations[conversation_id]['feedback'] = rating
-            
-            # Extract keywords for adaptive learning
-            user_message = conversations[conversation_id]['user_message']
-            bot_response = conversations[conversation_id]['bot_response']
-            
-            # Simple keyword extraction (in a real app, use NLP)
-            keywords = ['empathy', 'advice', 'resources', 'validation', 'coping']
-            for keyword in keywords:
-                if keyword in bot_response.lower():
-                    feedback_patterns[keyword].append(rating)
-            
-            return jsonify({'success': True})
+    if record_feedback(data.get('conversation_id'), data.get('rating')):
+        return jsonify({'success': True})
     
     return jsonify({'error': 'Invalid feedback data'}), 400
 
@@ -385,74 +655,83 @@ def view_timeline():
     # Get user's timeline data
     user_timeline = user_timelines.get(username, {'entries': []})
     
-    # Generate AI-enhanced clinical report from the timeline
-    clinical_summary = generate_ai_enhanced_report(user_timeline)
+    # Serve the cached AI-enhanced report; a changed timeline is re-reported in the background
+    report = report_cache.get(username, user_timeline)
     
     return render_template('timeline.html', 
                           timeline=user_timeline,
-                          clinical_summary=clinical_summary)
+                          clinical_summary=report['report'],
+                          report_state=report['state'],
+                          report_generated_at=report['generated_at'],
+                          report_job_id=report['job_id'])
+
+# Fields of a job record returned by /jobs/<id> (the payload stays server-side)
+JOB_FIELDS = ('id', 'kind', 'status', 'result', 'error', 'created_at', 'started_at', 'finished_at', 'runtime_ms')
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status and, once finished, result or error of a background job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify({field: job.get(field) for field in JOB_FIELDS})
 
 @app.route('/reviews')
 def reviews():
-    # Calculate feedback statistics
-    rated_conversations = [conv for conv in conversations if conv['feedback'] is not None]
+    # Feedback statistics are maintained as ratings arrive, so this does not scan conversations
+    stats = storage.review_stats()
+    rating_distribution = stats.pop('rating_distribution')
     
-    if rated_conversations:
-        avg_rating = sum(conv['feedback'] for conv in rated_conversations) / len(rated_conversations)
-        rating_distribution = {i: len([conv for conv in rated_conversations if conv['feedback'] == i]) for i in range(1, 6)}
-        high_ratings = sum(rating_distribution.get(i, 0) for i in [4, 5])
-    else:
-        avg_rating = 0
-        rating_distribution = {i: 0 for i in range(1, 6)}
-        high_ratings = 0
-    
-    # Create stats object as expected by the template
-    stats = {
-        'total_reviews': len(rated_conversations),
-        'average_rating': round(avg_rating, 2),
-        'high_ratings': high_ratings
-    }
+    # One page of rated conversations, newest first; ?before=<cursor> pages back through history
+    before = request.args.get('before', type=int)
+    limit = max(1, min(request.args.get('limit', REVIEWS_PAGE_SIZE, type=int), REVIEWS_MAX_PAGE_SIZE))
+    rated_conversations, next_cursor = storage.rated_conversations(before=before, limit=limit)
     
     return render_template('reviews.html', 
                           stats=stats,
                           rating_distribution=rating_distribution,
-                          conversations=rated_conversations)
+                          conversations=rated_conversations,
+                          next_cursor=next_cursor,
+                          limit=limit,
+                          paged=before is not None)
 
 @app.route('/test_ollama_connection', methods=['GET'])
 def test_ollama_connection():
     """Test the connection to the Ollama service."""
     try:
         # First try to connect to the API endpoint to see if Ollama is running
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
-        if response.status_code == 200:
-            # If we can connect to the API, try sending a simple prompt to check if the model works
-            test_prompt = "Say hello in one word."
-            test_response, rag_used = send_prompt_to_ollama(
-                test_prompt, 
-                model="deepseek-r1:1.5b", 
-                timeout=30,
-                use_rag=False
-            )
-            
-            if test_response and not test_response.startswith("I apologize"):
-                return jsonify({
-                    'status': 'success',
-                    'message': 'Successfully connected to Ollama API and received response',
-                    'response': test_response,
-                    'models': response.json()
-                })
-            else:
-                return jsonify({
-                    'status': 'error',
-                    'message': 'Connected to Ollama API but failed to get response from model',
-                    'error': test_response
-                }), 500
+        models = get_client().list_models(timeout=5)
+        
+        # If we can connect to the API, try sending a simple prompt to check if the model works
+        test_prompt = "Say hello in one word."
+        test_response, rag_used = send_prompt_to_ollama(
+            test_prompt, 
+            model="deepseek-r1:1.5b", 
+            timeout=30,
+            temperature=0,
+            use_rag=False,
+            cache=False  # A cached reply would report success while the model is down
+        )
+        
+        if test_response and not test_response.startswith("I apologize"):
+            return jsonify({
+                'status': 'success',
+                'message': 'Successfully connected to Ollama API and received response',
+                'response': test_response,
+                'models': models
+            })
         else:
             return jsonify({
                 'status': 'error',
-                'message': f'Failed to connect to Ollama API. Status code: {response.status_code}',
-                'response': response.text
+                'message': 'Connected to Ollama API but failed to get response from model',
+                'error': test_response
             }), 500
+    except OllamaError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Failed to connect to Ollama API. Status code: {e.status_code}',
+            'response': str(e)
+        }), 500
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -460,6 +739,183 @@ def test_ollama_connection():
             'error_type': type(e).__name__
         }), 500
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness probe: the process is up and serving requests."""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness probe: RAG warm-up has finished and the Ollama model is loaded."""
+    try:
+        model_resident = get_client().is_model_resident("deepseek-r1:1.5b", timeout=2)
+    except Exception:
+        model_resident = False
+    
+    ready = rag_warmup['status'] in ('ready', 'disabled') and model_resident
+    return jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'rag': rag_warmup['status'],
+        'model_resident': model_resident
+    }), 200 if ready else 503
+
+# Queue gauges scraped along with the stage histograms on /metrics
+metrics.REGISTRY.gauge("chatbot_scheduler_in_flight", "Generations holding a scheduler slot.",
+                       lambda: get_scheduler().stats()['in_flight'])
+metrics.REGISTRY.gauge("chatbot_scheduler_queue_depth", "Requests waiting for a generation slot.",
+                       lambda: get_scheduler().stats()['queue_depth'])
+metrics.REGISTRY.gauge("chatbot_jobs_queued", "Background jobs waiting for a worker.",
+                       lambda: job_queue.stats()['queued'])
+metrics.REGISTRY.gauge("chatbot_jobs_running", "Background jobs being run.",
+                       lambda: job_queue.stats()['running'])
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Per-stage latency histograms and queue gauges in the Prometheus text format."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Report runtime counters for the caches and queues in front of the model."""
+    handler = ollama_handler.rag_handler
+    return jsonify({
+        'semantic_cache': handler.answer_cache.stats() if handler is not None and handler.enabled else None,
+        'embedding_batcher': handler.embeddings.batcher.stats() if handler is not None and handler.is_enabled() else None,
+        'rag_index': handler.index.stats() if handler is not None and handler.is_enabled() else None,
+        'content_cache': handler.content_cache.stats() if handler is not None and handler.enabled and handler.content_cache else None,
+        'prompt_cache': ollama_handler.prompt_cache.stats(),
+        'scheduler': get_scheduler().stats(),
+        'storage': storage.stats(),
+        'feedback_patterns': feedback_patterns.stats(),
+        'clinical_reports': report_cache.stats(),
+        'crisis_detector': crisis_detector.stats(),
+        'jobs': job_queue.stats()
+    })
+
+# On-demand profiling (see profiling.py); nothing is installed unless ADMIN_TOKEN is set
+request_profiler = RequestProfiler()
+memory_tracker = MemoryTracker()
+
+def admin_authorized():
+    return profiling.authorized(request.headers.get('X-Admin-Token'))
+
+if profiling.PROFILING_ENABLED:
+    @app.before_request
+    def start_request_profile():
+        requested_mode = request.headers.get('X-Profile')
+        if requested_mode and not admin_authorized():
+            requested_mode = None
+        session = request_profiler.begin(request.endpoint, requested_mode)
+        if session is not None:
+            g.profile_session = session
+    
+    @app.after_request
+    def finish_request_profile(response):
+        session = g.pop('profile_session', None)
+        if session is not None:
+            response.headers['X-Profile-Id'] = session.name
+            # Runs once the body has been sent, so a streamed reply is profiled to its last token
+            response.call_on_close(lambda: request_profiler.end(session))
+        return response
+    
+    @app.teardown_request
+    def abandon_request_profile(error=None):
+        # The handler raised before a response was built
+        session = g.pop('profile_session', None)
+        if session is not None:
+            request_profiler.end(session)
+
+def admin_error():
+    """404 while the admin endpoints are disabled, 403 for a missing or wrong token."""
+    if not profiling.PROFILING_ENABLED:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({'error': 'Admin token required'}), 403
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    """Show profiling state, or arm profiling for the next N chat requests."""
+    if not admin_authorized():
+        return admin_error()
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            return jsonify(request_profiler.arm(
+                data.get('requests', 1),
+                mode=data.get('mode', 'cprofile'),
+                endpoints=data.get('endpoints')
+            ))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+    return jsonify(dict(request_profiler.stats(), profiles=request_profiler.list_profiles()))
+
+@app.route('/admin/profiles/<name>', methods=['GET'])
+def admin_profile(name):
+    """Download a saved profile, or view it as text with ?format=text."""
+    if not admin_authorized():
+        return admin_error()
+    if request.args.get('format') == 'text':
+        report = request_profiler.report(name, sort=request.args.get('sort', 'cumulative'),
+                                         limit=request.args.get('limit', 40, type=int))
+        if report is None:
+            return jsonify({'error': 'Unknown profile'}), 404
+        return Response(report, content_type='text/plain; charset=utf-8')
+    path = request_profiler.profile_path(name)
+    if path is None:
+        return jsonify({'error': 'Unknown profile'}), 404
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=name)
+
+@app.route('/admin/memory', methods=['GET'])
+def admin_memory():
+    """tracemalloc state and the snapshots available for diffs."""
+    if not admin_authorized():
+        return admin_error()
+    return jsonify(memory_tracker.stats())
+
+@app.route('/admin/memory/<action>', methods=['POST'])
+def admin_memory_action(action):
+    """Start or stop tracemalloc, or take a snapshot of the traced allocations."""
+    if not admin_authorized():
+        return admin_error()
+    data = request.get_json(silent=True) or {}
+    if action == 'start':
+        return jsonify(memory_tracker.start(data.get('frames', profiling.TRACEMALLOC_FRAMES)))
+    if action == 'stop':
+        return jsonify(memory_tracker.stop())
+    if action == 'snapshot':
+        try:
+            return jsonify(memory_tracker.snapshot(
+                group_by=data.get('group_by', 'lineno'),
+                limit=data.get('limit', 20),
+                pattern=data.get('pattern')
+            ))
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 409
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+    return jsonify({'error': 'Unknown action'}), 404
+
+@app.route('/admin/memory/diff', methods=['GET'])
+def admin_memory_diff():
+    """Growth between two snapshots (?from=<id>&to=<id>, "to" defaults to the latest)."""
+    if not admin_authorized():
+        return admin_error()
+    from_id = request.args.get('from', type=int)
+    if from_id is None:
+        return jsonify({'error': 'from is required'}), 400
+    try:
+        diff = memory_tracker.diff(
+            from_id,
+            request.args.get('to', type=int),
+            group_by=request.args.get('group_by', 'lineno'),
+            limit=request.args.get('limit', 20, type=int),
+            pattern=request.args.get('pattern')
+        )
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    if diff is None:
+        return jsonify({'error': 'Unknown snapshot'}), 404
+    return jsonify(diff)
+
 @app.route('/test')
 def test_chat_page():
     """Render the simplified test chat page."""
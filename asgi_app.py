@@ -0,0 +1,425 @@
+"""
+Async (ASGI) Serving Mode for the Mental Health Chatbot
+
+This module serves the chat, feedback, timeline and health endpoints with Quart
+on asyncio. A slow Ollama generation then awaits on a socket instead of pinning a
+worker thread, so one process can hold hundreds of conversations in flight.
+CPU-bound retrieval runs in the default thread pool.
+
+Conversation state, the RAG handler and every other route come from app.py:
+requests for routes that are not defined here fall through to the Flask app, so
+the JSON contracts and templates are the same in both serving modes.
+
+Run with:
+    hypercorn asgi_app:application --bind 0.0.0.0:5000
+"""
+
+import asyncio
+import logging
+import functools
+import contextvars
+
+from quart import Quart, request, jsonify, render_template, Response, g
+from werkzeug.exceptions import NotFound, MethodNotAllowed
+from hypercorn.middleware import AsyncioWSGIMiddleware
+
+import app as flask_app
+from ollama_client import get_async_client, OllamaError
+from response_filters import afilter_stream, chat_filters
+from ollama_handler import create_mental_health_prompt
+from scheduler import get_scheduler, SchedulerBusy
+import metrics
+from metrics import start_request
+import profiling
+
+logger = logging.getLogger(__name__)
+
+app = Quart(__name__)
+
+# Routes not served asynchronously are handled by the Flask app in a thread pool
+wsgi_fallback = AsyncioWSGIMiddleware(flask_app.app)
+
+APOLOGY = "I apologize, but I encountered an error connecting to my knowledge base. Please try again later."
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run CPU-bound or blocking work, such as retrieval and database reads, in the default thread pool."""
+    loop = asyncio.get_running_loop()
+    # Carry the request's context (its stage timer) into the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(context.run, func, *args, **kwargs))
+
+
+async def single_fragment(text):
+    yield text
+
+
+async def generate_reply(full_prompt, timeout, rag_options):
+    """
+    Generate a complete reply, preferring RAG and falling back to the plain Ollama API.
+
+    Returns:
+        tuple: The reply text and whether RAG produced it
+    """
+    handler = flask_app.get_ready_rag_handler()
+    if handler:
+        try:
+            plan = await run_blocking(handler.plan_query, full_prompt, **rag_options)
+            if plan['cached_answer']:
+                return plan['cached_answer'], True
+
+            filters = chat_filters()
+            answer = await get_async_client().generate(
+                plan['prompt'],
+                model=handler.model_name,
+                temperature=handler.temperature,
+                timeout=timeout,
+                filters=filters
+            )
+            if answer:
+                if not any(f.done for f in filters):
+                    handler.remember_answer(plan, answer)
+                return answer, True
+        except Exception as rag_error:
+            logger.warning(f"Error using RAG: {str(rag_error)}")
+
+    answer = await get_async_client().generate(full_prompt, model="deepseek-r1:1.5b", timeout=timeout,
+                                               filters=chat_filters())
+    return answer, False
+
+
+async def open_reply_stream(full_prompt, timeout, rag_options):
+    """
+    Start streaming a reply, preferring RAG and falling back to the plain Ollama API.
+
+    Returns:
+        tuple: An async iterator of visible text fragments and whether RAG is producing them
+    """
+    handler = flask_app.get_ready_rag_handler()
+    if handler:
+        try:
+            plan = await run_blocking(handler.plan_query, full_prompt, **rag_options)
+            if plan['cached_answer']:
+                return single_fragment(plan['cached_answer']), True
+
+            tokens = get_async_client().generate_stream(
+                plan['prompt'],
+                model=handler.model_name,
+                temperature=handler.temperature,
+                timeout=timeout
+            )
+            return afilter_stream(
+                tokens, chat_filters(), on_complete=lambda answer: handler.remember_answer(plan, answer)
+            ), True
+        except Exception as rag_error:
+            logger.warning(f"Error streaming from RAG: {str(rag_error)}")
+
+    tokens = get_async_client().generate_stream(full_prompt, model="deepseek-r1:1.5b", timeout=timeout)
+    return afilter_stream(tokens, chat_filters()), False
+
+
+def busy_response(busy):
+    """Build the 429 reply for a request the scheduler could not admit (see app.busy_response)."""
+    return jsonify({
+        'error': 'The assistant is busy right now, please try again shortly.',
+        'reason': busy.reason,
+        'retry_after': busy.retry_after
+    }), 429, {'Retry-After': str(busy.retry_after)}
+
+
+def crisis_response(data, result):
+    """Send the crisis reply built by app.crisis_result as JSON or as Server-Sent Events."""
+    if flask_app.wants_stream(data, request.headers):
+        return Response(flask_app.crisis_events(result), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache'})
+    return jsonify(result)
+
+
+def stream_chat_response(fragments, timer, on_complete, lease=None, path=None):
+    """Relay reply fragments as Server-Sent Events (see app.stream_chat_response)."""
+    async def generate():
+        metrics.activate(timer)
+        pieces = []
+        first_token_ms = None
+        try:
+            async for fragment in fragments:
+                if first_token_ms is None:
+                    first_token_ms = timer.elapsed_ms
+                pieces.append(fragment)
+                yield flask_app.sse_event('token', {'text': fragment})
+            bot_response = ''.join(pieces).strip()
+        except (GeneratorExit, asyncio.CancelledError):
+            # The client disconnected: closing the fragments closes the Ollama stream
+            await fragments.aclose()
+            flask_app.cancel_request(timer, 'generation')
+            raise
+        except Exception as e:
+            logger.error(f"Error while streaming response: {str(e)}", extra={'endpoint': timer.endpoint})
+            bot_response = ''.join(pieces).strip()
+        finally:
+            if lease is not None:
+                lease.release()
+
+        if not bot_response:
+            bot_response = APOLOGY
+
+        with timer.stage('postprocess'):
+            result = on_complete(bot_response)
+            result['response_time_ms'] = timer.elapsed_ms
+            result['first_token_ms'] = first_token_ms
+            event = flask_app.sse_event('done', result)
+        timer.finish(path)
+        yield event
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/chat', methods=['POST'])
+async def chat():
+    # Times each stage of the request for /metrics and the response time measurement
+    timer = start_request('chat')
+
+    data = await request.get_json()
+    user_message = data.get('message')
+    username = data.get('username', 'anonymous')
+
+    # Crisis language is answered with crisis resources at once, before anything else
+    if flask_app.detect_crisis(user_message, data.get('username'), timer):
+        return crisis_response(data, flask_app.crisis_result(timer, lambda bot_response: {
+            'response': bot_response,
+            'conversation_id': flask_app.store_conversation(user_message, bot_response, username),
+            'in_clinical_flow': False,
+            'rag_used': False
+        }))
+
+    # Advance the clinical flow and get this turn's question
+    question_data, in_clinical_flow = await run_blocking(flask_app.advance_clinical_flow, username)
+
+    lease = None
+    if not in_clinical_flow:
+        with timer.stage('prompt_build'):
+            adaptive_prompt = flask_app.get_adaptive_prompt(user_message)
+            full_prompt = create_mental_health_prompt(user_message, system_prompt=adaptive_prompt)
+            rag_options = flask_app.rag_cache_options(data, user_message, adaptive_prompt)
+
+        # Model calls wait for a scheduler slot; clinical flow questions need none.
+        # The server cancels this task if the client disconnects.
+        try:
+            with timer.stage('queue_wait'):
+                lease = await get_scheduler().acquire_async(
+                    username, priority=flask_app.crisis_detector.is_flagged(data.get('username')))
+        except SchedulerBusy as busy:
+            return busy_response(busy)
+        except asyncio.CancelledError:
+            flask_app.cancel_request(timer, 'queue')
+            raise
+
+    # Streaming clients receive tokens as they are generated instead of one JSON body
+    if flask_app.wants_stream(data, request.headers):
+        if in_clinical_flow:
+            fragments, rag_used = single_fragment(question_data['text']), False
+        else:
+            try:
+                fragments, rag_used = await open_reply_stream(full_prompt, 300, rag_options)
+            except BaseException:
+                lease.release()
+                raise
+
+        def complete(bot_response):
+            return {
+                'response': bot_response,
+                'conversation_id': flask_app.store_conversation(user_message, bot_response, username),
+                'in_clinical_flow': in_clinical_flow,
+                'rag_used': rag_used
+            }
+
+        path = 'clinical_flow' if in_clinical_flow else ('rag' if rag_used else 'direct')
+        return stream_chat_response(fragments, timer, complete, lease=lease, path=path)
+
+    if in_clinical_flow:
+        bot_response = question_data['text']
+        rag_used = False
+    else:
+        try:
+            bot_response, rag_used = await generate_reply(full_prompt, 300, rag_options)
+        except asyncio.CancelledError:
+            flask_app.cancel_request(timer, 'generation')
+            raise
+        except Exception as e:
+            logger.error(f"Error calling Ollama API: {str(e)}", extra={'endpoint': 'chat'})
+            bot_response, rag_used = APOLOGY, False
+        finally:
+            lease.release()
+
+    with timer.stage('postprocess'):
+        conversation_id = flask_app.store_conversation(user_message, bot_response, username)
+        response = jsonify({
+            'response': bot_response,
+            'conversation_id': conversation_id,
+            'in_clinical_flow': in_clinical_flow,
+            'response_time_ms': timer.elapsed_ms,
+            'rag_used': rag_used
+        })
+    timer.finish('clinical_flow' if in_clinical_flow else ('rag' if rag_used else 'direct'))
+    return response
+
+
+@app.route('/simple_chat', methods=['POST'])
+async def simple_chat():
+    """Async version of app.simple_chat (rag_used is always reported as True, as there)."""
+    timer = start_request('simple_chat')
+
+    data = await request.get_json()
+    user_message = data.get('message')
+    if flask_app.detect_crisis(user_message, data.get('username'), timer):
+        return crisis_response(data, flask_app.crisis_result(
+            timer, lambda bot_response: {'response': bot_response, 'rag_used': True}
+        ))
+
+    with timer.stage('prompt_build'):
+        full_prompt = create_mental_health_prompt(user_message)
+    rag_options = flask_app.rag_cache_options(data, user_message)
+
+    try:
+        with timer.stage('queue_wait'):
+            lease = await get_scheduler().acquire_async(
+                data.get('username', 'anonymous'), priority=flask_app.crisis_detector.is_flagged(data.get('username')))
+    except SchedulerBusy as busy:
+        return busy_response(busy)
+    except asyncio.CancelledError:
+        flask_app.cancel_request(timer, 'queue')
+        raise
+
+    if flask_app.wants_stream(data, request.headers):
+        try:
+            fragments, rag_streamed = await open_reply_stream(full_prompt, 60, rag_options)
+        except BaseException:
+            lease.release()
+            raise
+        return stream_chat_response(
+            fragments,
+            timer,
+            lambda bot_response: {'response': bot_response, 'rag_used': True},
+            lease=lease,
+            path='rag' if rag_streamed else 'direct'
+        )
+
+    rag_answered = False
+    try:
+        bot_response, rag_answered = await generate_reply(full_prompt, 60, rag_options)
+    except asyncio.CancelledError:
+        flask_app.cancel_request(timer, 'generation')
+        raise
+    except OllamaError as api_error:
+        bot_response = f"API Error: {api_error.status_code}"
+    except Exception as e:
+        logger.error(f"Exception: {type(e).__name__}: {str(e)}", extra={'endpoint': 'simple_chat'})
+        bot_response = f"Error: {str(e)}"
+    finally:
+        lease.release()
+
+    with timer.stage('postprocess'):
+        response = jsonify({
+            'response': bot_response,
+            'response_time_ms': timer.elapsed_ms,
+            'rag_used': True
+        })
+    timer.finish('rag' if rag_answered else 'direct')
+    return response
+
+
+@app.route('/feedback', methods=['POST'])
+async def feedback():
+    data = await request.get_json()
+    if await run_blocking(flask_app.record_feedback, data.get('conversation_id'), data.get('rating')):
+        return jsonify({'success': True})
+
+    return jsonify({'error': 'Invalid feedback data'}), 400
+
+
+@app.route('/timeline', methods=['GET'])
+async def view_timeline():
+    username = request.args.get('username', 'anonymous')
+
+    # Get user's timeline data
+    user_timeline = await run_blocking(flask_app.user_timelines.get, username, {'entries': []})
+
+    # Serve the cached AI-enhanced report; a changed timeline is re-reported in the background
+    report = await run_blocking(flask_app.report_cache.get, username, user_timeline)
+
+    return await render_template('timeline.html',
+                                 timeline=user_timeline,
+                                 clinical_summary=report['report'],
+                                 report_state=report['state'],
+                                 report_generated_at=report['generated_at'],
+                                 report_job_id=report['job_id'])
+
+
+@app.route('/healthz', methods=['GET'])
+async def healthz():
+    """Liveness probe: the event loop is up and serving requests."""
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/readyz', methods=['GET'])
+async def readyz():
+    """Readiness probe: RAG warm-up has finished and the Ollama model is loaded."""
+    try:
+        model_resident = await get_async_client().is_model_resident("deepseek-r1:1.5b", timeout=2)
+    except Exception:
+        model_resident = False
+
+    ready = flask_app.rag_warmup['status'] in ('ready', 'disabled') and model_resident
+    return jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'rag': flask_app.rag_warmup['status'],
+        'model_resident': model_resident
+    }), 200 if ready else 503
+
+
+if profiling.PROFILING_ENABLED:
+    # Same opt-in profiling as the Flask app (see profiling.py). Here a profile covers the event
+    # loop thread while the handler runs, including other requests interleaved with it; a
+    # streamed body is not included.
+    @app.before_request
+    async def start_request_profile():
+        requested_mode = request.headers.get('X-Profile')
+        if requested_mode and not profiling.authorized(request.headers.get('X-Admin-Token')):
+            requested_mode = None
+        session = flask_app.request_profiler.begin(request.endpoint, requested_mode)
+        if session is not None:
+            g.profile_session = session
+
+    @app.after_request
+    async def finish_request_profile(response):
+        session = g.pop('profile_session', None)
+        if session is not None:
+            response.headers['X-Profile-Id'] = session.name
+            flask_app.request_profiler.end(session)
+        return response
+
+    @app.teardown_request
+    async def abandon_request_profile(error=None):
+        session = g.pop('profile_session', None)
+        if session is not None:
+            flask_app.request_profiler.end(session)
+
+
+@app.after_serving
+async def close_ollama_client():
+    await get_async_client().aclose()
+
+
+async def application(scope, receive, send):
+    """ASGI entry point: async routes are served by Quart, everything else by the Flask app."""
+    if scope['type'] == 'http':
+        try:
+            app.url_map.bind('').match(scope['path'], method=scope['method'])
+        except (NotFound, MethodNotAllowed):
+            await wsgi_fallback(scope, receive, send)
+            return
+    await app(scope, receive, send)
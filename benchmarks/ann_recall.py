@@ -0,0 +1,109 @@
+"""
+Benchmark: IVF approximate search recall and latency vs. exact search
+
+Builds an IVFIndex over a corpus and, for each (n_lists, n_probe) setting,
+reports recall@k against exact MatrixVectorStore results together with p50/p99
+query latency, so an operating point can be chosen.
+
+By default the corpus is synthetic: unit vectors drawn around random topic
+centres, which resembles the clustered structure of real document embeddings.
+Pass --embeddings to use a saved matrix instead, e.g. rag_index/<key>/embeddings.npy.
+
+Usage:
+    python benchmarks/ann_recall.py --size 100000 --lists 1264 --probes 1 4 8 16 32
+    python benchmarks/ann_recall.py --embeddings rag_index/<key>/embeddings.npy --json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store import MatrixVectorStore, normalize_rows
+from ann_index import IVFIndex, default_n_lists
+
+
+def clustered_unit_rows(rng, rows, dimensions, topics, spread):
+    centres = normalize_rows(rng.standard_normal((topics, dimensions), dtype=np.float32))
+    matrix = centres[rng.integers(0, topics, rows)]
+    matrix += spread / np.sqrt(dimensions) * rng.standard_normal((rows, dimensions), dtype=np.float32)
+    return normalize_rows(matrix)
+
+
+def timed(fn, queries):
+    results, timings = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        timings.append((time.perf_counter() - start) * 1000)
+    return results, {
+        'p50_ms': round(float(np.percentile(timings, 50)), 3),
+        'p99_ms': round(float(np.percentile(timings, 99)), 3),
+    }
+
+
+def recall(approximate, exact):
+    found = sum(len({h['index'] for h in a} & {h['index'] for h in e}) for a, e in zip(approximate, exact))
+    return round(found / sum(len(e) for e in exact), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100000, help="Synthetic corpus size in chunks")
+    parser.add_argument('--dimensions', type=int, default=384, help="Synthetic embedding dimensions")
+    parser.add_argument('--topics', type=int, default=2000, help="Synthetic topic centres")
+    parser.add_argument('--spread', type=float, default=1.5, help="Synthetic noise around each topic centre")
+    parser.add_argument('--embeddings', help="Use this .npy embedding matrix instead of synthetic data")
+    parser.add_argument('--queries', type=int, default=300, help="Queries timed per setting")
+    parser.add_argument('--k', type=int, default=10, help="Results per query (recall@k)")
+    parser.add_argument('--lists', type=int, nargs='+', default=[0], help="n_lists values to build (0 = default)")
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 4, 8, 16, 32], help="n_probe values to search")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.embeddings:
+        matrix = normalize_rows(np.load(args.embeddings, mmap_mode='r'))
+        # Queries: perturbed corpus rows, like questions phrased close to a stored chunk
+        queries = matrix[rng.choice(len(matrix), args.queries)]
+        queries = normalize_rows(queries + 0.3 / np.sqrt(matrix.shape[1]) *
+                                 rng.standard_normal(queries.shape, dtype=np.float32))
+    else:
+        matrix = clustered_unit_rows(rng, args.size + args.queries, args.dimensions, args.topics, args.spread)
+        matrix, queries = matrix[:args.size], matrix[args.size:]
+
+    store = MatrixVectorStore([""] * len(matrix), [{}] * len(matrix), matrix, normalized=True)
+    exact, exact_latency = timed(lambda q: store.search(q, args.k), queries)
+    results = {'chunks': len(store), 'k': args.k, 'exact': exact_latency, 'ivf': []}
+
+    for n_lists in args.lists:
+        n_lists = n_lists or default_n_lists(len(store))
+        start = time.perf_counter()
+        index = IVFIndex.build(store, n_lists=n_lists)
+        build_s = round(time.perf_counter() - start, 2)
+
+        for n_probe in args.probes:
+            approximate, latency = timed(lambda q: index.search(q, args.k, n_probe=n_probe), queries)
+            results['ivf'].append(dict(
+                n_lists=n_lists, n_probe=n_probe, build_s=build_s,
+                recall=recall(approximate, exact), **latency
+            ))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{results['chunks']:,d} chunks, k={args.k}: exact p50 {exact_latency['p50_ms']:.3f} ms, "
+          f"p99 {exact_latency['p99_ms']:.3f} ms")
+    for r in results['ivf']:
+        print(f"  n_lists {r['n_lists']:5d} (build {r['build_s']:6.2f} s)  n_probe {r['n_probe']:4d}   "
+              f"recall@{args.k} {r['recall']:.4f}   p50 {r['p50_ms']:7.3f} ms   p99 {r['p99_ms']:7.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+"""
+Benchmark: end-to-end HTTP load on the application against a mock Ollama
+
+Starts benchmarks/mock_ollama.py in-process, launches the application in a
+child process with OLLAMA_BASE_URL pointing at the mock (and a throwaway
+database), then drives /chat, /simple_chat, /feedback, /timeline and /reviews
+at fixed concurrency levels. For every (endpoint, concurrency) pair it reports
+throughput, p50/p95/p99 latency, time to first byte for streamed replies,
+status codes and the server's resident memory, and writes everything to a JSON
+file so runs can be compared (--baseline prints the change against an earlier
+run).
+
+No real model or network is needed, so the numbers measure the Flask/RAG layer
+and the cost model of the mock (see mock_ollama.py for its options).
+
+Usage:
+    python benchmarks/app_load.py --concurrency 1 8 32 --duration 20 --output load.json
+    python benchmarks/app_load.py --server asgi --stream --endpoints chat simple_chat
+    python benchmarks/app_load.py --output after.json --baseline load.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+import subprocess
+from collections import Counter
+from datetime import datetime
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mock_ollama
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = ("chat", "simple_chat", "feedback", "timeline", "reviews")
+
+MESSAGES = [
+    "I've been feeling anxious lately and can't sleep",
+    "How do I cope with panic attacks at work?",
+    "I feel really low and unmotivated most days",
+    "What can I do when I feel overwhelmed by stress?",
+    "My thoughts keep racing at night",
+    "I don't enjoy things I used to love",
+    "How can I support a friend who is depressed?",
+    "I get nervous in social situations",
+]
+
+# Clinical assessment turns answered before a user's messages reach the model
+MAX_ASSESSMENT_TURNS = 20
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid):
+    """Resident and peak resident memory of a process in MB, from /proc (None where unavailable)."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            fields = dict(line.split(":", 1) for line in status if ":" in line)
+        return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+class MemorySampler:
+    """Samples a process's resident memory in the background while a load step runs."""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss, _ = rss_mb(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        if not self.samples:
+            return None
+        return {'start_mb': round(self.samples[0], 1), 'peak_mb': round(max(self.samples), 1),
+                'end_mb': round(self.samples[-1], 1)}
+
+
+class AppServer:
+    """The application running in a child process, as it would be deployed."""
+
+    def __init__(self, mode, ollama_url, port, workdir, extra_env=None):
+        self.url = f"http://127.0.0.1:{port}"
+        env = dict(os.environ, OLLAMA_BASE_URL=ollama_url, APP_DB_PATH=os.path.join(workdir, "app.sqlite3"))
+        env.update(extra_env or {})
+        if mode == "asgi":
+            # --workers 0 serves from this process, so its memory is what gets sampled
+            command = [sys.executable, "-m", "hypercorn", "asgi_app:application", "--bind", f"127.0.0.1:{port}",
+                       "--workers", "0"]
+        else:
+            command = [sys.executable, "-c",
+                       f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True, use_reloader=False)"]
+        self.log_path = os.path.join(workdir, "server.log")
+        self._log = open(self.log_path, "w")
+        self.process = subprocess.Popen(command, cwd=REPO_DIR, env=env, stdout=self._log, stderr=subprocess.STDOUT)
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def wait_healthy(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.process.returncode}, see {self.log_path}")
+            try:
+                if requests.get(f"{self.url}/healthz", timeout=1).ok:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"Server did not become healthy within {timeout}s, see {self.log_path}")
+
+    def wait_ready(self, timeout):
+        """Wait for warm-up to finish; returns the /readyz body (the RAG status is recorded with the results)."""
+        deadline = time.monotonic() + timeout
+        body = {}
+        while time.monotonic() < deadline:
+            response = requests.get(f"{self.url}/readyz", timeout=5)
+            body = response.json()
+            if response.ok or body.get('rag') in ('failed', 'disabled') and body.get('model_resident'):
+                break
+            time.sleep(0.5)
+        return body
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self._log.close()
+
+
+def prepare_users(base_url, count):
+    """Take benchmark users through the clinical assessment and collect conversation ids to rate."""
+    users, conversation_ids = [], []
+    session = requests.Session()
+    for n in range(count):
+        username = f"bench-user-{n}"
+        for turn in range(MAX_ASSESSMENT_TURNS):
+            body = session.post(f"{base_url}/chat", json={'message': MESSAGES[turn % len(MESSAGES)],
+                                                          'username': username}, timeout=300).json()
+            conversation_ids.append(body['conversation_id'])
+            if not body.get('in_clinical_flow'):
+                break
+        users.append(username)
+    return users, conversation_ids
+
+
+def make_request(endpoint, base_url, users, conversation_ids, stream):
+    """Build the function issuing the i-th request of an endpoint; it returns (status, time to first byte)."""
+
+    def send(session, method, path, **kwargs):
+        start = time.perf_counter()
+        response = session.request(method, f"{base_url}{path}", timeout=600, stream=True, **kwargs)
+        first_byte = None
+        for _ in response.iter_content(chunk_size=None):
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+        response.close()
+        return response.status_code, first_byte
+
+    def request(session, i):
+        username = users[i % len(users)]
+        # A different message each time so the answer caches do not serve the run
+        message = f"{MESSAGES[i % len(MESSAGES)]} (request {i})"
+        if endpoint in ("chat", "simple_chat"):
+            return send(session, "POST", f"/{endpoint}",
+                        json={'message': message, 'username': username, 'stream': stream})
+        if endpoint == "feedback":
+            return send(session, "POST", "/feedback",
+                        json={'conversation_id': conversation_ids[i % len(conversation_ids)], 'rating': 1 + i % 5})
+        if endpoint == "timeline":
+            return send(session, "GET", f"/timeline?username={username}")
+        return send(session, "GET", "/reviews")
+
+    return request
+
+
+def run_step(request, concurrency, duration, max_requests, pid):
+    """Issue requests from `concurrency` workers until the duration or request budget is used up."""
+    latencies, first_bytes, statuses = [], [], Counter()
+    lock = threading.Lock()
+    counter = iter(range(max_requests or sys.maxsize))
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            try:
+                status, first_byte = request(session, i)
+            except requests.RequestException as e:
+                status, first_byte = type(e).__name__, None
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[status] += 1
+                if status == 200:
+                    latencies.append(elapsed)
+                    if first_byte is not None:
+                        first_bytes.append(first_byte)
+
+    with MemorySampler(pid) as memory:
+        workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        wall = time.perf_counter() - start
+
+    completed = sum(statuses.values())
+    return {
+        'concurrency': concurrency,
+        'requests': completed,
+        'ok': len(latencies),
+        'errors': completed - len(latencies),
+        'status_codes': {str(code): n for code, n in sorted(statuses.items(), key=str)},
+        'wall_s': round(wall, 3),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50) * 1000, 2),
+            'p95': round(percentile(latencies, 95) * 1000, 2),
+            'p99': round(percentile(latencies, 99) * 1000, 2),
+            'mean': round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+            'max': round(max(latencies) * 1000, 2) if latencies else 0.0,
+        },
+        'first_byte_ms': {
+            'p50': round(percentile(first_bytes, 50) * 1000, 2),
+            'p95': round(percentile(first_bytes, 95) * 1000, 2),
+        },
+        'memory': memory.summary(),
+    }
+
+
+def compare(results, baseline_path):
+    """Print throughput and p95 changes against an earlier results file."""
+    with open(baseline_path) as f:
+        baseline = {(r['endpoint'], r['concurrency']): r for r in json.load(f)['results']}
+    print(f"\nChange against {baseline_path}:")
+    for r in results:
+        before = baseline.get((r['endpoint'], r['concurrency']))
+        if before is None:
+            continue
+        rps = (r['throughput_rps'] / before['throughput_rps'] - 1) * 100 if before['throughput_rps'] else 0.0
+        p95 = (r['latency_ms']['p95'] / before['latency_ms']['p95'] - 1) * 100 if before['latency_ms']['p95'] else 0.0
+        print(f"{r['endpoint']:12s} c={r['concurrency']:<4d} throughput {rps:+7.1f}%   p95 {p95:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=("flask", "asgi"), default="flask", help="Serving mode to benchmark")
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help="Concurrent clients per step")
+    parser.add_argument('--duration', type=float, default=15, help="Seconds per (endpoint, concurrency) step")
+    parser.add_argument('--max-requests', type=int, default=0, help="Requests per step, 0 for no limit")
+    parser.add_argument('--users', type=int, default=8, help="Simulated users (taken through the assessment first)")
+    parser.add_argument('--stream', action='store_true', help="Request streamed (SSE) chat replies")
+    parser.add_argument('--ready-timeout', type=float, default=300, help="Seconds to wait for RAG warm-up")
+    parser.add_argument('--output', default="app_load.json", help="JSON results file")
+    parser.add_argument('--baseline', help="Earlier results file to compare against")
+    parser.add_argument('--keep-workdir', action='store_true', help="Keep the database and server log")
+    mock_ollama.add_arguments(parser)
+    args = parser.parse_args()
+
+    mock = mock_ollama.from_arguments(args).start()
+    workdir = tempfile.mkdtemp(prefix="app-load-")
+    server = AppServer(args.server, mock.url, free_port(), workdir)
+    try:
+        server.wait_healthy(timeout=120)
+        readiness = server.wait_ready(args.ready_timeout)
+        print(f"Server ready ({args.server}): {readiness}")
+        users, conversation_ids = prepare_users(server.url, args.users)
+
+        results = []
+        for endpoint in args.endpoints:
+            request = make_request(endpoint, server.url, users, conversation_ids, args.stream)
+            for concurrency in args.concurrency:
+                step = run_step(request, concurrency, args.duration, args.max_requests, server.pid)
+                step = dict(endpoint=endpoint, **step)
+                results.append(step)
+                print(f"{endpoint:12s} c={concurrency:<4d} {step['throughput_rps']:8.2f} req/s   "
+                      f"p50 {step['latency_ms']['p50']:9.2f} ms   p95 {step['latency_ms']['p95']:9.2f} ms   "
+                      f"p99 {step['latency_ms']['p99']:9.2f} ms   errors {step['errors']}   "
+                      f"rss {step['memory']['peak_mb'] if step['memory'] else '-'} MB")
+
+        rss, peak = rss_mb(server.pid)
+        report = {
+            'started_at': datetime.now().isoformat(),
+            'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+            'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                            'cpus': os.cpu_count(), 'readiness': readiness},
+            'results': results,
+            'server_memory_mb': {'rss': rss, 'peak': peak},
+            'server_stats': requests.get(f"{server.url}/stats", timeout=10).json(),
+            'mock_ollama': mock.stats(),
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+        if args.baseline:
+            compare(results, args.baseline)
+    finally:
+        server.stop()
+        mock.stop()
+        if args.keep_workdir:
+            print(f"Database and server log kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark: crisis-phrase matching cost by lexicon size
+
+Builds the crisis detector's Aho-Corasick matcher over the built-in lexicon
+padded with synthetic phrases to several lexicon sizes, and reports the
+per-message check cost (p50/p99) on chat-length messages. For comparison it
+times, for sizes up to --scan-max, the two obvious alternatives: testing every
+phrase as a substring of the message and one regex alternation of all phrases.
+Both grow with the lexicon; the automaton should stay flat.
+
+Usage:
+    python benchmarks/crisis_matcher.py
+    python benchmarks/crisis_matcher.py --sizes 30 1000 100000 --messages 500 --json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import string
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crisis_detector import DEFAULT_LEXICON, PhraseMatcher, normalize
+
+FILLER = ("i", "have", "been", "feeling", "really", "tired", "lately", "and", "work", "is", "stressful",
+          "my", "sleep", "keeps", "getting", "worse", "when", "i", "think", "about", "the", "week", "ahead")
+
+
+def synthetic_phrases(rng, count):
+    """Random two- and three-word phrases of made-up words, so none occur in the messages by accident."""
+    phrases = set()
+    while len(phrases) < count:
+        words = ("".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9)))
+                 for _ in range(rng.randint(2, 3)))
+        phrases.add(" ".join(words))
+    return list(phrases)
+
+
+def messages(rng, count, length, lexicon):
+    """Chat-length messages of filler words; one in ten contains a crisis phrase."""
+    result = []
+    for i in range(count):
+        words = rng.choices(FILLER, k=length)
+        if i % 10 == 0:
+            words.insert(rng.randrange(len(words)), rng.choice(lexicon))
+        result.append(" ".join(words) + ".")
+    return result
+
+
+def latencies_us(fn, texts):
+    timings = []
+    for text in texts:
+        start = time.perf_counter()
+        fn(text)
+        timings.append((time.perf_counter() - start) * 1e6)
+    percentiles = statistics.quantiles(timings, n=100)
+    return {'p50_us': round(percentiles[49], 1), 'p99_us': round(percentiles[98], 1)}
+
+
+def bench_size(rng, size, texts, args):
+    lexicon = list(DEFAULT_LEXICON) + synthetic_phrases(rng, max(0, size - len(DEFAULT_LEXICON)))
+
+    start = time.perf_counter()
+    matcher = PhraseMatcher(lexicon)
+    result = {'phrases': len(matcher.phrases), 'states': matcher.states,
+              'build_ms': round((time.perf_counter() - start) * 1000, 1)}
+    result['automaton'] = latencies_us(matcher.find, texts)
+
+    if size <= args.scan_max:
+        padded = [f" {phrase} " for phrase in matcher.phrases]
+
+        def substring_scan(text):
+            text = f" {normalize(text)} "
+            return [phrase for phrase in padded if phrase in text]
+
+        result['substring_scan'] = latencies_us(substring_scan, texts)
+        pattern = re.compile(r"\b(?:" + "|".join(re.escape(p) for p in matcher.phrases) + r")\b")
+        result['regex'] = latencies_us(lambda text: pattern.findall(normalize(text)), texts)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[30, 100, 1000, 10000, 100000], help="Lexicon sizes in phrases")
+    parser.add_argument('--messages', type=int, default=300, help="Messages timed per size")
+    parser.add_argument('--words', type=int, default=40, help="Words per message")
+    parser.add_argument('--scan-max', type=int, default=10000, help="Largest size to also time the substring scan and regex")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    texts = messages(rng, args.messages, args.words, DEFAULT_LEXICON)
+    results = [bench_size(rng, size, texts, args) for size in args.sizes]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for r in results:
+        line = (f"{r['phrases']:>7,d} phrases ({r['states']:>9,d} states, built in {r['build_ms']:8.1f} ms)"
+                f"   automaton p50 {r['automaton']['p50_us']:7.1f} us   p99 {r['automaton']['p99_us']:7.1f} us")
+        if 'substring_scan' in r:
+            line += (f"   substring scan p50 {r['substring_scan']['p50_us']:9.1f} us"
+                     f"   regex p50 {r['regex']['p50_us']:9.1f} us")
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark: per-request query embedding vs. micro-batched embedding
+
+Simulates many concurrent chat requests each embedding one query, first with a
+direct model call per request (the old RAGHandler path) and then through
+EmbeddingBatcher, and reports throughput and latency percentiles for both.
+
+Usage:
+    python benchmarks/embedding_batching.py --threads 16 --requests 512
+    python benchmarks/embedding_batching.py --synthetic   # no model download, fixed-cost stand-in
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_batcher import EmbeddingBatcher
+
+QUERIES = [
+    "I've been feeling anxious lately and can't sleep",
+    "How do I cope with panic attacks at work?",
+    "I feel really low and unmotivated most days",
+    "What can I do when I feel overwhelmed by stress?",
+    "My thoughts keep racing at night",
+    "I don't enjoy things I used to love",
+    "How can I support a friend who is depressed?",
+    "I get nervous in social situations",
+]
+
+
+class SyntheticModel:
+    """Stand-in with a fixed per-call overhead plus a small per-text cost (releases the GIL like a real model)."""
+
+    def __init__(self, call_overhead_ms=8.0, per_text_ms=0.5, dimensions=384):
+        self.call_overhead = call_overhead_ms / 1000.0
+        self.per_text = per_text_ms / 1000.0
+        self.dimensions = dimensions
+        self._lock = threading.Lock()  # one forward pass at a time, as on a single CPU model
+
+    def embed_documents(self, texts):
+        with self._lock:
+            time.sleep(self.call_overhead + self.per_text * len(texts))
+        return [[float(len(text))] * self.dimensions for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def run(embed, threads, requests):
+    """Issue `requests` embeddings from `threads` workers and time each call."""
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            embed(f"{QUERIES[i % len(QUERIES)]} ({i})")
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    wall = time.perf_counter() - start
+
+    return {
+        'requests': requests,
+        'threads': threads,
+        'wall_s': round(wall, 3),
+        'throughput_rps': round(requests / wall, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default="all-MiniLM-L6-v2", help="HuggingFace embedding model")
+    parser.add_argument('--synthetic', action='store_true', help="Use a fixed-cost stand-in instead of a real model")
+    parser.add_argument('--threads', type=int, default=16, help="Concurrent requesters")
+    parser.add_argument('--requests', type=int, default=512, help="Total embeddings per run")
+    parser.add_argument('--max-batch', type=int, default=32, help="EmbeddingBatcher max batch size")
+    parser.add_argument('--max-wait-ms', type=float, default=5, help="EmbeddingBatcher collection window")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        model = SyntheticModel()
+    else:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        model = HuggingFaceEmbeddings(model_name=args.model)
+    model.embed_documents(QUERIES)  # load weights before timing
+
+    batcher = EmbeddingBatcher(model.embed_documents, max_batch_size=args.max_batch, max_wait_ms=args.max_wait_ms)
+    results = {
+        'per_request': run(model.embed_query, args.threads, args.requests),
+        'batched': run(batcher.embed, args.threads, args.requests),
+        'batcher': batcher.stats(),
+    }
+    results['speedup'] = round(results['batched']['throughput_rps'] / results['per_request']['throughput_rps'], 2)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for name in ('per_request', 'batched'):
+        r = results[name]
+        print(f"{name:12s} {r['throughput_rps']:8.1f} req/s   p50 {r['p50_ms']:7.2f} ms   "
+              f"p95 {r['p95_ms']:7.2f} ms   p99 {r['p99_ms']:7.2f} ms")
+    print(f"average batch size {results['batcher']['avg_batch_size']}, throughput x{results['speedup']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Local stand-in for the Ollama HTTP API, for benchmarks
+
+Serves the endpoints the application uses (/api/generate, streaming and not,
+/api/tags and /api/ps) with a simple, configurable cost model instead of a real
+model, so the Flask/RAG layer can be load-tested repeatably without a GPU or
+network:
+
+    model load      the first request for a model (and any request after it has
+                    been idle for --keep-alive seconds) waits --load-delay seconds;
+                    concurrent requests share one load
+    prompt eval     prompt tokens (about 1.3 per word) at --prompt-tps tokens/second
+    generation      --think-tokens inside <think>...</think>, then --response-tokens,
+                    at --tokens-per-sec; streamed as NDJSON lines when stream is true
+    parallelism     at most --parallel generations run at once, later ones queue
+                    (like OLLAMA_NUM_PARALLEL)
+
+Run standalone and point the app at it with OLLAMA_BASE_URL:
+    python benchmarks/mock_ollama.py --port 11435 --tokens-per-sec 40
+    OLLAMA_BASE_URL=http://127.0.0.1:11435 python app.py
+
+or start it from another benchmark with MockOllama(...).start().
+"""
+
+import json
+import time
+import argparse
+import threading
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_MODELS = ("deepseek-r1:1.5b",)
+
+FILLER_WORDS = ("It", "sounds", "like", "you", "are", "carrying", "a", "lot", "right", "now,",
+                "and", "that", "is", "understandable.", "Let's", "take", "it", "one", "step", "at", "a", "time.")
+
+
+class MockOllama:
+    """Threaded HTTP server imitating Ollama's generate, tags and ps endpoints."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, models=DEFAULT_MODELS,
+                 load_delay: float = 2.0, prompt_tps: float = 500.0, tokens_per_sec: float = 40.0,
+                 response_tokens: int = 60, think_tokens: int = 20, parallel: int = 2,
+                 keep_alive: float = 300.0):
+        """
+        Configure the mock server (port 0 picks a free port).
+
+        Args:
+            host: Interface to bind
+            port: Port to bind, 0 for any free port
+            models: Model names reported by /api/tags
+            load_delay: Seconds to load a model that is not resident
+            prompt_tps: Prompt evaluation speed in tokens per second (0 for instant)
+            tokens_per_sec: Generation speed in tokens per second (0 for instant)
+            response_tokens: Visible tokens per reply
+            think_tokens: Tokens inside the leading <think> section (0 for none)
+            parallel: Generations processed at once
+            keep_alive: Idle seconds after which a model is unloaded
+        """
+        self.models = list(models)
+        self.load_delay = load_delay
+        self.prompt_tps = prompt_tps
+        self.tokens_per_sec = tokens_per_sec
+        self.response_tokens = response_tokens
+        self.think_tokens = think_tokens
+        self.keep_alive = keep_alive
+
+        self._slots = threading.Semaphore(max(1, parallel))
+        self._lock = threading.Lock()
+        self._loaded = {}       # model -> monotonic time of last use
+        self._load_locks = {}   # model -> lock held while the model loads
+        self.requests = 0
+        self.loads = 0
+
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockOllama":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'model_loads': self.loads}
+
+    # -- Cost model ----------------------------------------------------------------
+
+    def _resident(self, model: str) -> bool:
+        last_used = self._loaded.get(model)
+        return last_used is not None and time.monotonic() - last_used < self.keep_alive
+
+    def ensure_loaded(self, model: str) -> float:
+        """Load the model if needed; returns the seconds spent loading."""
+        with self._lock:
+            if self._resident(model):
+                self._loaded[model] = time.monotonic()
+                return 0.0
+            load_lock = self._load_locks.setdefault(model, threading.Lock())
+        start = time.monotonic()
+        with load_lock:
+            with self._lock:
+                resident = self._resident(model)
+            if not resident:
+                time.sleep(self.load_delay)
+                with self._lock:
+                    self.loads += 1
+            with self._lock:
+                self._loaded[model] = time.monotonic()
+        return time.monotonic() - start
+
+    def tokens(self):
+        """The raw tokens of one reply, think section first."""
+        if self.think_tokens:
+            yield "<think>"
+            for i in range(self.think_tokens):
+                yield " " + FILLER_WORDS[i % len(FILLER_WORDS)]
+            yield "</think>\n\n"
+        for i in range(self.response_tokens):
+            yield ("" if i == 0 else " ") + FILLER_WORDS[i % len(FILLER_WORDS)]
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json({"models": [{"name": name, "model": name} for name in mock.models]})
+                elif self.path == "/api/ps":
+                    with mock._lock:
+                        resident = [name for name in mock._loaded if mock._resident(name)]
+                    self._send_json({"models": [{"name": name, "model": name} for name in resident]})
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                if self.path != "/api/generate":
+                    self._send_json({"error": "not found"}, 404)
+                    return
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                model = request.get("model", "")
+                with mock._lock:
+                    mock.requests += 1
+                if model not in mock.models:
+                    self._send_json({"error": f"model '{model}' not found"}, 404)
+                    return
+
+                with mock._slots:
+                    load_seconds = mock.ensure_loaded(model)
+                    prompt = request.get("prompt") or ""
+                    if not prompt:
+                        # A request without a prompt only loads the model
+                        self._send_json(self._final(model, load_seconds, 0, 0, "load"))
+                        return
+                    prompt_tokens = int(len(prompt.split()) * 1.3) + 1
+                    if mock.prompt_tps:
+                        time.sleep(prompt_tokens / mock.prompt_tps)
+                    if request.get("stream", True):
+                        self._stream(model, load_seconds, prompt_tokens)
+                    else:
+                        tokens = list(mock.tokens())
+                        if mock.tokens_per_sec:
+                            time.sleep(len(tokens) / mock.tokens_per_sec)
+                        final = self._final(model, load_seconds, prompt_tokens, len(tokens), "stop")
+                        final["response"] = "".join(tokens)
+                        self._send_json(final)
+
+            def _stream(self, model, load_seconds, prompt_tokens):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                count = 0
+                try:
+                    for token in mock.tokens():
+                        if mock.tokens_per_sec:
+                            time.sleep(1.0 / mock.tokens_per_sec)
+                        count += 1
+                        self._chunk({"model": model, "created_at": datetime.now().isoformat(),
+                                     "response": token, "done": False})
+                    final = self._final(model, load_seconds, prompt_tokens, count, "stop")
+                    final["response"] = ""
+                    self._chunk(final)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client went away; stop generating
+
+            def _chunk(self, payload):
+                line = (json.dumps(payload) + "\n").encode('utf-8')
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+
+            @staticmethod
+            def _final(model, load_seconds, prompt_tokens, eval_tokens, reason):
+                return {
+                    "model": model,
+                    "created_at": datetime.now().isoformat(),
+                    "done": True,
+                    "done_reason": reason,
+                    "load_duration": int(load_seconds * 1e9),
+                    "prompt_eval_count": prompt_tokens,
+                    "eval_count": eval_tokens,
+                }
+
+        return Handler
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Mock cost-model options, shared with benchmarks that start the mock themselves."""
+    parser.add_argument("--load-delay", type=float, default=2.0, help="Seconds to load a model that is not resident")
+    parser.add_argument("--prompt-tps", type=float, default=500.0, help="Prompt evaluation tokens per second")
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0, help="Generated tokens per second")
+    parser.add_argument("--response-tokens", type=int, default=60, help="Visible tokens per reply")
+    parser.add_argument("--think-tokens", type=int, default=20, help="Tokens in the <think> section")
+    parser.add_argument("--parallel", type=int, default=2, help="Generations processed at once")
+    parser.add_argument("--keep-alive", type=float, default=300.0, help="Idle seconds before a model unloads")
+
+
+def from_arguments(args, host: str = "127.0.0.1", port: int = 0) -> MockOllama:
+    return MockOllama(host=host, port=port, load_delay=args.load_delay, prompt_tps=args.prompt_tps,
+                      tokens_per_sec=args.tokens_per_sec, response_tokens=args.response_tokens,
+                      think_tokens=args.think_tokens, parallel=args.parallel, keep_alive=args.keep_alive)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    mock = from_arguments(args, host=args.host, port=args.port).start()
+    print(f"Mock Ollama listening on {mock.url} (OLLAMA_BASE_URL={mock.url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: exact vector search latency by corpus size
+
+Builds random unit-length float32 chunk embeddings at several corpus sizes and
+reports per-query latency (p50/p99) for MatrixVectorStore.search, the per-query
+cost of search_batch, and, for sizes up to --sklearn-max, the same query through
+scikit-learn's brute-force NearestNeighbors (what SKLearnVectorStore used).
+
+Usage:
+    python benchmarks/vector_search.py
+    python benchmarks/vector_search.py --sizes 1000 100000 1000000 --dimensions 384 --json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store import MatrixVectorStore
+
+
+def random_unit_rows(rng, rows, dimensions, block=65536):
+    """Random unit-length float32 rows, generated in blocks to bound peak memory."""
+    matrix = np.empty((rows, dimensions), dtype=np.float32)
+    for start in range(0, rows, block):
+        part = rng.standard_normal((min(block, rows - start), dimensions), dtype=np.float32)
+        part /= np.linalg.norm(part, axis=1, keepdims=True)
+        matrix[start:start + len(part)] = part
+    return matrix
+
+
+def latencies_ms(fn, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'p50_ms': round(float(np.percentile(timings, 50)), 3),
+        'p99_ms': round(float(np.percentile(timings, 99)), 3),
+    }
+
+
+def bench_size(rng, size, args):
+    matrix = random_unit_rows(rng, size, args.dimensions)
+    store = MatrixVectorStore([""] * size, [{}] * size, matrix, normalized=True)
+    queries = random_unit_rows(rng, args.queries, args.dimensions)
+
+    store.search(queries[0], args.k)  # touch the matrix once before timing
+    result = {'chunks': size, 'matrix_mb': round(matrix.nbytes / 2 ** 20, 1)}
+    result['search'] = latencies_ms(lambda q: store.search(q, args.k), queries)
+
+    start = time.perf_counter()
+    for offset in range(0, len(queries), args.batch):
+        store.search_batch(queries[offset:offset + args.batch], args.k)
+    result['search_batch_ms_per_query'] = round((time.perf_counter() - start) * 1000 / len(queries), 3)
+
+    if size <= args.sklearn_max:
+        try:
+            from sklearn.neighbors import NearestNeighbors
+            index = NearestNeighbors(n_neighbors=args.k, metric='cosine', algorithm='brute').fit(matrix)
+            result['sklearn'] = latencies_ms(lambda q: index.kneighbors(q[np.newaxis, :]), queries)
+        except ImportError:
+            pass
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000], help="Corpus sizes in chunks")
+    parser.add_argument('--dimensions', type=int, default=384, help="Embedding dimensions (all-MiniLM-L6-v2: 384)")
+    parser.add_argument('--queries', type=int, default=200, help="Queries timed per size")
+    parser.add_argument('--batch', type=int, default=32, help="Queries per search_batch call")
+    parser.add_argument('--k', type=int, default=3, help="Results per query")
+    parser.add_argument('--sklearn-max', type=int, default=100000, help="Largest size to also time with scikit-learn")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = [bench_size(rng, size, args) for size in args.sizes]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for r in results:
+        line = (f"{r['chunks']:>9,d} chunks ({r['matrix_mb']:7.1f} MB)   search p50 {r['search']['p50_ms']:8.3f} ms"
+                f"   p99 {r['search']['p99_ms']:8.3f} ms   batched {r['search_batch_ms_per_query']:8.3f} ms/query")
+        if 'sklearn' in r:
+            line += f"   sklearn p50 {r['sklearn']['p50_ms']:8.3f} ms"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
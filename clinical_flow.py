@@ -9,7 +9,10 @@ try:
 except ImportError:
     # Fallback if ollama_handler is not available
     def send_prompt_to_ollama(prompt, **kwargs):
-        return None
+        return None, False
+
+class ReportEnhancementError(Exception):
+    """Raised instead of falling back to the basic summary when the AI report could not be generated."""
 
 # Structured conversation flow for clinical assessment
 CLINICAL_QUESTIONS = [
@@ -196,24 +199,23 @@ def generate_clinical_summary(timeline_data):
     
     return summary
 
-# Function to generate an AI-enhanced clinical report using the timeline data and Ollama API
-def generate_ai_enhanced_report(timeline_data):
+# Disclaimer appended to every AI-generated report
+AI_REPORT_DISCLAIMER = "\n\n---\n\n*This assessment was generated with AI assistance based on the information provided. " \
+                       "It is not a clinical diagnosis and should be used for informational purposes only. " \
+                       "Please consult with a qualified mental health professional for proper assessment and treatment recommendations.*"
+
+# Function to build the prompt for the AI-enhanced clinical report
+def build_ai_report_prompt(timeline_data, basic_summary):
     """
-    Generate an AI-enhanced clinical report using the timeline data and Ollama API.
+    Build the prompt asking the model to enhance the basic clinical summary.
     
     Args:
         timeline_data (dict): The timeline data collected during the conversation
+        basic_summary (str): The summary from generate_clinical_summary()
         
     Returns:
-        str: An AI-enhanced clinical summary
+        str: The prompt for the model
     """
-    # First generate a basic summary using our existing function
-    basic_summary = generate_clinical_summary(timeline_data)
-    
-    # If we couldn't import the ollama handler, return the basic summary
-    if send_prompt_to_ollama == None:
-        return basic_summary
-    
     # Extract all user responses for context
     all_responses = ""
     if 'entries' in timeline_data and timeline_data['entries']:
@@ -224,7 +226,7 @@ def generate_ai_enhanced_report(timeline_data):
             all_responses += f"Question about {category}: {question}\nResponse: {response}\n\n"
     
     # Create a prompt for the AI
-    prompt = f"""You are a professional mental health clinician reviewing a client's assessment responses.
+    return f"""You are a professional mental health clinician reviewing a client's assessment responses.
 Based on the following client responses and initial assessment, generate an insightful clinical report.
 Please focus on identifying patterns, strengths, areas of concern, and potential directions for support.
 
@@ -244,16 +246,58 @@ clear sections. Include:
 
 The report should be insightful but avoid definitive diagnoses. Use professional but compassionate language.
 """
+
+# Function to choose between the AI-enhanced report and the basic summary
+def finalize_ai_report(enhanced_report, basic_summary, fallback=True):
+    """
+    Return the AI report with its disclaimer, or the basic summary if enhancement failed.
     
-    # Get enhanced report from Ollama
-    enhanced_report = send_prompt_to_ollama(prompt, model="deepseek-r1:1.5b", temperature=0.3)
-    
+    Args:
+        enhanced_report (str): The model's report, or None
+        basic_summary (str): The summary from generate_clinical_summary()
+        fallback (bool): Return the basic summary on failure; if False, raise instead
+        
+    Returns:
+        str: The report to show
+        
+    Raises:
+        ReportEnhancementError: If enhancement failed and fallback is False
+    """
     if enhanced_report and len(enhanced_report) > 100:
         # Add a disclaimer to the AI-generated report
-        disclaimer = "\n\n---\n\n*This assessment was generated with AI assistance based on the information provided. " \
-                    "It is not a clinical diagnosis and should be used for informational purposes only. " \
-                    "Please consult with a qualified mental health professional for proper assessment and treatment recommendations.*"
-        return enhanced_report + disclaimer
-    else:
+        return enhanced_report + AI_REPORT_DISCLAIMER
+    elif fallback:
         # If the AI enhancement failed, return the basic summary
         return basic_summary
+    else:
+        # Errors come back from the Ollama helpers as short apology messages
+        raise ReportEnhancementError(f"AI report generation failed: {(enhanced_report or 'no response')[:100]}")
+
+# Function to generate an AI-enhanced clinical report using the timeline data and Ollama API
+def generate_ai_enhanced_report(timeline_data, fallback=True):
+    """
+    Generate an AI-enhanced clinical report using the timeline data and Ollama API.
+    
+    Args:
+        timeline_data (dict): The timeline data collected during the conversation
+        fallback (bool): Return the basic summary if the model fails; if False, raise
+            ReportEnhancementError so callers that cache reports can retry later
+        
+    Returns:
+        str: An AI-enhanced clinical summary
+    """
+    # First generate a basic summary using our existing function
+    basic_summary = generate_clinical_summary(timeline_data)
+    
+    # If we couldn't import the ollama handler, return the basic summary
+    if send_prompt_to_ollama == None:
+        return finalize_ai_report(None, basic_summary, fallback)
+    
+    prompt = build_ai_report_prompt(timeline_data, basic_summary)
+    
+    # send_prompt_to_ollama goes through the shared Ollama client and returns (response, rag_used).
+    # Not prompt-cached: a rejected reply would be served again on every retry. Finished reports
+    # are kept by the report cache instead.
+    enhanced_report, _ = send_prompt_to_ollama(prompt, model="deepseek-r1:1.5b", temperature=0.3)
+    
+    return finalize_ai_report(enhanced_report, basic_summary, fallback)
@@ -0,0 +1,279 @@
+"""
+Content-Addressed Chunk and Embedding Cache for the RAG System
+
+A rebuild of the index (a new document, a different chunk size, a new
+ingestion run) used to re-split and re-embed every document even though most
+of them had not changed. This module remembers both expensive steps on local
+disk, keyed by what their output depends on:
+
+    chunks   sha256(splitter settings, document text)  -> list of chunk texts
+    vector   sha256(embedding model, chunk text)        -> normalized float32 vector
+
+Entries live in one SQLite file. When the file grows past its budget the least
+recently used entries are evicted. Several processes (e.g. ingestion workers)
+can share the file; only the process that owns the budget evicts.
+
+Configuration is read from the environment:
+    RAG_CACHE_DIR      Cache directory (default <RAG_INDEX_DIR>/cache)
+    RAG_CACHE_MAX_MB   Size budget in megabytes, 0 disables the cache (default 1024)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Callable, Iterable
+
+import numpy as np
+
+from index_store import RAG_INDEX_DIR
+from vector_store import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+RAG_CACHE_DIR = os.environ.get("RAG_CACHE_DIR", os.path.join(RAG_INDEX_DIR, "cache"))
+RAG_CACHE_MAX_MB = float(os.environ.get("RAG_CACHE_MAX_MB", "1024"))
+
+# Keys per SQL statement, below SQLite's bound-parameter limit
+SQL_BATCH = 500
+
+# Eviction frees space down to this fraction of the budget, so it does not run on every write
+EVICT_TO_FRACTION = 0.9
+
+# Rough per-row cost of the key and bookkeeping columns
+ENTRY_OVERHEAD_BYTES = 128
+
+
+# Index settings that determine how a document is split (the rest only affect embedding)
+SPLITTER_SETTING_KEYS = ("splitter", "chunk_size", "chunk_overlap")
+
+
+def splitter_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """The subset of index settings that keys the chunks cache."""
+    return {key: settings[key] for key in SPLITTER_SETTING_KEYS if key in settings}
+
+
+def chunks_key(text: str, splitter_settings: Dict[str, Any]) -> str:
+    """Cache key of a document's chunks under a splitter configuration."""
+    digest = hashlib.sha256(json.dumps(splitter_settings, sort_keys=True).encode('utf-8'))
+    digest.update(b"\0")
+    digest.update(text.encode('utf-8'))
+    return "c:" + digest.hexdigest()
+
+
+def vector_key(text: str, model_name: str) -> str:
+    """Cache key of a chunk's embedding under an embedding model."""
+    digest = hashlib.sha256(model_name.encode('utf-8'))
+    digest.update(b"\0")
+    digest.update(text.encode('utf-8'))
+    return "v:" + digest.hexdigest()
+
+
+class ContentCache:
+    """Size-bounded, least-recently-used key/value store on local disk."""
+
+    def __init__(self, directory: str = RAG_CACHE_DIR, max_bytes: Optional[int] = None, evict: bool = True):
+        """
+        Open (or create) the cache.
+
+        Args:
+            directory: Directory holding the cache database
+            max_bytes: Size budget (defaults to RAG_CACHE_MAX_MB)
+            evict: Set to False in helper processes so only the owning process evicts
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, "content_cache.sqlite3")
+        self.max_bytes = int(RAG_CACHE_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self.evict = evict
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._bytes = self._db.execute("SELECT total(size) FROM entries").fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """
+        Look up several keys at once.
+
+        Args:
+            keys: Cache keys
+
+        Returns:
+            Dict of the keys that were found and their values
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), SQL_BATCH):
+                part = keys[start:start + SQL_BATCH]
+                marks = ",".join("?" * len(part))
+                found.update(self._db.execute(f"SELECT key, value FROM entries WHERE key IN ({marks})", part))
+                hit_keys = [key for key in part if key in found]
+                if hit_keys:
+                    self._db.execute(
+                        f"UPDATE entries SET last_used = ? WHERE key IN ({','.join('?' * len(hit_keys))})",
+                        [time.time()] + hit_keys
+                    )
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        """Store several values in one transaction, then evict if the budget is exceeded."""
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, value, len(value) + len(key) + ENTRY_OVERHEAD_BYTES, now) for key, value in items.items()]
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", rows)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._bytes += sum(row[2] for row in rows)
+            if self.evict and self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache is back under its budget."""
+        self._bytes = self._db.execute("SELECT total(size) FROM entries").fetchone()[0]
+        target = self.max_bytes * EVICT_TO_FRACTION
+        if self._bytes <= target:
+            return
+        excess = self._bytes - target
+        freed = dropped = 0
+        keys = []
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY last_used"):
+            keys.append(key)
+            freed += size
+            if freed >= excess:
+                break
+        for start in range(0, len(keys), SQL_BATCH):
+            part = keys[start:start + SQL_BATCH]
+            self._db.execute(f"DELETE FROM entries WHERE key IN ({','.join('?' * len(part))})", part)
+            dropped += len(part)
+        self._bytes -= freed
+        self.evictions += dropped
+        logger.info(f"Evicted {dropped} entries ({freed / 2 ** 20:.1f} MB) from the content cache")
+
+    def trim(self) -> None:
+        """Enforce the budget after other processes have written to the cache."""
+        with self._lock:
+            self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit, miss and size counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'bytes': int(self._bytes),
+                'max_bytes': self.max_bytes,
+            }
+
+
+def cached_split(cache: Optional[ContentCache], split_text: Callable[[str], List[str]],
+                 splitter_settings: Dict[str, Any], texts: List[str]) -> List[List[str]]:
+    """
+    Split documents, reusing the chunks of documents split before with the same settings.
+
+    Args:
+        cache: The content cache, or None to always split
+        split_text: The splitter's split_text function
+        splitter_settings: Everything that determines the chunks (splitter, size, overlap)
+        texts: Document texts
+
+    Returns:
+        The chunk texts of each document, in order
+    """
+    if cache is None:
+        return [split_text(text) for text in texts]
+
+    keys = [chunks_key(text, splitter_settings) for text in texts]
+    found = cache.get_many(keys)
+    results, fresh = [], {}
+    for key, text in zip(keys, texts):
+        if key in found:
+            results.append(json.loads(found[key]))
+        else:
+            chunks = split_text(text)
+            fresh[key] = json.dumps(chunks).encode('utf-8')
+            results.append(chunks)
+    cache.put_many(fresh)
+    return results
+
+
+def cached_embed(cache: Optional[ContentCache], embed_documents: Callable[[List[str]], List[List[float]]],
+                 model_name: str, texts: List[str], batch_size: int = 0) -> np.ndarray:
+    """
+    Embed chunk texts, only calling the model for chunks not embedded before with this model.
+
+    Args:
+        cache: The content cache, or None to always embed
+        embed_documents: Function embedding a list of texts (only called on misses)
+        model_name: Embedding model name, part of the cache key
+        texts: Chunk texts
+        batch_size: Texts per model call for the misses (0 for a single call)
+
+    Returns:
+        np.ndarray: (len(texts), dimensions) normalized float32 matrix
+    """
+    keys = [vector_key(text, model_name) for text in texts] if cache is not None else []
+    found = cache.get_many(keys) if cache is not None else {}
+
+    missing = list(dict.fromkeys(text for i, text in enumerate(texts) if cache is None or keys[i] not in found))
+    computed = {}
+    if missing:
+        step = batch_size or len(missing)
+        for start in range(0, len(missing), step):
+            part = missing[start:start + step]
+            computed.update(zip(part, normalize_rows(embed_documents(part))))
+        if cache is not None:
+            cache.put_many({vector_key(text, model_name): vector.tobytes() for text, vector in computed.items()})
+
+    if not texts:
+        return np.zeros((0, 1), dtype=np.float32)
+    rows = [
+        computed[text] if text in computed else np.frombuffer(found[keys[i]], dtype=np.float32)
+        for i, text in enumerate(texts)
+    ]
+    return np.ascontiguousarray(np.stack(rows))
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_content_cache() -> Optional[ContentCache]:
+    """The process-wide cache, or None if it is disabled (RAG_CACHE_MAX_MB=0) or unavailable."""
+    global _shared_cache
+    if RAG_CACHE_MAX_MB <= 0:
+        return None
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                try:
+                    _shared_cache = ContentCache()
+                except (OSError, sqlite3.Error) as e:
+                    logger.warning(f"Content cache unavailable, chunks and vectors will not be reused: {str(e)}")
+                    return None
+    return _shared_cache
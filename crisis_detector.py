@@ -0,0 +1,256 @@
+"""
+Crisis Fast Path: Risk-Phrase Detection Before Any Model Call
+
+A message that mentions suicide or self-harm must not wait for the clinical
+flow or a full RAG + LLM generation before the user sees crisis resources. The
+chat endpoints run every message through CrisisDetector first; on a match they
+answer at once with the crisis-support documents from the knowledge base
+(topic "suicide_prevention", then other "crisis_support" entries).
+
+Matching uses an Aho-Corasick automaton built once over the risk lexicon. A
+message is normalized (lower case, punctuation and runs of whitespace collapsed
+to single spaces) and scanned in one pass, so the cost per message depends on
+its length and not on the number of phrases. Phrases only match whole words:
+"suicide" matches "thinking about suicide" but not "suicidegirls".
+
+Users whose message matched are flagged for a while, and their follow-up
+messages that do go to the model are queued ahead of everyone else (see
+scheduler.py).
+
+Configuration is read from the environment:
+    CRISIS_LEXICON_FILE       Extra risk phrases, one per line (# starts a comment)
+    CRISIS_PRIORITY_SECONDS   How long a flagged user's requests get queue priority (default 1800)
+"""
+
+import os
+import re
+import hmac
+import time
+import hashlib
+import secrets
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from mental_health_kb import MENTAL_HEALTH_DOCUMENTS
+except ImportError:
+    MENTAL_HEALTH_DOCUMENTS = []
+
+CRISIS_LEXICON_FILE = os.environ.get("CRISIS_LEXICON_FILE", "")
+CRISIS_PRIORITY_SECONDS = float(os.environ.get("CRISIS_PRIORITY_SECONDS", "1800"))
+
+# Built-in risk lexicon; matched as whole words after normalize()
+DEFAULT_LEXICON = (
+    "suicide", "suicidal", "kill myself", "killing myself", "end my life", "ending my life",
+    "take my own life", "take my life", "want to die", "wanna die", "wish i was dead",
+    "wish i were dead", "better off dead", "no reason to live", "not worth living",
+    "dont want to live", "dont want to be alive", "cant go on", "end it all",
+    "self harm", "selfharm", "self harming", "hurt myself", "hurting myself", "harm myself",
+    "harming myself", "cut myself", "cutting myself", "overdose", "hang myself",
+)
+
+CRISIS_PREAMBLE = ("I'm really sorry you're feeling this way. Your safety matters, and you don't "
+                   "have to go through this alone.")
+
+# Used when the knowledge base is not installed
+FALLBACK_RESOURCES = """Please contact a crisis helpline immediately:
+- Suicide & Crisis Lifeline (US): call or text 988 (Available 24/7)
+- Samaritans (UK): 116 123
+You can also go to your nearest emergency room or call emergency services (911 in US, 999 in UK)."""
+
+# Key for the user ids in crisis log records, new each process so the ids cannot be
+# reversed by hashing candidate usernames; they only correlate records within one run
+_LOG_ID_KEY = secrets.token_bytes(16)
+
+_APOSTROPHES = re.compile(r"['’`]")
+_SEPARATORS = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Lower-case text with apostrophes removed and everything else but letters and digits collapsed to single spaces."""
+    return _SEPARATORS.sub(" ", _APOSTROPHES.sub("", text.lower())).strip()
+
+
+def log_user_id(username: Optional[str]) -> str:
+    """A pseudonymous id for a username in log records (messages about crisis are health data)."""
+    if not username:
+        return "anonymous"
+    return hmac.new(_LOG_ID_KEY, username.encode("utf-8"), hashlib.sha256).hexdigest()[:12]
+
+
+def load_lexicon(path: str) -> List[str]:
+    """Read risk phrases from a file, one per line; blank lines and # comments are skipped."""
+    with open(path, encoding="utf-8") as f:
+        lines = [line.split("#", 1)[0].strip() for line in f]
+    return [line for line in lines if line]
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton finding whole-word phrases in one pass over a text."""
+
+    def __init__(self, phrases: Iterable[str]):
+        """
+        Build the automaton.
+
+        Args:
+            phrases: Phrases to find; they are normalized like the texts searched
+        """
+        self.phrases = []
+        self._goto = [{}]    # state -> {character: next state}
+        self._fail = [0]     # state -> longest proper suffix state
+        self._output = [()]  # state -> indexes of the phrases ending here
+
+        for phrase in phrases:
+            key = normalize(phrase)
+            if key:
+                self._add(f" {key} ", len(self.phrases))
+                self.phrases.append(key)
+        self._link()
+
+    def _add(self, key: str, index: int) -> None:
+        state = 0
+        for ch in key:
+            following = self._goto[state].get(ch)
+            if following is None:
+                following = len(self._goto)
+                self._goto[state][ch] = following
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = following
+        self._output[state] += (index,)
+
+    def _link(self) -> None:
+        """Compute failure links breadth-first and merge the outputs reachable through them."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                link = self._goto[fallback].get(ch, 0)
+                self._fail[following] = link if link != following else 0
+                self._output[following] += self._output[self._fail[following]]
+
+    @property
+    def states(self) -> int:
+        return len(self._goto)
+
+    def find(self, text: str) -> List[str]:
+        """
+        Return the phrases occurring in a text, in order of appearance.
+
+        Args:
+            text: The text to search (normalized here)
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        found = []
+        state = 0
+        for ch in f" {normalize(text)} ":
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                found.extend(self.phrases[i] for i in output[state])
+        return found
+
+
+def crisis_documents(documents=None) -> List[Dict[str, Any]]:
+    """The knowledge base's crisis-support documents, suicide prevention first."""
+    documents = MENTAL_HEALTH_DOCUMENTS if documents is None else documents
+    crisis = [doc for doc in documents if doc.get("metadata", {}).get("type") == "crisis_support"
+              or doc.get("metadata", {}).get("topic") == "suicide_prevention"]
+    return sorted(crisis, key=lambda doc: doc["metadata"].get("topic") != "suicide_prevention")
+
+
+def build_crisis_response(documents=None) -> str:
+    """The reply sent on a match: a short preamble followed by the crisis-support documents."""
+    sections = [doc["content"].strip() for doc in crisis_documents(documents)] or [FALLBACK_RESOURCES]
+    return "\n\n".join([CRISIS_PREAMBLE] + sections)
+
+
+class CrisisDetector:
+    """Risk-phrase check run before the clinical flow and any model call, with per-user priority flags."""
+
+    def __init__(self, phrases: Optional[Iterable[str]] = None, priority_seconds: float = CRISIS_PRIORITY_SECONDS,
+                 response: Optional[str] = None):
+        """
+        Args:
+            phrases: The risk lexicon (default: the built-in lexicon plus CRISIS_LEXICON_FILE)
+            priority_seconds: How long a flagged user's requests get queue priority
+            response: The crisis reply (default: built from the knowledge base)
+        """
+        if phrases is None:
+            phrases = list(DEFAULT_LEXICON)
+            if CRISIS_LEXICON_FILE:
+                try:
+                    phrases.extend(load_lexicon(CRISIS_LEXICON_FILE))
+                except OSError as e:
+                    logger.error(f"Could not load crisis lexicon {CRISIS_LEXICON_FILE}: {str(e)}")
+        self.matcher = PhraseMatcher(phrases)
+        self.priority_seconds = priority_seconds
+        self.response = response if response is not None else build_crisis_response()
+
+        self._lock = threading.Lock()
+        self._flagged = {}  # username -> monotonic time of the last match
+
+        self.checked = 0
+        self.matched = 0
+        self.check_seconds = 0.0
+
+    def check(self, text: Optional[str], username: Optional[str] = None) -> List[str]:
+        """
+        Look for risk phrases in a message, flagging the user on a match.
+
+        Args:
+            text: The user's message
+            username: The user, flagged for queue priority on a match
+
+        Returns:
+            list: The matched phrases (empty if none)
+        """
+        start = time.perf_counter()
+        found = self.matcher.find(text) if text else []
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.checked += 1
+            self.check_seconds += elapsed
+            if found:
+                self.matched += 1
+                if username:
+                    self._flagged[username] = time.monotonic()
+        if found:
+            # Neither the phrases nor the username are logged: both would tie health data to a person
+            logger.warning("Crisis language detected, sending crisis resources",
+                           extra={'user_id': log_user_id(username), 'matches': len(found)})
+        return found
+
+    def is_flagged(self, username: Optional[str]) -> bool:
+        """Whether the user's requests currently get queue priority."""
+        if not username:
+            return False
+        with self._lock:
+            flagged_at = self._flagged.get(username)
+            if flagged_at is None:
+                return False
+            if time.monotonic() - flagged_at > self.priority_seconds:
+                del self._flagged[username]
+                return False
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Match counters and check cost for monitoring."""
+        with self._lock:
+            return {
+                'phrases': len(self.matcher.phrases),
+                'checked': self.checked,
+                'matched': self.matched,
+                'flagged_users': len(self._flagged),
+                'avg_check_us': round(self.check_seconds / self.checked * 1e6, 1) if self.checked else 0.0,
+            }
@@ -0,0 +1,82 @@
+"""
+Client Disconnect Detection for the Threaded (Flask) Server
+
+A user who closes the tab mid-answer should not keep a generation slot busy.
+In the ASGI app the server cancels the handler when the client goes away; a
+WSGI handler gets no such signal until it writes to the closed socket, which a
+non-streaming reply only does once generation has finished.
+
+ClientWatch peeks at the client's socket instead: a readable socket that
+returns no data has been closed by the client. The check is cheap and
+rate-limited, and it is polled while a request waits for a scheduler slot and
+between model tokens (see response_filters.CancelFilter). Servers that don't
+expose the socket (werkzeug's development server and gunicorn do) simply get
+no watch, and requests run to completion as before.
+
+Configuration is read from the environment:
+    DISCONNECT_POLL_SECONDS   Minimum interval between socket checks (default 0.25)
+"""
+
+import os
+import time
+import socket
+import select
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DISCONNECT_POLL_SECONDS = float(os.environ.get("DISCONNECT_POLL_SECONDS", "0.25"))
+
+# WSGI environ keys under which servers expose the client connection
+SOCKET_KEYS = ("werkzeug.socket", "gunicorn.socket")
+
+
+def socket_closed(sock) -> bool:
+    """Check without blocking whether the peer has closed a socket."""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        return sock.recv(1, socket.MSG_PEEK) == b""
+    except (ConnectionError, socket.timeout):
+        return True
+    except (OSError, ValueError):
+        # Closed by us, or a socket type we can't peek at (e.g. TLS): assume the client is there
+        return False
+
+
+class ClientWatch:
+    """Rate-limited check of whether a request's client is still connected."""
+
+    def __init__(self, sock, poll_seconds: float = DISCONNECT_POLL_SECONDS):
+        """
+        Args:
+            sock: The client connection
+            poll_seconds: Minimum interval between socket checks
+        """
+        self.sock = sock
+        self.poll_seconds = poll_seconds
+        self.gone = False
+        self._checked = 0.0
+
+    @classmethod
+    def from_environ(cls, environ) -> Optional["ClientWatch"]:
+        """A watch on the request's client connection, or None if the server does not expose it."""
+        for key in SOCKET_KEYS:
+            sock = environ.get(key)
+            if sock is not None:
+                return cls(sock)
+        return None
+
+    def disconnected(self) -> bool:
+        """Whether the client has gone away (checked at most every poll_seconds)."""
+        if self.gone:
+            return True
+        now = time.monotonic()
+        if now - self._checked >= self.poll_seconds:
+            self._checked = now
+            self.gone = socket_closed(self.sock)
+            if self.gone:
+                logger.debug("Client disconnected")
+        return self.gone
@@ -0,0 +1,204 @@
+"""
+Incrementally Updatable Document Index for the RAG System
+
+Rebuilding the whole index to change one document costs a full re-split and
+re-embed of the knowledge base. DocumentIndex instead tracks which chunk rows
+belong to which document (by a stable document id), so an upsert only chunks
+and embeds the documents whose content changed and a delete embeds nothing:
+
+    upsert   old rows of the document are tombstoned, new rows are appended
+    delete   the document's rows are tombstoned
+    compact  once enough rows are dead, live rows are copied into a fresh matrix
+             in a background thread
+
+Readers never see a half-applied change. Every change publishes a new immutable
+MatrixVectorStore snapshot (a view of the rows written so far plus a copy of the
+live mask); appends only write past the end of existing snapshots and growing
+or compacting allocates a new matrix, so queries already running against an
+older snapshot finish unaffected.
+
+Configuration is read from the environment:
+    RAG_COMPACT_DEAD_FRACTION   Compact when this fraction of rows is deleted (default 0.2)
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Callable, Iterable, Tuple
+
+import numpy as np
+
+from vector_store import MatrixVectorStore
+
+logger = logging.getLogger(__name__)
+
+RAG_COMPACT_DEAD_FRACTION = float(os.environ.get("RAG_COMPACT_DEAD_FRACTION", "0.2"))
+
+
+def document_id(metadata: Dict[str, Any], content: str = "") -> str:
+    """
+    The stable id of a document: metadata 'doc_id' or 'id', else a hash of its content.
+
+    Documents without an explicit id can still be added and deleted, but editing one
+    is seen as deleting the old text and adding a new document.
+    """
+    for field in ("doc_id", "id"):
+        if metadata.get(field) not in (None, ""):
+            return str(metadata[field])
+    return "sha1:" + hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def document_hash(content: str, metadata: Dict[str, Any]) -> str:
+    """Hash of everything that affects a document's chunks, used to skip unchanged upserts."""
+    digest = hashlib.sha256(content.encode('utf-8'))
+    digest.update(json.dumps(metadata, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class DocumentIndex:
+    """Chunk rows grouped by document, with tombstoned deletes and copy-on-write snapshots."""
+
+    def __init__(self, texts: List[str], metadatas: List[Dict[str, Any]], vectors: np.ndarray,
+                 doc_hashes: Optional[Dict[str, str]] = None,
+                 on_change: Optional[Callable[[MatrixVectorStore, Optional[np.ndarray]], None]] = None,
+                 compact_dead_fraction: float = RAG_COMPACT_DEAD_FRACTION):
+        """
+        Initialize from an existing set of chunks.
+
+        Args:
+            texts: Chunk texts
+            metadatas: Chunk metadata, carrying the 'doc_id' of their document (chunks without
+                one are treated as single-chunk documents)
+            vectors: (chunks, dimensions) normalized float32 matrix (may be a read-only memory map)
+            doc_hashes: document_hash() of each loaded document, if known, so unchanged upserts are skipped
+            on_change: Called with (snapshot, row_map) after every change, while changes are serialized;
+                row_map (old row -> new row, -1 if dropped) is only given after compaction
+            compact_dead_fraction: Fraction of dead rows that triggers background compaction
+        """
+        self._matrix = vectors
+        self._rows = len(texts)
+        self._texts = list(texts)
+        self._metadatas = list(metadatas)
+        self._live = np.ones(self._rows, dtype=bool)
+        self._doc_hashes = dict(doc_hashes or {})
+        self._doc_rows = {}
+        for row, metadata in enumerate(self._metadatas):
+            doc_id = metadata.get("doc_id") or document_id(metadata, self._texts[row])
+            self._doc_rows.setdefault(doc_id, []).append(row)
+
+        self.on_change = on_change
+        self.compact_dead_fraction = compact_dead_fraction
+        self.compactions = 0
+        self._lock = threading.Lock()
+        self._compacting = False
+        self.snapshot = self._make_snapshot()
+
+    def __len__(self):
+        return len(self._doc_rows)
+
+    def _make_snapshot(self) -> MatrixVectorStore:
+        rows = self._rows
+        return MatrixVectorStore(self._texts[:rows], self._metadatas[:rows], self._matrix[:rows],
+                                 normalized=True, live=self._live[:rows].copy())
+
+    def _publish(self, row_map: Optional[np.ndarray] = None) -> MatrixVectorStore:
+        self.snapshot = self._make_snapshot()
+        if self.on_change:
+            self.on_change(self.snapshot, row_map)
+        return self.snapshot
+
+    def doc_hash(self, doc_id: str) -> Optional[str]:
+        """The hash recorded for a document, or None if it is unknown."""
+        return self._doc_hashes.get(doc_id)
+
+    def _reserve(self, extra: int, dimensions: int) -> None:
+        """Make room for `extra` rows, moving to a larger in-memory matrix if needed."""
+        needed = self._rows + extra
+        capacity = len(self._matrix) if self._matrix.flags['WRITEABLE'] else 0
+        if needed > capacity:
+            grown = np.empty((max(needed, 2 * self._rows, 1024), dimensions), dtype=np.float32)
+            grown[:self._rows] = self._matrix[:self._rows]
+            self._matrix = grown
+            self._live = np.concatenate([self._live[:self._rows], np.zeros(len(grown) - self._rows, dtype=bool)])
+
+    def apply(self, deletes: Iterable[str] = (),
+              upserts: Iterable[Tuple[str, str, List[str], List[Dict[str, Any]], np.ndarray]] = ()) -> Dict[str, int]:
+        """
+        Delete documents and insert or replace others as one change.
+
+        Args:
+            deletes: Ids of documents to remove
+            upserts: (doc_id, doc_hash, chunk texts, chunk metadatas, normalized vectors) per document
+
+        Returns:
+            Dict with the number of 'deleted' documents and 'added' chunk rows
+        """
+        upserts = list(upserts)
+        deleted = added = 0
+        with self._lock:
+            for doc_id in list(deletes) + [u[0] for u in upserts]:
+                rows = self._doc_rows.pop(doc_id, None)
+                self._doc_hashes.pop(doc_id, None)
+                if rows is not None:
+                    self._live[rows] = False
+                    deleted += 1
+
+            new_rows = sum(len(u[2]) for u in upserts)
+            if new_rows:
+                self._reserve(new_rows, upserts[0][4].shape[1])
+            for doc_id, doc_hash, texts, metadatas, vectors in upserts:
+                start = self._rows
+                self._matrix[start:start + len(texts)] = vectors
+                self._live[start:start + len(texts)] = True
+                self._texts.extend(texts)
+                self._metadatas.extend(metadatas)
+                self._rows += len(texts)
+                self._doc_rows[doc_id] = list(range(start, self._rows))
+                self._doc_hashes[doc_id] = doc_hash
+                added += len(texts)
+
+            self._publish()
+            compact = (not self._compacting and self._rows and
+                       (self._rows - self.snapshot.live_count) / self._rows > self.compact_dead_fraction)
+            if compact:
+                self._compacting = True
+
+        if compact:
+            threading.Thread(target=self.compact, daemon=True, name="rag-compaction").start()
+        return {"deleted": deleted, "added": added}
+
+    def compact(self) -> None:
+        """Copy the live rows into a fresh matrix and drop tombstoned ones."""
+        try:
+            with self._lock:
+                keep = np.flatnonzero(self._live[:self._rows])
+                row_map = np.full(self._rows, -1, dtype=np.int64)
+                row_map[keep] = np.arange(len(keep))
+
+                self._matrix = np.ascontiguousarray(self._matrix[keep])
+                self._texts = [self._texts[i] for i in keep]
+                self._metadatas = [self._metadatas[i] for i in keep]
+                self._live = np.ones(len(keep), dtype=bool)
+                dropped, self._rows = self._rows - len(keep), len(keep)
+                self._doc_rows = {doc_id: row_map[rows].tolist() for doc_id, rows in self._doc_rows.items()}
+
+                self._publish(row_map)
+                self.compactions += 1
+            logger.info(f"Compacted RAG index: dropped {dropped} deleted chunks, {len(keep)} remain")
+        except Exception as e:
+            logger.error(f"Error compacting RAG index: {str(e)}")
+        finally:
+            self._compacting = False
+
+    def stats(self) -> Dict[str, Any]:
+        """Current size of the index for monitoring."""
+        snapshot = self.snapshot
+        return {
+            "documents": len(self._doc_rows),
+            "rows": len(snapshot),
+            "live_rows": snapshot.live_count,
+            "dead_rows": len(snapshot) - snapshot.live_count,
+            "compactions": self.compactions,
+        }
@@ -0,0 +1,157 @@
+"""
+Micro-Batched Query Embedding
+
+Every RAG query embeds one short text, which on CPU costs nearly as much as
+embedding a small batch: the per-call overhead of the model dominates. This
+module collects query texts from concurrent requests for a short window and
+embeds them with one batched call, handing each caller its own vector.
+
+No request waits longer than the window for its batch to be sent. When traffic
+is idle (nothing else queued and the previous batch held a single text) the
+window is skipped, so a lone request is embedded immediately.
+
+Configuration is read from the environment:
+    EMBED_BATCH_MAX_SIZE     Maximum texts per batched call (default 32)
+    EMBED_BATCH_MAX_WAIT_MS  How long to wait for more texts after the first (default 5)
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from typing import Callable, Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+EMBED_BATCH_MAX_SIZE = int(os.environ.get("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.environ.get("EMBED_BATCH_MAX_WAIT_MS", "5"))
+
+
+class _Request:
+    __slots__ = ("text", "done", "vector", "error")
+
+    def __init__(self, text):
+        self.text = text
+        self.done = threading.Event()
+        self.vector = None
+        self.error = None
+
+
+class EmbeddingBatcher:
+    """Gathers embedding requests from many threads into batched model calls."""
+
+    def __init__(self, embed_batch: Callable[[List[str]], List[List[float]]],
+                 max_batch_size=EMBED_BATCH_MAX_SIZE, max_wait_ms=EMBED_BATCH_MAX_WAIT_MS):
+        """
+        Initialize the batcher.
+
+        Args:
+            embed_batch: Function embedding a list of texts, e.g. a model's embed_documents
+            max_batch_size (int): Maximum texts per call to embed_batch
+            max_wait_ms (float): Time to keep collecting after the first text arrives
+        """
+        self.embed_batch = embed_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.batches = 0
+        self.texts = 0
+        self.largest_batch = 0
+        self._last_batch_size = 0
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def embed(self, text: str) -> List[float]:
+        """
+        Embed one text, sharing a model call with any concurrent requests.
+
+        Args:
+            text: Text to embed
+
+        Returns:
+            list: The embedding vector
+        """
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several texts for one caller; they join the same batch where possible.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            list: One embedding vector per text
+        """
+        self._ensure_worker()
+        requests = [_Request(text) for text in texts]
+        for request in requests:
+            self._queue.put(request)
+        for request in requests:
+            request.done.wait()
+            if request.error is not None:
+                raise request.error
+        return [request.vector for request in requests]
+
+    def _collect(self) -> List[_Request]:
+        """Block for the first request, then gather more until the batch is full or the window closes."""
+        batch = [self._queue.get()]
+        if self._queue.empty() and self._last_batch_size <= 1:
+            return batch
+
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+
+            # Identical texts (e.g. a retried message) are embedded once
+            unique_texts = list(dict.fromkeys(request.text for request in batch))
+            try:
+                vectors = dict(zip(unique_texts, self.embed_batch(unique_texts)))
+                for request in batch:
+                    request.vector = vectors[request.text]
+            except Exception as e:
+                logger.error(f"Error embedding batch of {len(unique_texts)} texts: {str(e)}")
+                for request in batch:
+                    request.error = e
+
+            with self._stats_lock:
+                self.batches += 1
+                self.texts += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+                self._last_batch_size = len(batch)
+
+            for request in batch:
+                request.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return batch counters."""
+        with self._stats_lock:
+            return {
+                'batches': self.batches,
+                'texts': self.texts,
+                'avg_batch_size': round(self.texts / self.batches, 2) if self.batches else 0.0,
+                'largest_batch': self.largest_batch,
+                'queue_depth': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+            }
@@ -0,0 +1,228 @@
+"""
+Persistent Vector Index Store for the RAG System
+
+This module saves the chunked knowledge base (chunk texts, metadata and the
+float32 embedding matrix) to a versioned on-disk artifact, so that later process
+starts can memory-map it instead of re-splitting and re-embedding every document.
+
+Artifacts are keyed by a content hash of the source documents together with the
+splitter and embedding settings, so any change to either produces a new artifact.
+
+Layout of one artifact:
+    <index_dir>/<key>/manifest.json   Format version, key, settings and chunk count
+    <index_dir>/<key>/chunks.json     Chunk texts and metadata
+    <index_dir>/<key>/embeddings.npy  L2-normalized float32 matrix, one row per chunk
+    <index_dir>/<key>/ann-<name>.npz  Optional approximate search index built from the matrix
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bump when the artifact layout changes so old artifacts are ignored
+# (2: embeddings are stored L2-normalized; 3: chunk metadata carries its document's doc_id)
+INDEX_FORMAT_VERSION = 3
+
+# Where artifacts are stored, configurable for containerised deployments
+RAG_INDEX_DIR = os.environ.get(
+    "RAG_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag_index")
+)
+
+
+class IndexArtifact:
+    """A loaded index artifact: chunk texts, their metadata and the embedding matrix."""
+
+    def __init__(self, key: str, texts: List[str], metadatas: List[Dict[str, Any]],
+                 embeddings: np.ndarray, settings: Dict[str, Any]):
+        self.key = key
+        self.texts = texts
+        self.metadatas = metadatas
+        self.embeddings = embeddings
+        self.settings = settings
+
+    def __len__(self):
+        return len(self.texts)
+
+
+def compute_index_key(documents: List[Dict[str, Any]], settings: Dict[str, Any]) -> str:
+    """
+    Compute the content hash that identifies an index artifact.
+
+    Args:
+        documents: Source documents as dicts with 'content' and 'metadata'
+        settings: Splitter and embedding settings that affect the chunks or vectors
+
+    Returns:
+        str: Hex digest identifying the documents + settings combination
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps({"version": INDEX_FORMAT_VERSION, "settings": settings}, sort_keys=True).encode('utf-8'))
+    for doc in documents:
+        digest.update(json.dumps(
+            {"content": doc.get('content', ''), "metadata": doc.get('metadata', {})},
+            sort_keys=True,
+            default=str
+        ).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load_index(key: str, index_dir: str = RAG_INDEX_DIR) -> Optional[IndexArtifact]:
+    """
+    Load an index artifact, memory-mapping its embedding matrix.
+
+    Args:
+        key: Key from compute_index_key()
+        index_dir: Directory holding the artifacts
+
+    Returns:
+        IndexArtifact or None if no valid artifact exists for the key
+    """
+    path = os.path.join(index_dir, key)
+    if not os.path.isdir(path):
+        return None
+
+    try:
+        with open(os.path.join(path, "manifest.json"), encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("version") != INDEX_FORMAT_VERSION or manifest.get("key") != key:
+            logger.warning(f"Ignoring index artifact {path} with mismatched version or key")
+            return None
+
+        with open(os.path.join(path, "chunks.json"), encoding='utf-8') as f:
+            chunks = json.load(f)
+        embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode='r')
+
+        if embeddings.shape[0] != len(chunks["texts"]) or len(chunks["texts"]) != manifest.get("count"):
+            logger.warning(f"Ignoring index artifact {path} with inconsistent chunk count")
+            return None
+
+        return IndexArtifact(key, chunks["texts"], chunks["metadatas"], embeddings, manifest.get("settings", {}))
+    except Exception as e:
+        logger.warning(f"Could not load index artifact {path}: {str(e)}")
+        return None
+
+
+def save_index(key: str, texts: List[str], metadatas: List[Dict[str, Any]], embeddings,
+               settings: Dict[str, Any], index_dir: str = RAG_INDEX_DIR) -> bool:
+    """
+    Save an index artifact atomically.
+
+    The artifact is written to a temporary directory and renamed into place, so a
+    crash mid-write never leaves a partial artifact under the final key.
+
+    Args:
+        key: Key from compute_index_key()
+        texts: Chunk texts
+        metadatas: Chunk metadata, one dict per chunk
+        embeddings: Embedding matrix or list of vectors, one row per chunk
+        settings: Settings recorded in the manifest
+        index_dir: Directory holding the artifacts
+
+    Returns:
+        bool: True if the artifact was written, False otherwise
+    """
+    matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if matrix.ndim != 2 or matrix.shape[0] != len(texts) or len(metadatas) != len(texts):
+        logger.error("Refusing to save index artifact with mismatched texts, metadata and embeddings")
+        return False
+
+    final_path = os.path.join(index_dir, key)
+    tmp_path = None
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix=f".{key[:12]}-", dir=index_dir)
+
+        with open(os.path.join(tmp_path, "chunks.json"), 'w', encoding='utf-8') as f:
+            json.dump({"texts": texts, "metadatas": metadatas}, f)
+        np.save(os.path.join(tmp_path, "embeddings.npy"), matrix)
+        with open(os.path.join(tmp_path, "manifest.json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": INDEX_FORMAT_VERSION,
+                "key": key,
+                "settings": settings,
+                "count": len(texts),
+                "dimensions": int(matrix.shape[1]),
+            }, f, indent=2)
+
+        if os.path.isdir(final_path):
+            shutil.rmtree(final_path)
+        os.replace(tmp_path, final_path)
+        logger.info(f"Saved index artifact with {len(texts)} chunks to {final_path}")
+        return True
+    except Exception as e:
+        logger.error(f"Error saving index artifact: {str(e)}")
+        if tmp_path and os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return False
+
+
+def _ann_path(key: str, name: str, index_dir: str) -> str:
+    return os.path.join(index_dir, key, f"ann-{name}.npz")
+
+
+def load_ann_index(key: str, name: str, params: Dict[str, Any],
+                   index_dir: str = RAG_INDEX_DIR) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Load the arrays of an approximate search index stored with an artifact.
+
+    Args:
+        key: Key of the artifact the index was built from
+        name: Index type, e.g. "ivf"
+        params: Build parameters; a stored index built with different ones is ignored
+
+    Returns:
+        dict of arrays, or None if no matching index is stored
+    """
+    path = _ann_path(key, name, index_dir)
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if json.loads(str(data["params"])) != json.loads(json.dumps(params, sort_keys=True)):
+                logger.info(f"Ignoring {name} index at {path} built with different parameters")
+                return None
+            return {field: data[field] for field in data.files if field != "params"}
+    except Exception as e:
+        logger.warning(f"Could not load {name} index {path}: {str(e)}")
+        return None
+
+
+def save_ann_index(key: str, name: str, arrays: Dict[str, np.ndarray], params: Dict[str, Any],
+                   index_dir: str = RAG_INDEX_DIR) -> bool:
+    """
+    Save an approximate search index next to the artifact it was built from.
+
+    Args:
+        key: Key of the artifact the index was built from
+        name: Index type, e.g. "ivf"
+        arrays: The index's trained arrays
+        params: Build parameters, checked again by load_ann_index()
+
+    Returns:
+        bool: True if the index was written, False otherwise
+    """
+    path = _ann_path(key, name, index_dir)
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".npz.tmp")
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, params=np.array(json.dumps(params, sort_keys=True)), **arrays)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved {name} index to {path}")
+        return True
+    except Exception as e:
+        logger.error(f"Error saving {name} index: {str(e)}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
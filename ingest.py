@@ -0,0 +1,470 @@
+"""
+Streaming File Ingestion for the RAG System
+
+This module turns a corpus of local files into chunk texts, metadata and
+normalized embedding vectors without holding the corpus in memory. Files flow
+through four stages:
+
+    parse + chunk   in a process pool, a bounded number of files ahead
+    embed           in batches of chunks, with the caller's embedding model
+    append          to append-only chunk and vector files in a work directory
+    journal         one record per finished file, written after its rows are on disk
+
+The journal makes ingestion resumable: after a crash, rows past the last
+journaled file are truncated away and only files that are new or changed
+(by size and modification time) are processed again. Within those files, the
+chunks of unchanged documents and the vectors of unchanged chunks come from the
+content cache (content_cache.py) instead of the splitter and the model.
+
+Supported formats: .txt and .md (one document per file), .jsonl (one document
+per line, with "content" or "text" and optional "metadata" and "id"), and
+.html/.htm (visible text, with the page title in the metadata).
+
+Configuration is read from the environment:
+    INGEST_WORKERS             Chunking processes, 0 to chunk in-process (default CPU count - 1)
+    INGEST_EMBED_BATCH         Chunks per embedding call (default 64)
+    INGEST_MAX_PENDING_FILES   Files parsed and chunked ahead of embedding (default 64)
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import deque
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from index_store import RAG_INDEX_DIR
+from content_cache import ContentCache, cached_split, cached_embed, splitter_settings
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", str(max(0, (os.cpu_count() or 1) - 1))))
+INGEST_EMBED_BATCH = int(os.environ.get("INGEST_EMBED_BATCH", "64"))
+INGEST_MAX_PENDING_FILES = int(os.environ.get("INGEST_MAX_PENDING_FILES", "64"))
+
+SUPPORTED_EXTENSIONS = ('.txt', '.md', '.jsonl', '.html', '.htm')
+
+# Bump when the work directory layout changes so old journals are not resumed
+# (2: chunk metadata carries a doc_id; 3: jsonl records keep their own doc_id)
+INGEST_FORMAT_VERSION = 3
+
+
+class _HTMLText(HTMLParser):
+    """Collects the visible text and title of an HTML page."""
+
+    SKIPPED_TAGS = {'script', 'style', 'noscript', 'template'}
+    BLOCK_TAGS = {'p', 'div', 'br', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'section', 'article'}
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self.title = ""
+        self._skip_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag == 'title':
+            self._in_title = True
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == 'title':
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self.parts.append(data)
+
+    def text(self) -> str:
+        lines = (" ".join(line.split()) for line in "".join(self.parts).splitlines())
+        return "\n".join(line for line in lines if line)
+
+
+def parse_file(path: str) -> List[Dict[str, Any]]:
+    """
+    Read a file into documents with 'content' and 'metadata'.
+
+    Args:
+        path: Path to a .txt, .md, .jsonl, .html or .htm file
+
+    Returns:
+        List of documents (empty for unsupported or empty files)
+    """
+    extension = os.path.splitext(path)[1].lower()
+    base_metadata = {"source": path, "format": extension.lstrip('.')}
+
+    with open(path, encoding='utf-8', errors='replace') as f:
+        if extension == '.jsonl':
+            documents = []
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                content = record.get("content") or record.get("text") or ""
+                metadata = {**base_metadata, "line": line_number, **record.get("metadata", {})}
+                metadata.setdefault("doc_id", str(record["id"]) if "id" in record else f"{path}:{line_number}")
+                if content.strip():
+                    documents.append({"content": content, "metadata": metadata})
+            return documents
+
+        text = f.read()
+
+    if extension in ('.html', '.htm'):
+        parser = _HTMLText()
+        parser.feed(text)
+        text = parser.text()
+        if parser.title.strip():
+            base_metadata["title"] = parser.title.strip()
+    elif extension not in ('.txt', '.md'):
+        return []
+
+    # A whole file is one document, identified by its path; jsonl records carry their own ids
+    base_metadata["doc_id"] = path
+    return [{"content": text, "metadata": base_metadata}] if text.strip() else []
+
+
+# One splitter and cache connection per process, opened on first use (loading the tokenizer is not free)
+_splitters = {}
+_caches = {}
+
+
+def split_file(path: str, chunk_size: int, chunk_overlap: int, cache_dir: Optional[str] = None,
+               cache_settings: Optional[Dict[str, Any]] = None) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Parse and chunk one file; runs in the worker processes.
+
+    Args:
+        path: File to read
+        chunk_size: Splitter chunk size in tokens
+        chunk_overlap: Splitter chunk overlap in tokens
+        cache_dir: Content cache directory to reuse chunks from, or None
+        cache_settings: Splitter settings keying the chunks cache
+
+    Returns:
+        List of (chunk text, metadata) pairs
+    """
+    splitter = _splitters.get((chunk_size, chunk_overlap))
+    if splitter is None:
+        splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        )
+        _splitters[(chunk_size, chunk_overlap)] = splitter
+
+    cache = None
+    if cache_dir:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = _caches[cache_dir] = ContentCache(cache_dir, evict=False)
+
+    documents = parse_file(path)
+    splits = cached_split(cache, splitter.split_text, cache_settings or {},
+                          [document["content"] for document in documents])
+    return [
+        (text, document["metadata"])
+        for document, texts in zip(documents, splits)
+        for text in texts
+    ]
+
+
+def expand_paths(paths: List[str]) -> List[str]:
+    """Expand directories into the supported files below them, in a stable order."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(
+                    os.path.join(root, name) for name in sorted(names)
+                    if name.lower().endswith(SUPPORTED_EXTENSIONS)
+                )
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+
+class IngestResult:
+    """Chunks and vectors of an ingested corpus."""
+
+    def __init__(self, key: str, texts: List[str], metadatas: List[Dict[str, Any]], vectors: np.ndarray):
+        self.key = key
+        self.texts = texts
+        self.metadatas = metadatas
+        self.vectors = vectors
+
+    def __len__(self):
+        return len(self.texts)
+
+
+class IngestionPipeline:
+    """Resumable parse → chunk → embed → append pipeline over local files."""
+
+    def __init__(self, embed_documents: Callable[[List[str]], List[List[float]]], settings: Dict[str, Any],
+                 chunk_size: int, chunk_overlap: int, workers: int = INGEST_WORKERS,
+                 embed_batch_size: int = INGEST_EMBED_BATCH, max_pending_files: int = INGEST_MAX_PENDING_FILES,
+                 index_dir: str = RAG_INDEX_DIR, progress_interval: float = 5.0,
+                 cache: Optional[ContentCache] = None):
+        """
+        Initialize the pipeline.
+
+        Args:
+            embed_documents: Function embedding a list of chunk texts
+            settings: Chunking and embedding settings; a different set uses a separate work directory
+            chunk_size: Splitter chunk size in tokens
+            chunk_overlap: Splitter chunk overlap in tokens
+            workers: Chunking processes (0 chunks in the calling process)
+            embed_batch_size: Chunks per embedding call
+            max_pending_files: Files chunked ahead of the embedding stage (bounds memory)
+            index_dir: Directory under which the work directory is created
+            progress_interval: Seconds between progress log lines
+            cache: Content cache for chunks and vectors of unchanged content, or None
+        """
+        self.embed_documents = embed_documents
+        self.settings = dict(settings, ingest_version=INGEST_FORMAT_VERSION)
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.workers = workers
+        self.embed_batch_size = max(1, embed_batch_size)
+        self.max_pending_files = max(1, max_pending_files)
+        self.progress_interval = progress_interval
+        self.cache = cache
+        self.model_name = settings.get("embedding_model", "")
+        self.split_args = (chunk_size, chunk_overlap, cache.directory if cache else None, splitter_settings(settings))
+
+        settings_key = hashlib.sha256(json.dumps(self.settings, sort_keys=True).encode('utf-8')).hexdigest()
+        self.work_dir = os.path.join(index_dir, "ingest", settings_key[:16])
+        self.chunks_path = os.path.join(self.work_dir, "chunks.jsonl")
+        self.vectors_path = os.path.join(self.work_dir, "vectors.f32")
+        self.journal_path = os.path.join(self.work_dir, "journal.jsonl")
+
+        self.dimensions = None
+        self.rows = 0
+        self.chunk_bytes = 0
+        self.journal = {}  # path -> latest journal entry
+
+    # -- Recovery ---------------------------------------------------------------
+
+    def _recover(self) -> None:
+        """Load the journal and truncate rows written after its last entry (an interrupted run)."""
+        os.makedirs(self.work_dir, exist_ok=True)
+        last = None
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn final line from a crash
+                    self.journal[entry["path"]] = entry
+                    last = entry
+
+        self.rows = last["rows_end"] if last else 0
+        self.chunk_bytes = last["chunk_bytes_end"] if last else 0
+        self.dimensions = last.get("dimensions") if last else None
+
+        for path, size in ((self.chunks_path, self.chunk_bytes),
+                           (self.vectors_path, self.rows * 4 * (self.dimensions or 0))):
+            with open(path, 'ab') as f:
+                if f.tell() != size:
+                    logger.info(f"Truncating {path} from {f.tell()} to {size} bytes after an interrupted run")
+                    f.truncate(size)
+
+        # Rewrite a journal with a torn tail so later appends start on a clean line
+        if last is not None:
+            with open(self.journal_path, 'rb') as f:
+                content = f.read()
+            if not content.endswith(b"\n"):
+                with open(self.journal_path, 'wb') as f:
+                    f.write(content[:content.rfind(b"\n") + 1])
+
+    @staticmethod
+    def _fingerprint(path: str) -> Dict[str, int]:
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _is_current(self, path: str) -> bool:
+        entry = self.journal.get(path)
+        if entry is None:
+            return False
+        try:
+            fingerprint = self._fingerprint(path)
+        except OSError:
+            return False
+        return entry["size"] == fingerprint["size"] and entry["mtime_ns"] == fingerprint["mtime_ns"]
+
+    # -- Stages ------------------------------------------------------------------
+
+    def _chunked_files(self, paths: List[str]):
+        """Yield (path, fingerprint, chunks) in input order, chunking at most max_pending_files ahead."""
+        if self.workers <= 0:
+            for path in paths:
+                try:
+                    fingerprint = self._fingerprint(path)
+                    yield path, fingerprint, split_file(path, *self.split_args)
+                except Exception as e:
+                    logger.error(f"Error ingesting {path}: {str(e)}")
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            remaining = iter(paths)
+            for path in remaining:
+                pending.append((path, pool.submit(split_file, path, *self.split_args)))
+                if len(pending) >= self.max_pending_files:
+                    break
+
+            while pending:
+                path, future = pending.popleft()
+                next_path = next(remaining, None)
+                if next_path is not None:
+                    pending.append((next_path, pool.submit(split_file, next_path, *self.split_args)))
+                try:
+                    fingerprint = self._fingerprint(path)
+                    yield path, fingerprint, future.result()
+                except Exception as e:
+                    logger.error(f"Error ingesting {path}: {str(e)}")
+
+    def _flush(self, batch: List[Tuple[str, Dict[str, int], List[Tuple[str, Dict[str, Any]]]]]) -> None:
+        """Embed the chunks of finished files, append them, then journal the files."""
+        texts = [text for _, _, chunks in batch for text, _ in chunks]
+        if texts:
+            matrix = cached_embed(self.cache, self.embed_documents, self.model_name, texts,
+                                  batch_size=self.embed_batch_size)
+            self.dimensions = self.dimensions or int(matrix.shape[1])
+            with open(self.vectors_path, 'ab') as f:
+                f.write(matrix.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        entries = []
+        with open(self.chunks_path, 'ab') as f:
+            for path, fingerprint, chunks in batch:
+                rows_start = self.rows
+                for text, metadata in chunks:
+                    line = (json.dumps({"text": text, "metadata": metadata}) + "\n").encode('utf-8')
+                    f.write(line)
+                    self.chunk_bytes += len(line)
+                    self.rows += 1
+                entries.append(dict(
+                    path=path, rows_start=rows_start, rows_end=self.rows, chunk_bytes_end=self.chunk_bytes,
+                    dimensions=self.dimensions, **fingerprint
+                ))
+            f.flush()
+            os.fsync(f.fileno())
+
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+                self.journal[entry["path"]] = entry
+            f.flush()
+            os.fsync(f.fileno())
+
+    # -- Driver ------------------------------------------------------------------
+
+    def run(self, paths: List[str], progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> IngestResult:
+        """
+        Ingest files (and directories of files), resuming any earlier interrupted run.
+
+        Args:
+            paths: Files or directories to ingest
+            progress: Optional callback receiving a progress dict after each flush
+
+        Returns:
+            IngestResult: Chunks and vectors of exactly the given files
+        """
+        files = expand_paths(paths)
+        self._recover()
+        todo = [path for path in files if not self._is_current(path)]
+        logger.info(f"Ingesting {len(todo)} of {len(files)} files ({len(files) - len(todo)} already indexed) "
+                    f"into {self.work_dir}")
+
+        started = last_report = time.monotonic()
+        done_files = done_chunks = 0
+        batch, batch_chunks = [], 0
+        for path, fingerprint, chunks in self._chunked_files(todo):
+            batch.append((path, fingerprint, chunks))
+            batch_chunks += len(chunks)
+            if batch_chunks < self.embed_batch_size:
+                continue
+
+            self._flush(batch)
+            done_files += len(batch)
+            done_chunks += batch_chunks
+            batch, batch_chunks = [], 0
+
+            now = time.monotonic()
+            report = self._progress(done_files, len(todo), done_chunks, now - started)
+            if progress:
+                progress(report)
+            if now - last_report >= self.progress_interval:
+                last_report = now
+                logger.info(f"Ingested {report['files_done']}/{report['files_total']} files, "
+                            f"{report['chunks_done']} chunks ({report['chunks_per_second']} chunks/s)")
+
+        if batch:
+            self._flush(batch)
+            done_files += len(batch)
+            done_chunks += batch_chunks
+
+        if self.cache is not None:
+            self.cache.trim()  # workers write to the cache without enforcing its budget
+
+        report = self._progress(done_files, len(todo), done_chunks, time.monotonic() - started)
+        if progress:
+            progress(report)
+        logger.info(f"Ingestion finished: {report['files_done']} files, {report['chunks_done']} chunks "
+                    f"in {report['elapsed_s']} s ({report['chunks_per_second']} chunks/s)")
+        return self._result(files)
+
+    @staticmethod
+    def _progress(files_done, files_total, chunks_done, elapsed) -> Dict[str, Any]:
+        return {
+            'files_done': files_done,
+            'files_total': files_total,
+            'chunks_done': chunks_done,
+            'elapsed_s': round(elapsed, 1),
+            'files_per_second': round(files_done / elapsed, 1) if elapsed else 0.0,
+            'chunks_per_second': round(chunks_done / elapsed, 1) if elapsed else 0.0,
+        }
+
+    def _result(self, files: List[str]) -> IngestResult:
+        """Collect the rows of the requested files; rows of changed or removed files are skipped."""
+        entries = [self.journal[path] for path in files if path in self.journal]
+        key = hashlib.sha256(json.dumps(
+            [self.settings] + [[e["path"], e["size"], e["mtime_ns"], e["rows_start"], e["rows_end"]] for e in entries]
+        ).encode('utf-8')).hexdigest()
+
+        if not self.rows or not self.dimensions:
+            return IngestResult(key, [], [], np.zeros((0, self.dimensions or 1), dtype=np.float32))
+
+        keep = np.zeros(self.rows, dtype=bool)
+        for entry in entries:
+            keep[entry["rows_start"]:entry["rows_end"]] = True
+
+        texts, metadatas = [], []
+        with open(self.chunks_path, encoding='utf-8') as f:
+            for row, line in enumerate(f):
+                if row >= self.rows:
+                    break
+                if keep[row]:
+                    record = json.loads(line)
+                    texts.append(record["text"])
+                    metadatas.append(record["metadata"])
+
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(self.rows, self.dimensions))
+        if not keep.all():
+            vectors = np.ascontiguousarray(vectors[keep])
+        return IngestResult(key, texts, metadatas, vectors)
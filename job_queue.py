@@ -0,0 +1,253 @@
+"""
+In-Process Background Job Queue for Long-Running LLM Work
+
+Work such as generating a clinical report is a full LLM generation. Run inline,
+it holds an HTTP worker for the whole generation, and a closed browser tab
+still pays for it. Routes instead submit a job and return at once; a pool of
+worker threads runs the jobs and the page polls GET /jobs/<id> for the result.
+
+    submit    returns a job id immediately; submitting a job identical to one
+              that is still queued or running (same kind and dedup key)
+              returns the existing job instead of queuing the work twice
+    run       a worker calls the handler registered for the job's kind
+    poll      job status ("queued", "running", "done", "failed"), result and
+              error are kept in the application database (see storage.py)
+
+Jobs still queued or running when the process stops are queued again when
+their handler is registered after a restart, so their results are not lost.
+Finished jobs are kept only for a while: at start-up and then every few
+minutes, done and failed jobs past the retention limits are deleted.
+
+Configuration is read from the environment:
+    JOB_WORKERS            Jobs run concurrently (default 2)
+    JOB_MAX_QUEUE          Maximum queued jobs, 0 for no limit (default 256)
+    JOB_RETENTION_SECONDS  Finished jobs older than this are deleted, 0 to keep them (default 604800, a week)
+    JOB_MAX_FINISHED       Finished jobs kept at most, the newest, 0 for no limit (default 10000)
+"""
+
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_MAX_QUEUE = int(os.environ.get("JOB_MAX_QUEUE", "256"))
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", "604800"))
+JOB_MAX_FINISHED = int(os.environ.get("JOB_MAX_FINISHED", "10000"))
+
+# Recent job runtimes kept for the runtime percentiles in stats()
+RUNTIME_SAMPLES = 512
+
+# Seconds between deletions of finished jobs past the retention limits
+PRUNE_INTERVAL = 600
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at its limit."""
+
+
+class JobQueue:
+    """Worker pool running registered job kinds, with persisted status and deduplication."""
+
+    def __init__(self, storage=None, workers: int = JOB_WORKERS, max_queue: int = JOB_MAX_QUEUE,
+                 retention_seconds: float = JOB_RETENTION_SECONDS, max_finished: int = JOB_MAX_FINISHED):
+        """
+        Initialize the queue and start the workers.
+
+        Args:
+            storage: Store with put_job/get_job/unfinished_jobs/prune_jobs (e.g. storage.Storage),
+                or None to keep job state in memory only
+            workers: Jobs run concurrently
+            max_queue: Maximum queued jobs (0 for no limit)
+            retention_seconds: Finished jobs older than this are deleted (0 to keep them)
+            max_finished: Finished jobs kept at most (0 for no limit)
+        """
+        self.storage = storage
+        self.max_queue = max_queue
+        self.retention_seconds = retention_seconds
+        self.max_finished = max_finished
+        self._last_prune = None  # monotonic time of the last prune, None until the first
+        self._handlers = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._jobs = {}     # job id -> job, while queued or running
+        self._active = {}   # (kind, dedup key) -> job id, while queued or running
+        self._runtimes = deque(maxlen=RUNTIME_SAMPLES)
+
+        self.submitted = 0
+        self.deduplicated = 0
+        self.completed = 0
+        self.failed = 0
+        self.recovered = 0
+        self.pruned = 0
+        self.running = 0
+
+        self._workers = [
+            threading.Thread(target=self._work_loop, name=f"job-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def register(self, kind: str, handler: Callable[[Dict[str, Any]], Any]) -> None:
+        """
+        Register the handler of a job kind and queue again any of its jobs left unfinished by a restart.
+
+        Args:
+            kind: Job kind, e.g. "clinical_report"
+            handler: Called with the job's payload; its (JSON-serializable) return value is the job result
+        """
+        self._handlers[kind] = handler
+        if self.storage is None:
+            return
+        self._prune()
+        unfinished = self.storage.unfinished_jobs(kind)
+        for job in unfinished:
+            job = dict(job, status='queued', started_at=None)
+            with self._lock:
+                self._jobs[job['id']] = job
+                if job.get('dedup_key') is not None:
+                    self._active[(kind, job['dedup_key'])] = job['id']
+                self.recovered += 1
+            self._save(job)
+            self._queue.put(job['id'])
+        if unfinished:
+            logger.info(f"Queued {len(unfinished)} unfinished '{kind}' jobs again after restart")
+
+    def submit(self, kind: str, payload: Dict[str, Any], dedup_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Queue a job, or return the pending job with the same kind and dedup key.
+
+        Args:
+            kind: Registered job kind
+            payload: JSON-serializable arguments passed to the handler
+            dedup_key: Jobs with the same kind and key are identical while one is pending
+
+        Returns:
+            The job record (a copy); its 'id' is what GET /jobs/<id> takes
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        with self._lock:
+            existing = self._active.get((kind, dedup_key)) if dedup_key is not None else None
+            if existing is not None:
+                self.deduplicated += 1
+                return dict(self._jobs[existing])
+            if self.max_queue and self._queue.qsize() >= self.max_queue:
+                raise JobQueueFull(f"{self._queue.qsize()} jobs are already queued")
+            job = {
+                'id': uuid.uuid4().hex,
+                'kind': kind,
+                'dedup_key': dedup_key,
+                'payload': payload,
+                'status': 'queued',
+                'result': None,
+                'error': None,
+                'created_at': datetime.now().isoformat(),
+                'started_at': None,
+                'finished_at': None,
+                'runtime_ms': None,
+            }
+            self._jobs[job['id']] = job
+            if dedup_key is not None:
+                self._active[(kind, dedup_key)] = job['id']
+            self.submitted += 1
+        self._save(job)
+        self._queue.put(job['id'])
+        return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job record, or None if there is no such job."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        if self.storage is None:
+            return None
+        return self.storage.get_job(job_id)
+
+    def _save(self, job: Dict[str, Any]) -> None:
+        if self.storage is not None:
+            self.storage.put_job(dict(job))
+
+    def _prune(self) -> None:
+        """Delete stored finished jobs past the retention limits, at most once per PRUNE_INTERVAL."""
+        with self._lock:
+            now = time.monotonic()
+            if self._last_prune is not None and now - self._last_prune < PRUNE_INTERVAL:
+                return
+            self._last_prune = now
+        try:
+            pruned = self.storage.prune_jobs(self.retention_seconds, self.max_finished)
+        except Exception as e:
+            logger.error(f"Error deleting old finished jobs: {str(e)}")
+            return
+        if pruned:
+            logger.info(f"Deleted {pruned} finished jobs past the retention limits")
+            with self._lock:
+                self.pruned += pruned
+
+    def _work_loop(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                job = self._jobs[job_id]
+                job.update(status='running', started_at=datetime.now().isoformat())
+                self.running += 1
+            self._save(job)
+            self._run(job)
+            if self.storage is not None:
+                self._prune()
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        start = time.perf_counter()
+        try:
+            result, error = self._handlers[job['kind']](job['payload']), None
+        except Exception as e:
+            logger.error(f"Background job {job['id']} ({job['kind']}) failed: {str(e)}")
+            result, error = None, str(e)
+        runtime = time.perf_counter() - start
+
+        with self._lock:
+            job.update(
+                status='failed' if error is not None else 'done',
+                result=result,
+                error=error,
+                finished_at=datetime.now().isoformat(),
+                runtime_ms=int(runtime * 1000),
+            )
+            # Persist before forgetting it so a poll never sees the job vanish
+            self._save(job)
+            del self._jobs[job['id']]
+            if self._active.get((job['kind'], job['dedup_key'])) == job['id']:
+                del self._active[(job['kind'], job['dedup_key'])]
+            self.running -= 1
+            self._runtimes.append(runtime)
+            if error is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, job runtimes and failure counts for monitoring."""
+        with self._lock:
+            runtimes = sorted(self._runtimes)
+            return {
+                'workers': len(self._workers),
+                'queued': self._queue.qsize(),
+                'running': self.running,
+                'submitted': self.submitted,
+                'deduplicated': self.deduplicated,
+                'recovered': self.recovered,
+                'pruned': self.pruned,
+                'completed': self.completed,
+                'failed': self.failed,
+                'avg_runtime_ms': round(1000 * sum(runtimes) / len(runtimes), 1) if runtimes else 0.0,
+                'p95_runtime_ms': round(1000 * runtimes[int(0.95 * (len(runtimes) - 1))], 1) if runtimes else 0.0,
+            }
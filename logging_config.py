@@ -0,0 +1,79 @@
+"""
+Leveled, Structured Logging for the Chatbot
+
+Every module logs through `logging.getLogger(__name__)`; this module installs
+one handler on the root logger so the whole process shares a level and format.
+Context for a log line is passed as `extra` fields, e.g.
+
+    logger.info("RAG answer generated", extra={'endpoint': 'chat', 'chars': 512})
+
+and is appended as key=value pairs in text mode, or as JSON keys in JSON mode
+(one object per line, for log shippers).
+
+Configuration is read from the environment:
+    LOG_LEVEL    Minimum level logged: DEBUG, INFO, WARNING or ERROR (default INFO)
+    LOG_FORMAT   "text" (default) or "json"
+"""
+
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def extra_fields(record: logging.LogRecord) -> dict:
+    """The structured fields passed to a log call through `extra`."""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class TextFormatter(logging.Formatter):
+    """The classic one-line format, followed by the structured fields as key=value pairs."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the time, level, logger, message and structured fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(extra_fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+    """Install the process-wide log handler once; later calls are no-ops."""
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter(TEXT_FORMAT))
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(getattr(logging, level, logging.INFO))
+        _configured = True
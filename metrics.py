@@ -0,0 +1,306 @@
+"""
+Per-Stage Latency Metrics and Prometheus Exposition
+
+A chat reply passes through several stages, any of which can be the slow one:
+
+    crisis_check       scanning the message for crisis language (crisis_detector.py)
+    queue_wait         waiting for a generation slot (scheduler.py)
+    retrieval_embed    embedding the question for retrieval
+    retrieval_search   vector search over the knowledge base
+    prompt_build       adaptive system prompt, RAG context and prompt formatting
+    llm_ttft           from sending the prompt to the first generated token (streamed replies)
+    llm_total          from sending the prompt to the end of generation
+    postprocess        storing the conversation and building the reply
+
+Each request gets a RequestTimer. It is carried in a context variable, so code
+deep in the call stack (the RAG handler, the Ollama client) records its stage
+with record_stage() without the timer being passed around. When the request
+finishes, every stage is observed in a histogram labelled by endpoint, model
+and path ("rag", "rag_cached", "direct", "clinical_flow" or "crisis"). GET /metrics
+renders all metrics in the Prometheus text format. A request whose client
+disconnects is counted by the stage it was abandoned in ("queue" or
+"generation") instead of being observed.
+
+The metrics are implemented here (no client library needed): fixed-bucket
+histograms, counters and gauges read from callbacks at scrape time.
+"""
+
+import time
+import math
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Callable, Tuple
+
+STAGES = ("crisis_check", "queue_wait", "retrieval_embed", "retrieval_search", "prompt_build", "llm_ttft", "llm_total", "postprocess")
+
+# Upper bounds in seconds; generation stages reach minutes on CPU-only hosts
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram with labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labelnames, key)} {_format_value(values[-2])}"
+            yield f"{self.name}_count{_label_text(self.labelnames, key)} {values[-1]}"
+
+
+class Counter:
+    """Monotonically increasing count with labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_label_text(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge:
+    """Current value read from a callback at scrape time (e.g. a queue depth from a stats() dict)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], Optional[float]]):
+        self.name = name
+        self.help = help_text
+        self.read = read
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception:
+            value = None
+        if value is not None:
+            yield f"{self.name} {_format_value(value)}"
+
+
+class Registry:
+    """The set of metrics rendered by /metrics."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # Re-registering a name (e.g. a module reloaded in tests) keeps the existing metric
+            return self._metrics.setdefault(metric.name, metric)
+
+    def histogram(self, name: str, help_text: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def counter(self, name: str, help_text: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], Optional[float]]) -> Gauge:
+        return self.register(Gauge(name, help_text, read))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "chatbot_stage_duration_seconds",
+    "Time spent in each stage of a chat request.",
+    ("endpoint", "model", "path", "stage"),
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "chatbot_request_duration_seconds",
+    "End-to-end time of a chat request, until the reply (or last streamed token) is sent.",
+    ("endpoint", "model", "path"),
+)
+REQUESTS_CANCELLED = REGISTRY.counter(
+    "chatbot_requests_cancelled_total",
+    "Chat requests abandoned because the client disconnected, by the stage they were in.",
+    ("endpoint", "stage"),
+)
+
+_current_timer = contextvars.ContextVar("request_timer", default=None)
+
+
+class RequestTimer:
+    """Stage durations of one request, observed with the request's final labels when it finishes."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.model = "none"
+        self.path = None
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.finished = False
+
+    @property
+    def elapsed_ms(self) -> int:
+        """Milliseconds since the request started."""
+        return int((time.perf_counter() - self.start) * 1000)
+
+    def add(self, stage: str, seconds: float, model: Optional[str] = None) -> None:
+        """Add time to a stage (repeated stages, e.g. two prompt-building steps, accumulate)."""
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        if model:
+            self.model = model
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Time the enclosed block as a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def finish(self, path: Optional[str] = None) -> None:
+        """
+        Observe the stages and the total duration; later calls do nothing.
+
+        Args:
+            path: The request's path label, unless a stage already set one (e.g. "rag_cached")
+        """
+        if self.finished:
+            return
+        self.finished = True
+        labels = {'endpoint': self.endpoint, 'model': self.model, 'path': self.path or path or "direct"}
+        for stage, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, stage=stage, **labels)
+        REQUEST_SECONDS.observe(time.perf_counter() - self.start, **labels)
+
+    def cancel(self, stage: str) -> None:
+        """
+        Count the request as cancelled by its client instead of observing its timings; later calls do nothing.
+
+        Args:
+            stage: Where the request was abandoned, "queue" or "generation"
+        """
+        if self.finished:
+            return
+        self.finished = True
+        REQUESTS_CANCELLED.inc(endpoint=self.endpoint, stage=stage)
+
+
+def start_request(endpoint: str) -> RequestTimer:
+    """Create the timer for the current request and make it the one record_stage() reports to."""
+    timer = RequestTimer(endpoint)
+    activate(timer)
+    return timer
+
+
+def activate(timer: Optional[RequestTimer]) -> None:
+    """
+    Make a timer current in this context, e.g. in a streamed response body that the
+    server may iterate outside the context the request handler ran in.
+    """
+    _current_timer.set(timer)
+
+
+def current_timer() -> Optional[RequestTimer]:
+    """The timer of the request being handled in this context, if any."""
+    return _current_timer.get()
+
+
+def record_stage(stage: str, seconds: float, model: Optional[str] = None) -> None:
+    """Add time to a stage of the current request; a no-op outside a timed request."""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.add(stage, seconds, model)
+
+
+def set_path(path: str) -> None:
+    """Label the current request's path (e.g. "rag_cached" on a semantic cache hit)."""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.path = path
+
+
+@contextmanager
+def timed_stage(stage: str):
+    """Time the enclosed block as a stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def render() -> str:
+    """The /metrics response body."""
+    return REGISTRY.render()
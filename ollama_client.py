@@ -0,0 +1,418 @@
+"""
+Shared Ollama API Client
+
+This module provides the single HTTP client used for every call to the Ollama API.
+It keeps a pool of keep-alive connections, applies per-call deadlines, retries
+transient failures with exponential backoff and strips <think> sections from
+model output (see response_filters.py). Generation time (and time to first token when streaming) is
+recorded as stages of the current request (see metrics.py).
+
+Configuration is read from the environment:
+    OLLAMA_BASE_URL       Base URL of the Ollama server (default http://localhost:11434)
+    OLLAMA_POOL_SIZE      Maximum number of pooled connections (default 10)
+    OLLAMA_MAX_RETRIES    Retries for connection errors and 5xx responses (default 2)
+    OLLAMA_RETRY_BACKOFF  Initial backoff in seconds, doubled per retry (default 0.5)
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+import asyncio
+from typing import Dict, Any, List, Optional, Iterator, AsyncIterator
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import record_stage
+from response_filters import ResponseFilter, strip_think, filter_stream, afilter_stream
+
+# httpx is only needed for the async (ASGI) serving mode
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", "10"))
+OLLAMA_MAX_RETRIES = int(os.environ.get("OLLAMA_MAX_RETRIES", "2"))
+OLLAMA_RETRY_BACKOFF = float(os.environ.get("OLLAMA_RETRY_BACKOFF", "0.5"))
+
+class OllamaError(Exception):
+    """Raised when the Ollama API answers with a non-success status."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Error from Ollama API: {status_code} - {message}")
+        self.status_code = status_code
+
+
+class OllamaClient:
+    """
+    Pooled, keep-alive client for the Ollama HTTP API.
+
+    One instance is shared by the whole process (see get_client()). The size of the
+    connection pool bounds how many requests can talk to Ollama at the same time;
+    callers beyond that wait for a free connection.
+    """
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, pool_size=OLLAMA_POOL_SIZE,
+                 max_retries=OLLAMA_MAX_RETRIES, retry_backoff=OLLAMA_RETRY_BACKOFF,
+                 connect_timeout=5):
+        """
+        Initialize the client.
+
+        Args:
+            base_url (str): Base URL of the Ollama server
+            pool_size (int): Maximum number of pooled keep-alive connections
+            max_retries (int): Retries for connection errors and 5xx responses
+            retry_backoff (float): Initial backoff in seconds, doubled on every retry
+            connect_timeout (float): Timeout for establishing a connection
+        """
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.connect_timeout = connect_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _request(self, method: str, path: str, timeout: float, **kwargs) -> requests.Response:
+        """
+        Send a request, retrying connection errors and 5xx responses until the deadline.
+
+        Args:
+            method: HTTP method
+            path: API path such as "/api/generate"
+            timeout: Deadline in seconds for the whole call including retries
+            **kwargs: Passed through to requests
+
+        Returns:
+            requests.Response: A successful (2xx) response
+
+        Raises:
+            OllamaError: If Ollama answers with an error status
+            requests.exceptions.RequestException: If Ollama cannot be reached in time
+        """
+        deadline = time.monotonic() + timeout
+        attempt = 0
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise requests.exceptions.Timeout(f"Ollama call exceeded its {timeout}s deadline")
+
+            try:
+                response = self.session.request(
+                    method,
+                    self.base_url + path,
+                    timeout=(min(self.connect_timeout, remaining), remaining),
+                    **kwargs
+                )
+            except requests.exceptions.ConnectionError as e:
+                error = e
+            else:
+                if response.status_code < 400:
+                    return response
+                error = OllamaError(response.status_code, response.text)
+                response.close()
+                if response.status_code < 500:
+                    raise error
+
+            delay = self.retry_backoff * (2 ** attempt)
+            if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                raise error
+
+            attempt += 1
+            logger.warning(f"Ollama call to {path} failed ({error}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+    @staticmethod
+    def _generate_payload(prompt, model, stream, temperature, options):
+        options = dict(options or {})
+        if temperature is not None:
+            options.setdefault('temperature', temperature)
+
+        payload = {"model": model, "prompt": prompt, "stream": stream}
+        if options:
+            payload["options"] = options
+        return payload
+
+    def generate(self, prompt: str, model: str = "deepseek-r1:1.5b", temperature: Optional[float] = None,
+                 options: Optional[Dict[str, Any]] = None, timeout: float = 300,
+                 strip_thinking: bool = True, filters: Optional[List[ResponseFilter]] = None) -> str:
+        """
+        Generate a complete response for a prompt.
+
+        Args:
+            prompt: The prompt to send
+            model: The Ollama model to use
+            temperature: Sampling temperature, or None for the model default
+            options: Extra Ollama model options
+            timeout: Deadline in seconds for the whole call
+            strip_thinking: Whether to remove <think> sections from the response
+            filters: Response filters to apply (see response_filters.py). The response is
+                then streamed, so generation stops as soon as a filter ends it
+
+        Returns:
+            str: The generated response
+        """
+        if filters is not None:
+            stream = self.generate_stream(prompt, model, temperature, options, timeout)
+            return ''.join(filter_stream(stream, filters)).strip()
+
+        start = time.perf_counter()
+        response = self._request(
+            'POST', '/api/generate', timeout,
+            json=self._generate_payload(prompt, model, False, temperature, options)
+        )
+        text = response.json().get('response', '')
+        record_stage('llm_total', time.perf_counter() - start, model)
+        return strip_think(text) if strip_thinking else text
+
+    def generate_stream(self, prompt: str, model: str = "deepseek-r1:1.5b", temperature: Optional[float] = None,
+                        options: Optional[Dict[str, Any]] = None, timeout: float = 300) -> Iterator[str]:
+        """
+        Generate a response for a prompt and yield raw tokens as they are produced.
+
+        The connection is only retried before the first byte arrives. Closing the
+        generator closes the HTTP response, which makes Ollama stop generating.
+
+        Args:
+            prompt: The prompt to send
+            model: The Ollama model to use
+            temperature: Sampling temperature, or None for the model default
+            options: Extra Ollama model options
+            timeout: Deadline in seconds for the whole generation
+
+        Yields:
+            str: Raw response tokens (thinking sections included)
+        """
+        deadline = time.monotonic() + timeout
+        start = time.perf_counter()
+        response = self._request(
+            'POST', '/api/generate', timeout,
+            json=self._generate_payload(prompt, model, True, temperature, options),
+            stream=True
+        )
+        first_token = True
+        try:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get('error'):
+                    raise OllamaError(response.status_code, data['error'])
+                if data.get('response'):
+                    if first_token:
+                        record_stage('llm_ttft', time.perf_counter() - start, model)
+                        first_token = False
+                    yield data['response']
+                if data.get('done'):
+                    break
+                if time.monotonic() > deadline:
+                    raise requests.exceptions.Timeout(f"Ollama generation exceeded its {timeout}s deadline")
+        finally:
+            response.close()
+            record_stage('llm_total', time.perf_counter() - start, model)
+
+    def list_models(self, timeout: float = 5) -> Dict[str, Any]:
+        """Return the models available on the Ollama server (GET /api/tags)."""
+        return self._request('GET', '/api/tags', timeout).json()
+
+    def running_models(self, timeout: float = 5) -> Dict[str, Any]:
+        """Return the models currently loaded in memory (GET /api/ps)."""
+        return self._request('GET', '/api/ps', timeout).json()
+
+    def is_model_resident(self, model: str, timeout: float = 5) -> bool:
+        """Check whether a model is loaded in memory and ready to generate."""
+        loaded = self.running_models(timeout=timeout).get('models', [])
+        return any(model in (entry.get('name'), entry.get('model')) for entry in loaded)
+
+    def load_model(self, model: str, timeout: float = 300) -> None:
+        """Ask Ollama to load a model into memory without generating anything."""
+        self._request('POST', '/api/generate', timeout, json={"model": model})
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> OllamaClient:
+    """Return the process-wide Ollama client, creating it on first use."""
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OllamaClient()
+    return _client
+
+
+class AsyncOllamaClient:
+    """
+    asyncio counterpart of OllamaClient, used by the ASGI serving mode.
+
+    Requests await on the socket instead of blocking a thread, so one process can
+    hold many slow generations in flight. The same pool size, retry and deadline
+    settings apply. The underlying httpx client is created lazily inside the
+    running event loop.
+    """
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, pool_size=OLLAMA_POOL_SIZE,
+                 max_retries=OLLAMA_MAX_RETRIES, retry_backoff=OLLAMA_RETRY_BACKOFF,
+                 connect_timeout=5):
+        if not HTTPX_AVAILABLE:
+            raise RuntimeError("The async Ollama client requires httpx: pip install httpx")
+
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.connect_timeout = connect_timeout
+        self._http = None
+
+    @property
+    def http(self):
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+        return self._http
+
+    async def aclose(self) -> None:
+        """Close pooled connections."""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _send(self, method: str, path: str, timeout: float, stream: bool = False, **kwargs):
+        """
+        Send a request, retrying connection errors and 5xx responses until the deadline.
+
+        Returns:
+            httpx.Response: A successful response (unread if stream=True; the caller must close it)
+
+        Raises:
+            OllamaError: If Ollama answers with an error status
+            httpx.HTTPError: If Ollama cannot be reached in time
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        attempt = 0
+
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise httpx.ReadTimeout(f"Ollama call exceeded its {timeout}s deadline")
+
+            request = self.http.build_request(
+                method, path,
+                timeout=httpx.Timeout(remaining, connect=min(self.connect_timeout, remaining)),
+                **kwargs
+            )
+            try:
+                response = await self.http.send(request, stream=stream)
+            except (httpx.ConnectError, httpx.RemoteProtocolError) as e:
+                error = e
+            else:
+                if response.status_code < 400:
+                    return response
+                body = (await response.aread()).decode('utf-8', errors='replace')
+                await response.aclose()
+                error = OllamaError(response.status_code, body)
+                if response.status_code < 500:
+                    raise error
+
+            delay = self.retry_backoff * (2 ** attempt)
+            if attempt >= self.max_retries or loop.time() + delay >= deadline:
+                raise error
+
+            attempt += 1
+            logger.warning(f"Ollama call to {path} failed ({error}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def generate(self, prompt: str, model: str = "deepseek-r1:1.5b", temperature: Optional[float] = None,
+                       options: Optional[Dict[str, Any]] = None, timeout: float = 300,
+                       strip_thinking: bool = True, filters: Optional[List[ResponseFilter]] = None) -> str:
+        """Generate a complete response for a prompt (see OllamaClient.generate)."""
+        if filters is not None:
+            stream = self.generate_stream(prompt, model, temperature, options, timeout)
+            return ''.join([text async for text in afilter_stream(stream, filters)]).strip()
+
+        start = time.perf_counter()
+        response = await self._send(
+            'POST', '/api/generate', timeout,
+            json=OllamaClient._generate_payload(prompt, model, False, temperature, options)
+        )
+        text = response.json().get('response', '')
+        record_stage('llm_total', time.perf_counter() - start, model)
+        return strip_think(text) if strip_thinking else text
+
+    async def generate_stream(self, prompt: str, model: str = "deepseek-r1:1.5b", temperature: Optional[float] = None,
+                              options: Optional[Dict[str, Any]] = None, timeout: float = 300) -> AsyncIterator[str]:
+        """
+        Generate a response and yield raw tokens as they are produced (see OllamaClient.generate_stream).
+
+        Closing the async generator (or cancelling the task consuming it) closes the
+        HTTP response, which makes Ollama stop generating.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        start = time.perf_counter()
+        response = await self._send(
+            'POST', '/api/generate', timeout, stream=True,
+            json=OllamaClient._generate_payload(prompt, model, True, temperature, options)
+        )
+        first_token = True
+        try:
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get('error'):
+                    raise OllamaError(response.status_code, data['error'])
+                if data.get('response'):
+                    if first_token:
+                        record_stage('llm_ttft', time.perf_counter() - start, model)
+                        first_token = False
+                    yield data['response']
+                if data.get('done'):
+                    break
+                if loop.time() > deadline:
+                    raise httpx.ReadTimeout(f"Ollama generation exceeded its {timeout}s deadline")
+        finally:
+            await response.aclose()
+            record_stage('llm_total', time.perf_counter() - start, model)
+
+    async def list_models(self, timeout: float = 5) -> Dict[str, Any]:
+        """Return the models available on the Ollama server (GET /api/tags)."""
+        return (await self._send('GET', '/api/tags', timeout)).json()
+
+    async def running_models(self, timeout: float = 5) -> Dict[str, Any]:
+        """Return the models currently loaded in memory (GET /api/ps)."""
+        return (await self._send('GET', '/api/ps', timeout)).json()
+
+    async def is_model_resident(self, model: str, timeout: float = 5) -> bool:
+        """Check whether a model is loaded in memory and ready to generate."""
+        loaded = (await self.running_models(timeout=timeout)).get('models', [])
+        return any(model in (entry.get('name'), entry.get('model')) for entry in loaded)
+
+
+_async_client = None
+
+
+def get_async_client() -> AsyncOllamaClient:
+    """Return the process-wide async Ollama client, creating it on first use (event loop thread only)."""
+    global _async_client
+
+    if _async_client is None:
+        _async_client = AsyncOllamaClient()
+    return _async_client
@@ -12,21 +12,29 @@ import subprocess
 import json
 from typing import Dict, Any, Optional, List
 
+from ollama_client import get_client, OllamaError
+from response_filters import strip_think, filter_stream
+from prompt_cache import PromptCache
+from logging_config import configure_logging
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
 # Try to import the RAG handler
 try:
     from rag_handler import RAGHandler
     RAG_AVAILABLE = True
 except ImportError:
     RAG_AVAILABLE = False
-    print("RAG functionality not available. To enable, install required packages.")
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
+    logger.warning("RAG functionality not available. To enable, install required packages.")
 
 # Global RAG handler instance
 rag_handler = None
 
+# Exact-match memoization of prompts sent through send_prompt_to_ollama
+prompt_cache = PromptCache()
+
 def initialize_rag(model_name="deepseek-r1:1.5b"):
     """
     Initialize the RAG system if available.
@@ -88,7 +96,61 @@ def load_rag_from_urls(urls: List[str]) -> bool:
     
     return rag_handler.load_from_urls(urls)
 
-def send_prompt_to_ollama(prompt, model="deepseek-r1:1.5b", timeout=300, temperature=0.7, use_rag=False):
+def load_rag_from_files(file_paths: List[str]) -> bool:
+    """
+    Load local .txt, .md, .jsonl and .html files (or directories of them) into the RAG system.
+    
+    Args:
+        file_paths: List of file or directory paths to load
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    global rag_handler
+    
+    if not rag_handler:
+        success = initialize_rag()
+        if not success:
+            return False
+    
+    return rag_handler.load_from_files(file_paths)
+
+def upsert_rag_documents(documents: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Add or update knowledge base documents without rebuilding the RAG index.
+    
+    Args:
+        documents: List of document dictionaries with 'content' and 'metadata'; a stable
+            'doc_id' (or 'id') in the metadata lets later calls replace the document
+        
+    Returns:
+        Dict with counts of 'upserted' and 'unchanged' documents and 'chunks' embedded
+    """
+    global rag_handler
+    
+    if not rag_handler:
+        success = initialize_rag()
+        if not success:
+            return {"upserted": 0, "unchanged": 0, "chunks": 0}
+    
+    return rag_handler.upsert_documents(documents)
+
+def delete_rag_documents(doc_ids: List[str]) -> int:
+    """
+    Remove knowledge base documents from the RAG index by id.
+    
+    Args:
+        doc_ids: Ids of the documents to remove
+        
+    Returns:
+        int: Number of documents deleted
+    """
+    if not rag_handler:
+        return 0
+    return rag_handler.delete_documents(doc_ids)
+
+def send_prompt_to_ollama(prompt, model="deepseek-r1:1.5b", timeout=300, temperature=0.7, use_rag=False,
+                          options=None, cache=None):
     """
     Send a prompt to the Ollama API and return the response with thinking sections removed.
     
@@ -98,6 +160,10 @@ def send_prompt_to_ollama(prompt, model="deepseek-r1:1.5b", timeout=300, tempera
         timeout (int): Request timeout in seconds (5 minutes by default)
         temperature (float): Sampling temperature (higher = more creative, lower = more deterministic)
         use_rag (bool): Whether to use RAG if available
+        options (dict): Extra Ollama model options
+        cache (bool): Whether to memoize the response for identical prompts. The default
+            (None) only caches deterministic calls (temperature 0); pass True to also
+            cache sampled responses, or False to never cache
         
     Returns:
         tuple: The processed response from Ollama and a boolean indicating whether RAG was used
@@ -109,47 +175,43 @@ def send_prompt_to_ollama(prompt, model="deepseek-r1:1.5b", timeout=300, tempera
         # If RAG is enabled and available, use it
         rag_used = False
         if use_rag and rag_handler is not None and rag_handler.is_enabled():
-            logger.info(f"Using RAG for prompt: {prompt[:50]}...")
-            response, context = rag_handler.query(prompt)
+            logger.debug(f"Using RAG for prompt: {prompt[:50]}...")
+            response = rag_handler.query(prompt).get('answer')
             rag_used = True
             
             if response:
-                logger.info(f"Got RAG response: {response[:50]}...")
+                logger.debug(f"Got RAG response: {response[:50]}...")
                 # Return a tuple with the response and whether RAG was used
                 return response, rag_used
         
+        # Identical prompts are answered from the cache; sampled (temperature > 0) calls opt in
+        use_cache = cache if cache is not None else not temperature
+        cache_key = PromptCache.make_key(prompt, model, temperature, options) if use_cache else None
+        if cache_key:
+            cached_response = prompt_cache.get(cache_key)
+            if cached_response is not None:
+                logger.debug(f"Prompt cache hit (length: {len(cached_response)} chars)")
+                return cached_response, rag_used
+        
         # If RAG is not available or failed, use standard Ollama API call
-        logger.info(f"Using standard Ollama API call for prompt: {prompt[:50]}...")
+        logger.debug(f"Using standard Ollama API call for prompt: {prompt[:50]}...")
         try:
-            logger.info(f"Sending request to Ollama API at http://localhost:11434/api/generate with model {model}")
-            response = requests.post(
-                "http://localhost:11434/api/generate",
-                json={
-                    "model": model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "temperature": temperature
-                },
+            logger.debug(f"Sending request to Ollama API with model {model}")
+            clean_response = get_client().generate(
+                prompt,
+                model=model,
+                temperature=temperature,
+                options=options,
                 timeout=timeout
             )
             
-            logger.info(f"Received response from Ollama API with status code: {response.status_code}")
-            
-            if response.status_code == 200:
-                bot_response = response.json().get('response', '')
-                
-                # Remove content between <think> and </think> tags
-                clean_response = re.sub(r'<think>.*?</think>', '', bot_response, flags=re.DOTALL)
-                
-                # Clean up any extra whitespace
-                clean_response = clean_response.strip()
-                
-                logger.info(f"Successfully received response from Ollama (length: {len(clean_response)} chars)")
-                return clean_response, rag_used
-            else:
-                error_msg = f"Error from Ollama API: {response.status_code} - {response.text}"
-                logger.error(error_msg)
-                return f"I apologize, but I encountered an error. (Status: {response.status_code})", rag_used
+            logger.debug(f"Successfully received response from Ollama (length: {len(clean_response)} chars)")
+            if cache_key:
+                prompt_cache.put(cache_key, clean_response)
+            return clean_response, rag_used
+        except OllamaError as e:
+            logger.error(str(e))
+            return f"I apologize, but I encountered an error. (Status: {e.status_code})", rag_used
         except Exception as e:
             logger.error(f"Exception during Ollama API call: {type(e).__name__}: {str(e)}")
             raise
@@ -167,10 +229,7 @@ def send_prompt_to_ollama(prompt, model="deepseek-r1:1.5b", timeout=300, tempera
             cli_response = run_ollama_cli(prompt, model)
             if cli_response:
                 logger.info(f"Successfully received response from Ollama CLI (length: {len(cli_response)} chars)")
-                # Remove content between <think> and </think> tags
-                clean_response = re.sub(r'<think>.*?</think>', '', cli_response, flags=re.DOTALL)
-                clean_response = clean_response.strip()
-                return clean_response, False
+                return strip_think(cli_response), False
         except Exception as cli_err:
             logger.error(f"CLI fallback also failed: {str(cli_err)}")
             
@@ -180,6 +239,30 @@ def send_prompt_to_ollama(prompt, model="deepseek-r1:1.5b", timeout=300, tempera
         logger.error(f"Unexpected error communicating with Ollama: {str(e)}")
         return f"I apologize, but I encountered an unexpected error. Please try again.", False
 
+def stream_prompt_to_ollama(prompt, model="deepseek-r1:1.5b", timeout=300, temperature=0.7, filters=None):
+    """
+    Send a prompt to the Ollama API and yield the response as it is generated.
+    
+    Args:
+        prompt (str): The prompt to send to Ollama
+        model (str): The model to use, defaults to "deepseek-r1:1.5b"
+        timeout (int): Deadline in seconds for the whole generation
+        temperature (float): Sampling temperature
+        filters (list): Response filters to apply (default: thinking removal only, see response_filters.py)
+        
+    Yields:
+        str: Visible response fragments with thinking sections removed
+        
+    Raises:
+        requests.exceptions.RequestException: If Ollama cannot be reached in time
+        OllamaError: If Ollama returns an error
+    """
+    logger.debug(f"Streaming request to Ollama API with model {model}")
+    tokens = get_client().generate_stream(prompt, model=model, temperature=temperature, timeout=timeout)
+    # filter_stream closes the upstream stream when a filter ends the reply or the
+    # consumer stops reading, which releases the connection and stops generation
+    yield from filter_stream(tokens, filters)
+
 def create_mental_health_prompt(user_message, system_prompt=None):
     """
     Create a complete prompt for mental health support
@@ -0,0 +1,409 @@
+"""
+On-Demand Request Profiling and Memory Snapshots
+
+Profiling is off, and costs nothing, unless ADMIN_TOKEN is set: the request
+hooks in app.py and asgi_app.py are only installed when it is. With it set, a
+request is profiled when
+
+    it carries X-Admin-Token: <ADMIN_TOKEN> and X-Profile: cprofile|sample, or
+    an administrator armed profiling with POST /admin/profiling, which profiles
+    the next N requests to the chat endpoints
+
+Two profilers are available:
+
+    cprofile    deterministic (cProfile); saved as a .pstats file for pstats,
+                snakeviz or gprof2dot
+    sample      samples the request thread's stack every few milliseconds;
+                saved as collapsed stacks (.folded) for flamegraph.pl or
+                speedscope. Much lower overhead, so timings stay realistic
+
+Only one request is profiled at a time; others run normally meanwhile. A profile
+covers the thread that handles the request, including a streamed body in the
+Flask app.
+
+MemoryTracker wraps tracemalloc: start tracing, take snapshots, and diff any two
+to see which lines (or files) grew, e.g. the module-level stores and caches.
+
+Configuration is read from the environment:
+    ADMIN_TOKEN                  Secret for the admin endpoints and profiled requests (unset disables them)
+    PROFILE_DIR                  Directory for saved profiles (default "profiles")
+    PROFILE_MAX_FILES            Saved profiles kept, oldest deleted first (default 50)
+    PROFILE_SAMPLE_INTERVAL_MS   Sampling interval of the "sample" profiler (default 5)
+    TRACEMALLOC_FRAMES           Stack frames recorded per allocation (default 10)
+    TRACEMALLOC_MAX_SNAPSHOTS    Snapshots kept in memory for diffs (default 10)
+"""
+
+import os
+import io
+import sys
+import hmac
+import time
+import uuid
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "50"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+TRACEMALLOC_FRAMES = int(os.environ.get("TRACEMALLOC_FRAMES", "10"))
+TRACEMALLOC_MAX_SNAPSHOTS = int(os.environ.get("TRACEMALLOC_MAX_SNAPSHOTS", "10"))
+
+PROFILING_ENABLED = bool(ADMIN_TOKEN)
+
+MODES = ("cprofile", "sample")
+EXTENSIONS = {'cprofile': ".pstats", 'sample': ".folded"}
+
+# Endpoints profiled by POST /admin/profiling unless others are given
+DEFAULT_ENDPOINTS = ("chat", "simple_chat")
+
+
+def authorized(token: Optional[str]) -> bool:
+    """Check an X-Admin-Token value against ADMIN_TOKEN (always False when it is unset)."""
+    if not PROFILING_ENABLED or not token:
+        return False
+    return hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+
+class SamplingProfiler:
+    """Statistical profiler sampling one thread's stack from a background thread."""
+
+    def __init__(self, thread_id: int, interval: float):
+        """
+        Args:
+            thread_id: Identifier of the thread to sample (threading.get_ident())
+            interval: Seconds between samples
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        """The samples as collapsed stacks, one "root;...;leaf count" line per distinct stack."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileSession:
+    """One request being profiled."""
+
+    def __init__(self, endpoint: str, mode: str, interval: float):
+        self.endpoint = endpoint or "unknown"
+        self.mode = mode
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.name = f"{stamp}-{self.endpoint}-{uuid.uuid4().hex[:8]}{EXTENSIONS[mode]}"
+        self.start_time = time.perf_counter()
+        if mode == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.profiler = SamplingProfiler(threading.get_ident(), interval)
+            self.profiler.start()
+
+    def stop(self, directory: str) -> str:
+        """Stop profiling and write the output file; returns its path."""
+        path = os.path.join(directory, self.name)
+        if self.mode == "cprofile":
+            self.profiler.disable()
+            self.profiler.dump_stats(path)
+        else:
+            self.profiler.stop()
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.profiler.folded())
+        return path
+
+
+class RequestProfiler:
+    """Decides which requests are profiled and keeps the saved profiles."""
+
+    def __init__(self, directory: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES,
+                 sample_interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS):
+        """
+        Args:
+            directory: Where profiles are written
+            max_files: Profiles kept; the oldest are deleted beyond this
+            sample_interval_ms: Sampling interval of the "sample" profiler
+        """
+        self.directory = directory
+        self.max_files = max_files
+        self.sample_interval = sample_interval_ms / 1000.0
+
+        self._lock = threading.Lock()
+        self._active = None
+        self._armed = 0
+        self._armed_mode = "cprofile"
+        self._armed_endpoints = DEFAULT_ENDPOINTS
+
+        self.profiled = 0
+        self.skipped_busy = 0
+
+    def arm(self, requests: int, mode: str = "cprofile", endpoints: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Profile the next requests to the given endpoints (0 disarms).
+
+        Args:
+            requests: Number of requests to profile
+            mode: "cprofile" or "sample"
+            endpoints: Endpoint names to profile (default: the chat endpoints)
+        """
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        with self._lock:
+            self._armed = max(0, int(requests))
+            self._armed_mode = mode
+            self._armed_endpoints = tuple(endpoints) if endpoints else DEFAULT_ENDPOINTS
+        return self.stats()
+
+    def begin(self, endpoint: Optional[str], requested_mode: Optional[str] = None) -> Optional[ProfileSession]:
+        """
+        Start profiling the current request if it asked for it or profiling is armed.
+
+        Args:
+            endpoint: The request's endpoint name
+            requested_mode: Mode from an authorized X-Profile header, if any
+
+        Returns:
+            The session to pass to end(), or None if the request is not profiled
+        """
+        with self._lock:
+            if requested_mode:
+                mode = requested_mode if requested_mode in MODES else "cprofile"
+            elif self._armed and endpoint in self._armed_endpoints:
+                mode = self._armed_mode
+            else:
+                return None
+            if self._active is not None:
+                self.skipped_busy += 1
+                return None
+            if not requested_mode:
+                self._armed -= 1
+            self._active = session = ProfileSession(endpoint, mode, self.sample_interval)
+        return session
+
+    def end(self, session: ProfileSession) -> Optional[str]:
+        """Stop a session and save its profile; returns the file name (None if saving failed)."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = session.stop(self.directory)
+            elapsed_ms = int((time.perf_counter() - session.start_time) * 1000)
+            logger.info("Saved request profile", extra={'endpoint': session.endpoint, 'profile': session.name,
+                                                         'mode': session.mode, 'elapsed_ms': elapsed_ms})
+            self._prune()
+            return os.path.basename(path)
+        except Exception as e:
+            logger.error(f"Could not save request profile: {str(e)}", extra={'endpoint': session.endpoint})
+            return None
+        finally:
+            with self._lock:
+                if self._active is session:
+                    self._active = None
+                self.profiled += 1
+
+    def _prune(self) -> None:
+        profiles = self.list_profiles()
+        for entry in profiles[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.directory, entry['name']))
+            except OSError:
+                pass
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """Saved profiles, newest first."""
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(tuple(EXTENSIONS.values()))]
+        except FileNotFoundError:
+            return []
+        profiles = []
+        for name in names:
+            try:
+                info = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            profiles.append({
+                'name': name,
+                'bytes': info.st_size,
+                'created_at': datetime.fromtimestamp(info.st_mtime).isoformat(timespec='seconds'),
+            })
+        profiles.sort(key=lambda entry: entry['created_at'], reverse=True)
+        return profiles
+
+    def profile_path(self, name: str) -> Optional[str]:
+        """Path of a saved profile, or None for unknown (or unsafe) names."""
+        if os.path.basename(name) != name or not name.endswith(tuple(EXTENSIONS.values())):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def report(self, name: str, sort: str = "cumulative", limit: int = 40) -> Optional[str]:
+        """A saved cProfile profile as pstats text, or a sampled one as its collapsed stacks."""
+        path = self.profile_path(name)
+        if path is None:
+            return None
+        if not name.endswith(EXTENSIONS['cprofile']):
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def stats(self) -> Dict[str, Any]:
+        """Profiling state and counters for monitoring."""
+        with self._lock:
+            return {
+                'armed_requests': self._armed,
+                'armed_mode': self._armed_mode,
+                'armed_endpoints': list(self._armed_endpoints),
+                'active': self._active.name if self._active is not None else None,
+                'profiled': self.profiled,
+                'skipped_busy': self.skipped_busy,
+            }
+
+
+class MemoryTracker:
+    """tracemalloc snapshots and diffs for tracking memory growth."""
+
+    def __init__(self, max_snapshots: int = TRACEMALLOC_MAX_SNAPSHOTS):
+        self.max_snapshots = max_snapshots
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()  # id -> (taken_at, snapshot)
+        self._next_id = 1
+
+    @staticmethod
+    def _filtered(snapshot: tracemalloc.Snapshot, pattern: Optional[str] = None) -> tracemalloc.Snapshot:
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ]
+        if pattern:
+            filters.append(tracemalloc.Filter(True, f"*{pattern}*"))
+        return snapshot.filter_traces(filters)
+
+    def start(self, frames: int = TRACEMALLOC_FRAMES) -> Dict[str, Any]:
+        """Start tracing allocations (allocations made before this are not seen)."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, int(frames)))
+        return self.stats()
+
+    def stop(self) -> Dict[str, Any]:
+        """Stop tracing and drop the snapshots."""
+        tracemalloc.stop()
+        with self._lock:
+            self._snapshots.clear()
+        return self.stats()
+
+    def snapshot(self, group_by: str = "lineno", limit: int = 20, pattern: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Take a snapshot and report its largest allocation sites.
+
+        Args:
+            group_by: "lineno", "filename" or "traceback"
+            limit: Number of sites reported
+            pattern: Only report allocations from files whose path contains this
+
+        Returns:
+            Dict with the snapshot 'id', traced and peak bytes, and the 'top' sites
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing; start it first")
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snapshot_id] = (datetime.now().isoformat(timespec='seconds'), snapshot)
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        top = self._filtered(snapshot, pattern).statistics(group_by)[:limit]
+        return {
+            'id': snapshot_id,
+            'traced_bytes': current,
+            'peak_bytes': peak,
+            'top': [self._site(stat) for stat in top],
+        }
+
+    def diff(self, from_id: int, to_id: Optional[int] = None, group_by: str = "lineno",
+             limit: int = 20, pattern: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Compare two snapshots, largest growth first.
+
+        Args:
+            from_id: The earlier snapshot
+            to_id: The later snapshot (default: the latest)
+            group_by: "lineno", "filename" or "traceback"
+            limit: Number of sites reported
+            pattern: Only compare allocations from files whose path contains this
+
+        Returns:
+            Dict with the total growth and the 'top' changed sites, or None if a snapshot is unknown
+        """
+        with self._lock:
+            if to_id is None and self._snapshots:
+                to_id = next(reversed(self._snapshots))
+            before = self._snapshots.get(from_id)
+            after = self._snapshots.get(to_id)
+        if before is None or after is None:
+            return None
+        changes = self._filtered(after[1], pattern).compare_to(self._filtered(before[1], pattern), group_by)
+        return {
+            'from': from_id,
+            'to': to_id,
+            'size_diff_bytes': sum(stat.size_diff for stat in changes),
+            'top': [self._site(stat, diff=True) for stat in changes[:limit]],
+        }
+
+    @staticmethod
+    def _site(stat, diff: bool = False) -> Dict[str, Any]:
+        frame = stat.traceback[0]
+        site = {
+            'location': f"{frame.filename}:{frame.lineno}",
+            'size_bytes': stat.size,
+            'count': stat.count,
+        }
+        if diff:
+            site['size_diff_bytes'] = stat.size_diff
+            site['count_diff'] = stat.count_diff
+        if len(stat.traceback) > 1:
+            site['traceback'] = [f"{f.filename}:{f.lineno}" for f in stat.traceback]
+        return site
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshots = [{'id': snapshot_id, 'taken_at': taken_at}
+                         for snapshot_id, (taken_at, _) in self._snapshots.items()]
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            'tracing': tracemalloc.is_tracing(),
+            'traced_bytes': current,
+            'peak_bytes': peak,
+            'snapshots': snapshots,
+        }
@@ -0,0 +1,205 @@
+"""
+Exact-Match Prompt Cache
+
+This module memoizes Ollama responses for prompts that are sent again verbatim
+(after whitespace normalization) with the same model, temperature and options.
+It is independent of the semantic answer cache: its only job is to make exact
+repeats free.
+
+Entries live in an in-memory LRU bounded by a byte budget. If a spill
+directory is configured, every entry is also written there so warm entries
+survive restarts; the directory has its own byte budget.
+
+Configuration is read from the environment:
+    PROMPT_CACHE_MAX_BYTES       In-memory budget in bytes (default 8 MB)
+    PROMPT_CACHE_DIR             Spill directory (default unset, memory only)
+    PROMPT_CACHE_MAX_DISK_BYTES  Spill directory budget in bytes (default 256 MB)
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+PROMPT_CACHE_MAX_BYTES = int(os.environ.get("PROMPT_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+PROMPT_CACHE_DIR = os.environ.get("PROMPT_CACHE_DIR") or None
+PROMPT_CACHE_MAX_DISK_BYTES = int(os.environ.get("PROMPT_CACHE_MAX_DISK_BYTES", str(256 * 1024 * 1024)))
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse runs of whitespace so formatting-only differences hit the same entry."""
+    return _WHITESPACE.sub(' ', prompt).strip()
+
+
+class PromptCache:
+    """Byte-bounded LRU cache of prompt responses with optional on-disk spill."""
+
+    def __init__(self, max_bytes=PROMPT_CACHE_MAX_BYTES, spill_dir=PROMPT_CACHE_DIR,
+                 max_disk_bytes=PROMPT_CACHE_MAX_DISK_BYTES):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes (int): In-memory budget for cached responses
+            spill_dir (str): Directory for persisted entries, or None for memory only
+            max_disk_bytes (int): Budget for the spill directory
+        """
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_disk_bytes = max_disk_bytes
+
+        self._entries = OrderedDict()  # key -> response, least recently used first
+        self._bytes = 0
+        self._disk_bytes = None        # computed lazily on first write
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(prompt: str, model: str, temperature: Optional[float], options: Optional[Dict[str, Any]] = None) -> str:
+        """Build the cache key for a (normalized prompt, model, temperature, options) tuple."""
+        payload = json.dumps(
+            [normalize_prompt(prompt), model, temperature, options or {}],
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _size(key: str, response: str) -> int:
+        return len(key) + len(response.encode('utf-8'))
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, key[:2], key + ".json")
+
+    def _remember(self, key: str, response: str) -> None:
+        """Insert into the in-memory LRU; caller holds the lock."""
+        if key in self._entries:
+            self._bytes -= self._size(key, self._entries.pop(key))
+        self._entries[key] = response
+        self._bytes += self._size(key, response)
+        while self._bytes > self.max_bytes and self._entries:
+            old_key, old_response = self._entries.popitem(last=False)
+            self._bytes -= self._size(old_key, old_response)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for a key, checking memory and then the spill directory."""
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return response
+
+        response = self._read_spill(key)
+        with self._lock:
+            if response is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, response)
+            return response
+
+    def put(self, key: str, response: str) -> None:
+        """Cache a response in memory and, if configured, in the spill directory."""
+        if not response or self._size(key, response) > self.max_bytes:
+            return
+        with self._lock:
+            self._remember(key, response)
+        self._write_spill(key, response)
+
+    def _read_spill(self, key: str) -> Optional[str]:
+        if not self.spill_dir:
+            return None
+        try:
+            with open(self._spill_path(key), encoding='utf-8') as f:
+                return json.load(f).get('response')
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Could not read prompt cache entry {key[:12]}: {str(e)}")
+            return None
+
+    def _write_spill(self, key: str, response: str) -> None:
+        if not self.spill_dir:
+            return
+        path = self._spill_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'response': response}, f)
+            # Rewriting a spilled key replaces its file, so only the size difference is new
+            try:
+                replaced_bytes = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced_bytes = 0
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write prompt cache entry {key[:12]}: {str(e)}")
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_spill_bytes()
+            else:
+                self._disk_bytes += os.path.getsize(path) - replaced_bytes
+            over_budget = self._disk_bytes > self.max_disk_bytes
+        if over_budget:
+            self._prune_spill()
+
+    def _scan_spill_bytes(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self.spill_dir):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        return total
+
+    def _prune_spill(self) -> None:
+        """Delete the least recently written spill files until the directory is back under 80% of budget."""
+        files = []
+        for root, _, names in os.walk(self.spill_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, stat.st_size, path))
+                except FileNotFoundError:
+                    continue
+
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_disk_bytes * 0.8)
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                continue
+
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'spill_dir': self.spill_dir,
+            }
@@ -6,29 +6,75 @@ relevant context from a knowledge base before generating responses.
 """
 
 import os
+import time
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Iterator
 
 # Import Langchain components
 try:
     from langchain.text_splitter import RecursiveCharacterTextSplitter
-    from langchain_community.vectorstores import SKLearnVectorStore
     from langchain_community.embeddings import HuggingFaceEmbeddings
     from langchain_community.document_loaders import WebBaseLoader
     from langchain.schema import Document
     from langchain.prompts import PromptTemplate
-    from langchain_core.output_parsers import StrOutputParser
-    from langchain_ollama import ChatOllama
+    from index_store import compute_index_key, load_index, save_index, load_ann_index, save_ann_index
+    from vector_store import MatrixVectorStore, VectorRetriever
+    from document_index import DocumentIndex, document_id, document_hash
+    from content_cache import get_content_cache, cached_split, cached_embed, splitter_settings
+    from ann_index import IVFIndex, default_n_lists, RAG_ANN_INDEX, RAG_ANN_MIN_CHUNKS, RAG_IVF_LISTS, RAG_IVF_PROBES
+    from ingest import IngestionPipeline
+    from semantic_cache import SemanticAnswerCache
+    from embedding_batcher import EmbeddingBatcher
     LANGCHAIN_AVAILABLE = True
 except ImportError:
     LANGCHAIN_AVAILABLE = False
-    print("Langchain modules not available. RAG functionality will be disabled.")
-    print("To enable, install: pip install langchain langchain_community scikit-learn langchain-ollama sentence-transformers")
+
+from ollama_client import get_client
+from response_filters import strip_think
+from metrics import record_stage, set_path, timed_stage
+from logging_config import configure_logging
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger(__name__)
 
+if not LANGCHAIN_AVAILABLE:
+    logger.warning("Langchain modules not available. RAG functionality will be disabled. "
+                   "To enable, install: pip install langchain langchain_community numpy sentence-transformers")
+
+class QueryEmbeddings:
+    """
+    Embeds user questions with the embedding model the index was built with.
+
+    The model is only loaded the first time a question has to be embedded, and
+    questions from concurrent requests are batched into shared model calls.
+    """
+
+    def __init__(self, model_name: str, model=None):
+        self.model_name = model_name
+        self._model = model
+        self._model_lock = threading.Lock()
+        self.batcher = EmbeddingBatcher(lambda batch: self.model.embed_documents(batch))
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    logger.info(f"Loading embedding model {self.model_name}")
+                    self._model = HuggingFaceEmbeddings(model_name=self.model_name)
+        return self._model
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher.embed(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.batcher.embed_many(texts)
+
+
 class RAGHandler:
     """
     Handles Retrieval Augmented Generation for the DeepSeek Chatbot.
@@ -52,20 +98,32 @@ class RAGHandler:
         self.temperature = temperature
         self.vectorstore = None
         self.retriever = None
+        self.embeddings = None
+        self.index = None
+        self.index_key = None
         self.documents = []
-        self.llm = None
-        self.rag_chain = None
+        self._splitter = None
         
-        # Initialize the language model
-        try:
-            self.llm = ChatOllama(
-                model=model_name,
-                temperature=temperature,
-            )
-            logger.info(f"Successfully initialized ChatOllama with model {model_name}")
-        except Exception as e:
-            logger.error(f"Error initializing ChatOllama: {str(e)}")
-            self.enabled = False
+        # Chunking and embedding settings; part of the on-disk index key
+        self.chunk_size = 500
+        self.chunk_overlap = 50
+        self.embedding_model_name = "all-MiniLM-L6-v2"  # A lightweight embedding model
+        self.top_k = 3
+        
+        # Approximate search for large knowledge bases (see ann_index.py)
+        self.ann_index = RAG_ANN_INDEX
+        self.ann_min_chunks = RAG_ANN_MIN_CHUNKS
+        self.ivf_lists = RAG_IVF_LISTS
+        self.ivf_probes = RAG_IVF_PROBES
+        
+        # Reuses answers for near-paraphrased questions over the same retrieved context
+        self.answer_cache = SemanticAnswerCache()
+        
+        # Reuses chunks and vectors of unchanged documents across rebuilds (see content_cache.py)
+        self.content_cache = get_content_cache()
+        
+        # Generation goes through the shared, pooled Ollama client
+        self.client = get_client()
             
         # Initialize the prompt template
         self.prompt = PromptTemplate(
@@ -83,10 +141,6 @@ class RAGHandler:
             """,
             input_variables=["question", "context"],
         )
-        
-        # Create the chain
-        if self.enabled and self.llm:
-            self.rag_chain = self.prompt | self.llm | StrOutputParser()
             
     def load_documents(self, documents: List[Dict[str, str]]) -> bool:
         """
@@ -128,33 +182,209 @@ class RAGHandler:
             return False
             
         try:
-            # Split documents
-            text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-                chunk_size=500, 
-                chunk_overlap=50
-            )
-            doc_splits = text_splitter.split_documents(self.documents)
-            
-            # Create embeddings and vector store
-            # Using HuggingFaceEmbeddings as a local alternative to OpenAI embeddings
-            embeddings = HuggingFaceEmbeddings(
-                model_name="all-MiniLM-L6-v2"  # A lightweight embedding model
+            settings = self._index_settings()
+            index_key = compute_index_key(
+                [{"content": doc.page_content, "metadata": doc.metadata} for doc in self.documents],
+                settings
             )
             
-            self.vectorstore = SKLearnVectorStore.from_documents(
-                documents=doc_splits,
-                embedding=embeddings,
-            )
+            # Reuse the persisted chunks and (normalized) vectors when the documents and settings are unchanged
+            artifact = load_index(index_key)
+            embeddings = QueryEmbeddings(self.embedding_model_name)
+            if artifact is not None:
+                logger.info(f"Loaded {len(artifact)} chunks from on-disk index {index_key[:12]}")
+                texts, metadatas, vectors = artifact.texts, artifact.metadatas, artifact.embeddings
+            else:
+                # Split documents; every chunk records the id of its document for later updates
+                texts, metadatas = [], []
+                for doc_texts, doc_metadatas in self._split_documents(
+                        [(doc.page_content, doc.metadata) for doc in self.documents]):
+                    texts.extend(doc_texts)
+                    metadatas.extend(doc_metadatas)
+                
+                # Create embeddings; chunks embedded by an earlier build come from the content cache
+                # Using HuggingFaceEmbeddings as a local alternative to OpenAI embeddings
+                vectors = self._embed_chunks(texts, embeddings)
+                save_index(index_key, texts, metadatas, vectors, settings)
             
-            self.retriever = self.vectorstore.as_retriever(k=3)  # Get top 3 results
+            doc_hashes = {
+                document_id(doc.metadata, doc.page_content): document_hash(doc.page_content, doc.metadata)
+                for doc in self.documents
+            }
+            self._install_index(index_key, texts, metadatas, vectors, embeddings, doc_hashes)
             
-            logger.info(f"Successfully processed {len(doc_splits)} document chunks")
+            logger.info(f"Successfully processed {len(texts)} document chunks")
             return True
             
         except Exception as e:
             logger.error(f"Error processing documents: {str(e)}")
             return False
     
+    def _index_settings(self) -> Dict[str, Any]:
+        """Chunking and embedding settings that determine the chunks and vectors."""
+        return {
+            "splitter": "RecursiveCharacterTextSplitter.from_tiktoken_encoder",
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "embedding_model": self.embedding_model_name,
+        }
+    
+    def _split_text(self, text: str) -> List[str]:
+        if self._splitter is None:
+            self._splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap
+            )
+        return self._splitter.split_text(text)
+    
+    def _split_documents(self, documents: List[tuple]) -> List[tuple]:
+        """
+        Split (content, metadata) documents into chunk texts and metadatas tagged with their 'doc_id'.
+        
+        Documents split before with the same settings are served from the content cache.
+        """
+        splits = cached_split(self.content_cache, self._split_text,
+                              splitter_settings(self._index_settings()),
+                              [content for content, _ in documents])
+        results = []
+        for (content, metadata), texts in zip(documents, splits):
+            chunk_metadata = {**metadata, "doc_id": document_id(metadata, content)}
+            results.append((texts, [dict(chunk_metadata) for _ in texts]))
+        return results
+    
+    def _embed_chunks(self, texts: List[str], embeddings: "QueryEmbeddings"):
+        """Normalized chunk vectors; the model is only loaded if some chunk is not in the content cache."""
+        return cached_embed(self.content_cache, lambda batch: embeddings.model.embed_documents(batch),
+                            self.embedding_model_name, texts)
+    
+    def _install_index(self, index_key: Optional[str], texts: List[str], metadatas: List[Dict[str, Any]], vectors,
+                       embeddings: "QueryEmbeddings", doc_hashes: Optional[Dict[str, str]] = None) -> None:
+        """Make a set of chunks and their normalized vectors the searchable corpus."""
+        self.embeddings = embeddings
+        self.index_key = index_key
+        index = DocumentIndex(texts, metadatas, vectors, doc_hashes=doc_hashes)
+        self.vectorstore = index.snapshot
+        self.retriever = VectorRetriever(
+            self._build_search_index(index_key, self.vectorstore), self.embeddings, k=self.top_k
+        )
+        index.on_change = self._on_index_change
+        self.index = index
+        
+        # Answers generated from the previous corpus may cite chunks that no longer exist
+        self.answer_cache.clear()
+    
+    def _on_index_change(self, snapshot: "MatrixVectorStore", row_map=None) -> None:
+        """Point the retriever at a new index snapshot; in-flight queries keep the old one."""
+        search_index = self.retriever.store
+        if isinstance(search_index, IVFIndex):
+            search_index = search_index.with_store(snapshot, row_map)
+        else:
+            search_index = snapshot
+        self.vectorstore = snapshot
+        self.retriever = VectorRetriever(search_index, self.embeddings, k=self.top_k)
+    
+    def _build_search_index(self, index_key: str, store):
+        """
+        Wrap the exact store in an approximate index if one is configured and the corpus is large enough.
+        
+        A trained index saved with the artifact is reused; otherwise it is built and saved
+        (unless there is no artifact, i.e. `index_key` is None).
+        
+        Returns:
+            The object the retriever searches: the store itself or an IVFIndex over it
+        """
+        if self.ann_index != "ivf" or len(store) < self.ann_min_chunks:
+            return store
+        
+        params = {"n_lists": self.ivf_lists or default_n_lists(len(store)), "iterations": 10, "seed": 0}
+        arrays = load_ann_index(index_key, "ivf", params) if index_key else None
+        if arrays is not None:
+            logger.info(f"Loaded IVF index with {params['n_lists']} lists from on-disk index {index_key[:12]}")
+            return IVFIndex(store, n_probe=self.ivf_probes, **arrays)
+        
+        index = IVFIndex.build(store, n_lists=params["n_lists"], n_probe=self.ivf_probes,
+                               iterations=params["iterations"], seed=params["seed"])
+        if index_key:
+            save_ann_index(index_key, "ivf", index.arrays(), params)
+        return index
+    
+    def upsert_documents(self, documents: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Add or replace documents without rebuilding the index.
+        
+        Documents are identified by document_id() (metadata 'doc_id' or 'id'); only
+        documents whose content or metadata changed are re-chunked and re-embedded.
+        
+        Args:
+            documents: List of document dictionaries with 'content' and 'metadata'
+            
+        Returns:
+            Dict with counts of 'upserted' and 'unchanged' documents and 'chunks' embedded
+        """
+        if not self.enabled:
+            return {"upserted": 0, "unchanged": 0, "chunks": 0}
+        
+        changed, unchanged = {}, 0
+        for doc in documents:
+            metadata = doc.get('metadata', {})
+            doc_id = document_id(metadata, doc['content'])
+            doc_hash = document_hash(doc['content'], metadata)
+            if self.index is not None and self.index.doc_hash(doc_id) == doc_hash:
+                unchanged += 1
+            else:
+                changed[doc_id] = (doc_hash, doc['content'], metadata)
+        
+        if not changed:
+            return {"upserted": 0, "unchanged": unchanged, "chunks": 0}
+        
+        splits = [
+            (doc_id, doc_hash) + split
+            for doc_id, split in zip(changed, self._split_documents([(c, m) for _, c, m in changed.values()]))
+        ]
+        texts = [text for split in splits for text in split[2]]
+        if not texts and self.index is None:
+            return {"upserted": 0, "unchanged": unchanged, "chunks": 0}
+        
+        embeddings = self.embeddings or QueryEmbeddings(self.embedding_model_name)
+        vectors = self._embed_chunks(texts, embeddings) if texts else None
+        
+        if self.index is None:
+            # Nothing loaded yet: the upserted documents become the corpus
+            metadatas = [metadata for split in splits for metadata in split[3]]
+            doc_hashes = {doc_id: doc_hash for doc_id, doc_hash, _, _ in splits}
+            self._install_index(None, texts, metadatas, vectors, embeddings, doc_hashes)
+        else:
+            upserts, emptied, offset = [], [], 0
+            for doc_id, doc_hash, doc_texts, doc_metadatas in splits:
+                if not doc_texts:
+                    emptied.append(doc_id)
+                    continue
+                upserts.append((doc_id, doc_hash, doc_texts, doc_metadatas,
+                                vectors[offset:offset + len(doc_texts)]))
+                offset += len(doc_texts)
+            self.index.apply(deletes=emptied, upserts=upserts)
+        
+        logger.info(f"Upserted {len(changed)} documents ({len(texts)} chunks), {unchanged} unchanged")
+        return {"upserted": len(changed), "unchanged": unchanged, "chunks": len(texts)}
+    
+    def delete_documents(self, doc_ids: List[str]) -> int:
+        """
+        Remove documents from the index by id.
+        
+        The rows are hidden from search immediately and reclaimed by background compaction.
+        
+        Args:
+            doc_ids: Ids of the documents to delete (see document_id())
+            
+        Returns:
+            int: Number of documents that were found and deleted
+        """
+        if not self.enabled or self.index is None:
+            return 0
+        deleted = self.index.apply(deletes=[str(doc_id) for doc_id in doc_ids])["deleted"]
+        logger.info(f"Deleted {deleted} documents from the RAG index")
+        return deleted
+    
     def load_from_urls(self, urls: List[str]) -> bool:
         """
         Load documents from a list of URLs.
@@ -168,17 +398,20 @@ class RAGHandler:
         if not self.enabled:
             return False
             
+        def load_url(url):
+            try:
+                loader = WebBaseLoader(url)
+                url_docs = loader.load()
+                logger.info(f"Loaded document from {url}")
+                return url_docs
+            except Exception as e:
+                logger.error(f"Error loading from URL {url}: {str(e)}")
+                return []
+        
         try:
-            # Load documents from URLs
-            docs = []
-            for url in urls:
-                try:
-                    loader = WebBaseLoader(url)
-                    url_docs = loader.load()
-                    docs.extend(url_docs)
-                    logger.info(f"Loaded document from {url}")
-                except Exception as e:
-                    logger.error(f"Error loading from URL {url}: {str(e)}")
+            # Fetch URLs concurrently; results keep the order of the input list
+            with ThreadPoolExecutor(max_workers=max(1, min(8, len(urls)))) as pool:
+                docs = [doc for url_docs in pool.map(load_url, urls) for doc in url_docs]
             
             self.documents = docs
             
@@ -189,63 +422,158 @@ class RAGHandler:
             logger.error(f"Error in load_from_urls: {str(e)}")
             return False
             
-    def load_from_files(self, file_paths: List[str]) -> bool:
+    def load_from_files(self, file_paths: List[str], progress=None) -> bool:
         """
-        Load documents from a list of file paths.
-        TO BE IMPLEMENTED BY USER.
+        Load documents from local .txt, .md, .jsonl and .html files (or directories of them).
+        
+        Files are streamed through the ingestion pipeline in ingest.py: chunked in a process
+        pool, embedded in batches and appended to a resumable on-disk work directory, so an
+        interrupted run picks up where it stopped and unchanged files are never re-embedded.
         
         Args:
-            file_paths: List of file paths to load
+            file_paths: List of file or directory paths to load
+            progress: Optional callback receiving progress dicts (files and chunks done, rates)
             
         Returns:
             bool: True if successful, False otherwise
         """
-        # This is a placeholder. The user will need to implement the specific file loading logic
-        # based on their file types (PDF, DOCX, TXT, etc.)
-        logger.info("load_from_files method needs to be implemented by the user")
-        return False
+        if not self.enabled:
+            return False
+        
+        try:
+            embeddings = QueryEmbeddings(self.embedding_model_name)
+            pipeline = IngestionPipeline(
+                embed_documents=lambda batch: embeddings.model.embed_documents(batch),
+                settings=self._index_settings(),
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                cache=self.content_cache
+            )
+            result = pipeline.run(file_paths, progress=progress)
+            if not len(result):
+                logger.warning("No chunks were produced from the given files")
+                return False
+            
+            # File corpora can be large, so their documents are not kept in memory
+            self.documents = []
+            self._install_index(result.key, result.texts, result.metadatas, result.vectors, embeddings)
+            
+            logger.info(f"Successfully processed {len(result)} document chunks from files")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error in load_from_files: {str(e)}")
+            return False
+            
+    def plan_query(self, question: str, cache_text: Optional[str] = None, cache_scope: str = "",
+                   use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Run the CPU-bound half of a RAG query: retrieval, cache lookup and prompt building.
+        
+        The result is either a cached answer or a prompt ready to send to the model.
+        Async callers run this in an executor and then generate with their own client.
+        
+        Args:
+            question: The user's question
+            cache_text: Text whose meaning keys the answer cache, e.g. the raw user message
+                when the question is wrapped in a longer prompt (defaults to the question)
+            cache_scope: Extra context that must match exactly for a cached answer to be
+                reused, e.g. the system prompt
+            use_cache: Set to False to bypass the semantic answer cache for this request
+            
+        Returns:
+            Dict with 'retrieved_docs', 'cached_answer' (or None), 'prompt' and the cache key
             
-    def query(self, question: str) -> Dict[str, Any]:
+        Raises:
+            RuntimeError: If the RAG system is not initialized or no context was found
+        """
+        if not self.enabled or not self.retriever:
+            raise RuntimeError("RAG system not properly initialized")
+        
+        # Embed the question (and the cache key text) in one batch, then retrieve relevant chunks
+        cache_text = cache_text or question
+        texts = [question] if not use_cache or cache_text == question else [question, cache_text]
+        start = time.perf_counter()
+        vectors = self.embeddings.embed_queries(texts)
+        searched = time.perf_counter()
+        retrieved_docs = self.retriever.store.search(vectors[0], self.top_k)
+        record_stage('retrieval_embed', searched - start)
+        record_stage('retrieval_search', time.perf_counter() - searched)
+        if not retrieved_docs:
+            raise RuntimeError("No relevant context found")
+        
+        plan = {
+            "retrieved_docs": retrieved_docs,
+            "cached_answer": None,
+            "prompt": None,
+            "cache_vector": None,
+            "cache_bucket": None,
+        }
+        
+        # Serve a stored answer for a near-identical question over the same chunks
+        if use_cache:
+            plan["cache_vector"] = vectors[-1]
+            plan["cache_bucket"] = (cache_scope, frozenset(
+                hashlib.sha1(doc["content"].encode('utf-8')).hexdigest() for doc in retrieved_docs
+            ))
+            plan["cached_answer"] = self.answer_cache.lookup(plan["cache_vector"], plan["cache_bucket"])
+            if plan["cached_answer"]:
+                set_path("rag_cached")
+                return plan
+        
+        # Extract content from retrieved documents
+        with timed_stage('prompt_build'):
+            context = "\n\n".join([doc["content"] for doc in retrieved_docs])
+            plan["prompt"] = self.prompt.format(question=question, context=context)
+        return plan
+    
+    def remember_answer(self, plan: Dict[str, Any], answer: str) -> None:
+        """Store a freshly generated answer in the semantic cache for a planned query."""
+        if plan.get("cache_bucket") is not None and answer:
+            self.answer_cache.store(plan["cache_vector"], plan["cache_bucket"], answer)
+    
+    def query(self, question: str, cache_text: Optional[str] = None, cache_scope: str = "",
+              use_cache: bool = True, filters: Optional[List] = None) -> Dict[str, Any]:
         """
         Query the RAG system with a question.
         
         Args:
             question: The user's question
+            cache_text: Text whose meaning keys the answer cache (see plan_query())
+            cache_scope: Extra context that must match exactly for a cache hit
+            use_cache: Set to False to bypass the semantic answer cache for this request
             
         Returns:
             Dict containing the answer and retrieved contexts
         """
-        if not self.enabled or not self.retriever or not self.rag_chain:
-            return {
-                "answer": None,
-                "context_used": False,
-                "error": "RAG system not properly initialized"
-            }
-            
         try:
-            # Retrieve relevant documents
-            retrieved_docs = self.retriever.invoke(question)
+            plan = self.plan_query(question, cache_text, cache_scope, use_cache)
             
-            if not retrieved_docs:
+            if plan["cached_answer"]:
                 return {
-                    "answer": None, 
-                    "context_used": False,
-                    "error": "No relevant context found"
+                    "answer": plan["cached_answer"],
+                    "context_used": True,
+                    "cached": True,
+                    "retrieved_docs": plan["retrieved_docs"]
                 }
-                
-            # Extract content from retrieved documents
-            context = "\n\n".join([doc.page_content for doc in retrieved_docs])
             
             # Generate the answer
-            answer = self.rag_chain.invoke({"question": question, "context": context})
+            answer = self.client.generate(
+                plan["prompt"],
+                model=self.model_name,
+                temperature=self.temperature,
+                timeout=300,
+                filters=filters
+            )
+            # Answers a filter cut short (length cap, safety) are not worth reusing
+            if not any(f.done for f in filters or ()):
+                self.remember_answer(plan, answer)
             
             return {
                 "answer": answer,
                 "context_used": True,
-                "retrieved_docs": [
-                    {"content": doc.page_content, "metadata": doc.metadata}
-                    for doc in retrieved_docs
-                ]
+                "cached": False,
+                "retrieved_docs": plan["retrieved_docs"]
             }
             
         except Exception as e:
@@ -256,6 +584,53 @@ class RAGHandler:
                 "error": str(e)
             }
     
+    def stream_query(self, question: str, cache_text: Optional[str] = None, cache_scope: str = "",
+                     use_cache: bool = True) -> Iterator[str]:
+        """
+        Query the RAG system and yield the answer as the model generates it.
+
+        A semantic cache hit is yielded as a single fragment. A fully streamed
+        answer is stored in the cache once generation completes.
+
+        Args:
+            question: The user's question
+            cache_text: Text whose meaning keys the answer cache (see plan_query())
+            cache_scope: Extra context that must match exactly for a cache hit
+            use_cache: Set to False to bypass the semantic answer cache
+
+        Yields:
+            str: Fragments of the raw model answer (thinking sections included)
+
+        Raises:
+            RuntimeError: If the RAG system is not initialized or no context was found
+        """
+        plan = self.plan_query(question, cache_text, cache_scope, use_cache)
+        if plan["cached_answer"]:
+            yield plan["cached_answer"]
+            return
+
+        pieces = []
+        tokens = self.client.generate_stream(
+            plan["prompt"],
+            model=self.model_name,
+            temperature=self.temperature,
+            timeout=300
+        )
+        try:
+            for token in tokens:
+                pieces.append(token)
+                yield token
+        finally:
+            # Stops the generation if the consumer closes this stream early
+            tokens.close()
+
+        self.remember_answer(plan, strip_think(''.join(pieces)))
+
+    def warm_up(self) -> None:
+        """Run a throwaway retrieval so the query embedding model is loaded before real traffic."""
+        if self.is_enabled():
+            self.retriever.invoke("warm up")
+
     def is_enabled(self) -> bool:
         """Check if RAG functionality is enabled and ready."""
-        return self.enabled and self.retriever is not None and self.rag_chain is not None
+        return self.enabled and self.retriever is not None
@@ -0,0 +1,162 @@
+"""
+Versioned Cache for AI-Enhanced Clinical Reports
+
+Generating a clinical report is a full LLM generation, yet the report only
+changes when the user's timeline does. This module stores the last good report
+per user together with the version (a hash of the timeline entries) it was
+generated from:
+
+    version matches         the stored report is served immediately ("ready")
+    timeline has changed    the stored report is served while a new one is
+                            generated in the background ("updating")
+    no report yet           the rule-based summary is served while the first
+                            report is generated ("generating")
+
+Reports are kept in the application database (see storage.py), so they survive
+restarts. Regeneration runs as a "clinical_report" job on the background job
+queue (see job_queue.py); a user has at most one pending at a time, and the
+timeline page polls the job until the new report is ready. A failed generation
+is retried on a later view, after REPORT_RETRY_SECONDS.
+
+Configuration is read from the environment:
+    REPORT_RETRY_SECONDS   Wait before retrying a failed generation (default 30)
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, Any, Callable
+
+from job_queue import JobQueueFull
+
+REPORT_RETRY_SECONDS = float(os.environ.get("REPORT_RETRY_SECONDS", "30"))
+
+JOB_KIND = "clinical_report"
+
+
+def timeline_version(timeline_data: Dict[str, Any]) -> str:
+    """Hash of the timeline entries; any change to them produces a new version."""
+    entries = json.dumps(timeline_data.get('entries', []), sort_keys=True, default=str)
+    return hashlib.sha256(entries.encode('utf-8')).hexdigest()[:16]
+
+
+class ClinicalReportCache:
+    """Per-user report cache with stale-while-regenerating background updates."""
+
+    def __init__(self, store, jobs, generate_report: Callable[[Dict[str, Any]], str],
+                 basic_summary: Callable[[Dict[str, Any]], str], acquire=None,
+                 retry_seconds: float = REPORT_RETRY_SECONDS):
+        """
+        Initialize the cache and register its job handler.
+
+        Args:
+            store: Dict-style persistent table of reports by username (e.g. storage.RecordTable)
+            jobs: Background job queue running the regenerations (job_queue.JobQueue)
+            generate_report: Function producing the AI-enhanced report for a timeline (slow); it must
+                raise on failure, since whatever it returns is stored as the report for that version
+            basic_summary: Function producing the rule-based summary for a timeline (fast)
+            acquire: Optional function returning a scheduler lease for a username, held while generating
+            retry_seconds: Wait before retrying a failed generation of the same version
+        """
+        self.store = store
+        self.jobs = jobs
+        self.generate_report = generate_report
+        self.basic_summary = basic_summary
+        self.acquire = acquire
+        self.retry_seconds = retry_seconds
+
+        self._lock = threading.Lock()
+        self._failures = {}  # username -> (version, monotonic time of failure)
+
+        self.generated = 0
+        self.failed = 0
+        self.served_fresh = 0
+        self.served_stale = 0
+
+        jobs.register(JOB_KIND, self._regenerate)
+
+    def get(self, username: str, timeline_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Return the report to show now, starting a background regeneration if it is out of date.
+
+        Args:
+            username: The user whose report is requested
+            timeline_data: The user's current timeline
+
+        Returns:
+            Dict with 'report', 'state' ("ready", "updating" or "generating"), 'version',
+            'generated_at' and the 'job_id' to poll while a new report is generated (or None)
+        """
+        version = timeline_version(timeline_data)
+        cached = self.store.get(username)
+
+        if cached and cached.get('version') == version:
+            with self._lock:
+                self.served_fresh += 1
+            return dict(cached, state='ready', job_id=None)
+
+        job_id = self._start(username, timeline_data, version)
+        with self._lock:
+            self.served_stale += 1
+        if cached:
+            return dict(cached, state='updating', job_id=job_id)
+        return {
+            'report': self.basic_summary(timeline_data),
+            'version': None,
+            'generated_at': None,
+            'state': 'generating',
+            'job_id': job_id,
+        }
+
+    def _start(self, username: str, timeline_data: Dict[str, Any], version: str):
+        """Submit a regeneration job and return its id (None while backing off after a failure)."""
+        with self._lock:
+            failure = self._failures.get(username)
+            if failure and failure[0] == version and time.monotonic() - failure[1] < self.retry_seconds:
+                return None
+        try:
+            # One pending job per user; a view after it finishes starts another if the timeline changed again
+            job = self.jobs.submit(JOB_KIND, {'username': username, 'timeline': timeline_data, 'version': version},
+                                   dedup_key=username)
+        except JobQueueFull:
+            return None
+        return job['id']
+
+    def _regenerate(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Job handler: generate and store the report for one timeline version."""
+        username, version = payload['username'], payload['version']
+        try:
+            if self.acquire is not None:
+                with self.acquire(username):
+                    report = self.generate_report(payload['timeline'])
+            else:
+                report = self.generate_report(payload['timeline'])
+        except Exception:
+            with self._lock:
+                self._failures[username] = (version, time.monotonic())
+                self.failed += 1
+            raise
+
+        generated_at = datetime.now().isoformat()
+        self.store[username] = {
+            'report': report,
+            'version': version,
+            'generated_at': generated_at,
+        }
+        with self._lock:
+            self._failures.pop(username, None)
+            self.generated += 1
+        return {'username': username, 'version': version, 'generated_at': generated_at}
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache and background generation counters for monitoring."""
+        with self._lock:
+            return {
+                'served_fresh': self.served_fresh,
+                'served_stale': self.served_stale,
+                'generated': self.generated,
+                'failed': self.failed,
+            }
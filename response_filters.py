@@ -0,0 +1,435 @@
+"""
+Streaming Response Filters
+
+Model output reaches the user through a pipeline of filters that work on the
+token stream as it is generated:
+
+    ThinkStripper         drops <think>...</think> reasoning sections; tags may be
+                          split across tokens, so partial tags are held back
+    SafetyFilter          base class for pluggable content checks; text is released a
+                          sentence at a time, and a sentence that fails the check ends
+                          the reply with a safe message instead
+    PatternSafetyFilter   SafetyFilter over a list of regular expressions
+    LengthCap             ends the reply after a number of visible characters
+    CancelFilter          ends the reply when a check says nobody is waiting for it
+                          (the client disconnected, see disconnect.py)
+
+Each filter consumes text with feed() and returns the text to pass on; flush()
+releases whatever it held back once the stream ends. When a filter decides the
+reply is complete (its `done` flag), filter_stream() stops reading and closes
+the upstream token generator, which closes the HTTP response so Ollama stops
+generating tokens nobody will see. Complete responses (the non-streaming API,
+the CLI fallback) go through the same filters with filter_text().
+
+Extra safety filters are registered with register_safety_filter() and included
+in every chat reply built with chat_filters().
+
+Configuration is read from the environment:
+    RESPONSE_MAX_CHARS        Visible characters per chat reply, 0 for no cap (default 4000)
+    RESPONSE_BLOCKLIST_FILE   File of regular expressions, one per line; a reply sentence
+                              matching any of them ends the reply (default: none)
+    RESPONSE_BLOCKED_MESSAGE  Text sent in place of a blocked sentence
+"""
+
+import os
+import re
+import logging
+from typing import Callable, Iterable, Iterator, AsyncIterator, List, Optional
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_MAX_CHARS = int(os.environ.get("RESPONSE_MAX_CHARS", "4000"))
+RESPONSE_BLOCKLIST_FILE = os.environ.get("RESPONSE_BLOCKLIST_FILE", "")
+RESPONSE_BLOCKED_MESSAGE = os.environ.get(
+    "RESPONSE_BLOCKED_MESSAGE",
+    "I'm not able to continue with that. If you are struggling, please reach out to a mental health "
+    "professional or a crisis line such as 988 (US) or 116 123 (UK)."
+)
+
+# Characters after which a SafetyFilter releases the text it has checked
+SENTENCE_ENDINGS = re.compile(r'[.!?\n]')
+
+FILTER_STOPS = REGISTRY.counter(
+    "chatbot_response_filter_stops_total",
+    "Replies ended early by a response filter, closing the model stream.",
+    ("filter",),
+)
+
+
+class ResponseFilter:
+    """
+    One stage of a response pipeline.
+
+    Subclasses override feed() and flush(). A filter sets `done` once the reply is
+    complete; from then on it passes nothing on.
+    """
+
+    name = "filter"
+
+    def __init__(self):
+        self.done = False
+
+    def feed(self, text: str) -> str:
+        """Consume text and return the part to pass on now."""
+        return "" if self.done else text
+
+    def flush(self) -> str:
+        """Return any held-back text once the stream has ended."""
+        return ""
+
+
+class ThinkStripper(ResponseFilter):
+    """
+    Incremental <think>...</think> remover for streamed model output.
+
+    Tags may be split across chunks, so a possible partial tag at the end of the
+    buffer is held back until the next chunk arrives. Leading whitespace of the
+    visible answer is dropped, and an unterminated thinking section hides
+    everything after it.
+    """
+
+    name = "think"
+
+    def __init__(self):
+        super().__init__()
+        self.buffer = ""
+        self.in_think = False
+        self.started = False
+
+    def _visible(self, text: str) -> str:
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        return text
+
+    def feed(self, chunk: str) -> str:
+        """Consume a chunk and return the text that is now known to be visible."""
+        self.buffer += chunk
+        output = []
+        while self.buffer:
+            tag = "</think>" if self.in_think else "<think>"
+            index = self.buffer.find(tag)
+            if index >= 0:
+                if not self.in_think:
+                    output.append(self._visible(self.buffer[:index]))
+                self.buffer = self.buffer[index + len(tag):]
+                self.in_think = not self.in_think
+                continue
+
+            # Hold back the longest suffix that could still become the tag
+            keep = 0
+            for size in range(min(len(tag) - 1, len(self.buffer)), 0, -1):
+                if self.buffer.endswith(tag[:size]):
+                    keep = size
+                    break
+            if not self.in_think:
+                output.append(self._visible(self.buffer[:len(self.buffer) - keep]))
+            self.buffer = self.buffer[len(self.buffer) - keep:]
+            break
+        return "".join(output)
+
+    def flush(self) -> str:
+        """Return any held-back text once the stream has ended."""
+        text = "" if self.in_think else self._visible(self.buffer)
+        self.buffer = ""
+        return text
+
+
+class LengthCap(ResponseFilter):
+    """Ends the reply once it reaches a number of visible characters, cutting at a word boundary."""
+
+    name = "length"
+
+    def __init__(self, max_chars: int = RESPONSE_MAX_CHARS):
+        super().__init__()
+        self.remaining = max_chars
+        self.emitted = False
+        self.word = ""  # trailing partial word, held until it is known to fit
+
+    def _emit(self, text: str) -> str:
+        if len(text) <= self.remaining:
+            self.remaining -= len(text)
+            self.emitted = self.emitted or bool(text)
+            return text
+        cut = text[:self.remaining]
+        if not text[self.remaining].isspace():
+            # Don't end the reply in the middle of a word (unless it is the first one)
+            space = max(cut.rfind(" "), cut.rfind("\n"))
+            if space > 0 or self.emitted:
+                cut = cut[:max(space, 0)]
+        self.remaining = 0
+        self.done = True
+        return cut.rstrip()
+
+    def feed(self, text: str) -> str:
+        if self.done:
+            return ""
+        text = self.word + text
+        if not text:
+            return ""
+        if text[-1].isspace():
+            split = len(text)
+        else:
+            split = max(text.rfind(" "), text.rfind("\n")) + 1
+        self.word = text[split:]
+        output = self._emit(text[:split])
+        if not self.done and len(self.word) > self.remaining:
+            # The word being received can no longer fit
+            output += self._emit(self.word)
+        return output
+
+    def flush(self) -> str:
+        if self.done or not self.word:
+            return ""
+        text, self.word = self.word, ""
+        return self._emit(text)
+
+
+class CancelFilter(ResponseFilter):
+    """Ends the reply as soon as `is_cancelled()` returns True; placed first, it is checked on every token."""
+
+    name = "disconnect"
+
+    def __init__(self, is_cancelled: Callable[[], bool]):
+        super().__init__()
+        self.is_cancelled = is_cancelled
+
+    def feed(self, text: str) -> str:
+        if self.done or self.is_cancelled():
+            self.done = True
+            return ""
+        return text
+
+
+class SafetyFilter(ResponseFilter):
+    """
+    Base class for pluggable content checks.
+
+    Text is held back until a sentence ends, then passed to check(). A sentence
+    that fails the check is replaced by `message` and the reply ends there; text
+    already released stays with the user, so checks never see less than a sentence.
+    """
+
+    name = "safety"
+
+    def __init__(self, message: str = RESPONSE_BLOCKED_MESSAGE):
+        super().__init__()
+        self.message = message
+        self.pending = ""
+        self.released = False
+
+    def check(self, text: str) -> bool:
+        """Return True if the text must not be shown. Subclasses implement this."""
+        raise NotImplementedError
+
+    def _release(self, text: str) -> str:
+        if self.check(text):
+            self.done = True
+            logger.info("Response blocked by safety filter", extra={'filter': self.name})
+            return (" " if self.released else "") + self.message
+        self.released = self.released or bool(text)
+        return text
+
+    def feed(self, text: str) -> str:
+        if self.done:
+            return ""
+        self.pending += text
+        last = None
+        for last in SENTENCE_ENDINGS.finditer(text):
+            pass
+        if last is None:
+            return ""
+        # The last sentence ending is inside the new text, so its position in pending is known
+        end = len(self.pending) - len(text) + last.end()
+        sentences, self.pending = self.pending[:end], self.pending[end:]
+        return self._release(sentences)
+
+    def flush(self) -> str:
+        if self.done or not self.pending:
+            return ""
+        text, self.pending = self.pending, ""
+        return self._release(text)
+
+
+class PatternSafetyFilter(SafetyFilter):
+    """SafetyFilter blocking sentences that match any of a list of regular expressions."""
+
+    name = "pattern"
+
+    def __init__(self, patterns: Iterable[str], message: str = RESPONSE_BLOCKED_MESSAGE):
+        super().__init__(message)
+        self.pattern = re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)
+
+    def check(self, text: str) -> bool:
+        return self.pattern.search(text) is not None
+
+
+class FilterPipeline:
+    """Filters applied in order; text a filter passes on is fed to the next one."""
+
+    def __init__(self, filters: List[ResponseFilter]):
+        self.filters = list(filters)
+
+    @property
+    def done(self) -> bool:
+        """Whether a filter has ended the reply."""
+        return any(f.done for f in self.filters)
+
+    def stopped_by(self) -> Optional[str]:
+        """Name of the first filter that ended the reply, if any."""
+        return next((f.name for f in self.filters if f.done), None)
+
+    def feed(self, chunk: str) -> str:
+        for f in self.filters:
+            if not chunk:
+                break
+            chunk = f.feed(chunk)
+        return chunk
+
+    def flush(self) -> str:
+        text = ""
+        for f in self.filters:
+            text = (f.feed(text) if text else "") + f.flush()
+        return text
+
+
+_safety_filter_factories: List[Callable[[], SafetyFilter]] = []
+
+
+def register_safety_filter(factory: Callable[[], SafetyFilter]) -> None:
+    """
+    Add a safety filter to every chat reply.
+
+    Args:
+        factory: Callable returning a new filter instance (filters keep per-reply state)
+    """
+    _safety_filter_factories.append(factory)
+
+
+def load_blocklist(path: str) -> List[str]:
+    """Read regular expressions from a file, one per line; blank lines and # comments are skipped."""
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+if RESPONSE_BLOCKLIST_FILE:
+    try:
+        _blocklist = load_blocklist(RESPONSE_BLOCKLIST_FILE)
+        if _blocklist:
+            register_safety_filter(lambda: PatternSafetyFilter(_blocklist))
+            logger.info(f"Loaded {len(_blocklist)} response blocklist patterns from {RESPONSE_BLOCKLIST_FILE}")
+    except (OSError, re.error) as e:
+        logger.error(f"Could not load response blocklist {RESPONSE_BLOCKLIST_FILE}: {str(e)}")
+
+
+def chat_filters(max_chars: int = RESPONSE_MAX_CHARS,
+                 is_cancelled: Optional[Callable[[], bool]] = None) -> List[ResponseFilter]:
+    """
+    The filters for one chat reply: thinking removal, the length cap and registered safety filters.
+
+    The cap comes before the safety filters so a blocked reply's message is never cut short.
+
+    Args:
+        max_chars: Visible characters allowed, 0 for no cap
+        is_cancelled: Optional check that ends generation once nobody is waiting for the reply
+    """
+    filters = [CancelFilter(is_cancelled)] if is_cancelled is not None else []
+    filters.append(ThinkStripper())
+    if max_chars > 0:
+        filters.append(LengthCap(max_chars))
+    filters.extend(factory() for factory in _safety_filter_factories)
+    return filters
+
+
+def _record_stop(pipeline: FilterPipeline) -> None:
+    name = pipeline.stopped_by()
+    FILTER_STOPS.inc(filter=name)
+    logger.debug("Reply ended early, closing the model stream", extra={'filter': name})
+
+
+def filter_stream(tokens: Iterator[str], filters: Optional[List[ResponseFilter]] = None) -> Iterator[str]:
+    """
+    Run a token stream through response filters.
+
+    The upstream generator is closed as soon as a filter ends the reply (or the
+    consumer stops reading), which stops the Ollama generation behind it.
+
+    Args:
+        tokens: Iterator of raw model tokens
+        filters: The filters to apply (default: ThinkStripper only)
+
+    Yields:
+        str: Visible text fragments
+    """
+    pipeline = FilterPipeline(filters if filters is not None else [ThinkStripper()])
+    try:
+        for token in tokens:
+            text = pipeline.feed(token)
+            if text:
+                yield text
+            if pipeline.done:
+                _record_stop(pipeline)
+                break
+    finally:
+        close = getattr(tokens, "close", None)
+        if close is not None:
+            close()
+    text = pipeline.flush()
+    if text:
+        yield text
+
+
+async def afilter_stream(tokens: AsyncIterator[str], filters: Optional[List[ResponseFilter]] = None,
+                         on_complete: Optional[Callable[[str], None]] = None) -> AsyncIterator[str]:
+    """
+    Async counterpart of filter_stream().
+
+    Args:
+        tokens: Async iterator of raw model tokens
+        filters: The filters to apply (default: ThinkStripper only)
+        on_complete: Optional callback receiving the visible reply if the stream ran to its end
+    """
+    pipeline = FilterPipeline(filters if filters is not None else [ThinkStripper()])
+    pieces = []
+    try:
+        async for token in tokens:
+            text = pipeline.feed(token)
+            if text:
+                pieces.append(text)
+                yield text
+            if pipeline.done:
+                _record_stop(pipeline)
+                break
+    finally:
+        close = getattr(tokens, "aclose", None)
+        if close is not None:
+            await close()
+    text = pipeline.flush()
+    if text:
+        pieces.append(text)
+        yield text
+    if on_complete is not None and not pipeline.done:
+        on_complete(''.join(pieces).strip())
+
+
+def filter_text(text: str, filters: Optional[List[ResponseFilter]] = None) -> str:
+    """
+    Apply response filters to a complete response.
+
+    Args:
+        text: The raw model output
+        filters: The filters to apply (default: ThinkStripper only)
+
+    Returns:
+        str: The visible response, without surrounding whitespace
+    """
+    pipeline = FilterPipeline(filters if filters is not None else [ThinkStripper()])
+    return (pipeline.feed(text) + pipeline.flush()).strip()
+
+
+def strip_think(text: str) -> str:
+    """Remove <think>...</think> sections and surrounding whitespace from a full response."""
+    return filter_text(text)
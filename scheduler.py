@@ -0,0 +1,356 @@
+"""
+Admission Control and Fair Scheduling for Ollama Generations
+
+The local Ollama server only runs a handful of generations at once; anything
+beyond that queues inside Ollama where every request slows down together. This
+module keeps that queue in the application instead, where it can be bounded and
+made fair:
+
+    - at most `max_in_flight` generations hold a slot at any time
+    - at most `max_queue` requests wait for a slot
+    - waiting requests are granted slots round-robin by username, so one user
+      sending many messages cannot starve everyone else
+    - a request whose expected wait exceeds `max_wait_seconds` is rejected up
+      front with SchedulerBusy (the routes turn this into 429 + Retry-After),
+      and a request that has waited that long is rejected as well
+
+Slots can be awaited from threads (Flask) and from asyncio (the ASGI app). A
+request whose client disconnects while queued gives up its place (counted as
+"cancelled").
+
+Priority requests (from users the crisis detector flagged, see
+crisis_detector.py) wait in separate per-user queues that are served, also
+round-robin, before everyone else's. They have their own bound and wait budget,
+estimated from the priority requests ahead of them only. A user has at most one
+priority request waiting; further ones, and any beyond the priority bound, queue
+normally.
+
+Configuration is read from the environment:
+    SCHEDULER_MAX_IN_FLIGHT   Concurrent generations sent to Ollama (default 2)
+    SCHEDULER_MAX_QUEUE       Maximum waiting requests (default 32)
+    SCHEDULER_MAX_WAIT        Queue wait budget in seconds (default 30)
+    SCHEDULER_MAX_PRIORITY_QUEUE  Maximum waiting priority requests (default 8)
+"""
+
+import os
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_MAX_IN_FLIGHT = int(os.environ.get("SCHEDULER_MAX_IN_FLIGHT", "2"))
+SCHEDULER_MAX_QUEUE = int(os.environ.get("SCHEDULER_MAX_QUEUE", "32"))
+SCHEDULER_MAX_WAIT = float(os.environ.get("SCHEDULER_MAX_WAIT", "30"))
+SCHEDULER_MAX_PRIORITY_QUEUE = int(os.environ.get("SCHEDULER_MAX_PRIORITY_QUEUE", "8"))
+
+# Weight of the newest sample in the moving averages of wait and service time
+EWMA_ALPHA = 0.2
+
+
+class SchedulerBusy(Exception):
+    """Raised when a request cannot be given a slot within the wait budget."""
+
+    def __init__(self, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class RequestCancelled(Exception):
+    """Raised when a request's client went away while it was waiting for a slot."""
+
+
+class _Ticket:
+    __slots__ = ("username", "priority", "enqueued", "granted", "event", "loop", "future")
+
+    def __init__(self, username, priority=False):
+        self.username = username
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.event = threading.Event()
+        self.loop = None
+        self.future = None
+
+    def wake(self):
+        self.event.set()
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(self._resolve_future)
+
+    def _resolve_future(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class Lease:
+    """A granted slot. Release it when the generation (including any stream) is finished."""
+
+    def __init__(self, scheduler, wait_seconds: float):
+        self._scheduler = scheduler
+        self._started = time.monotonic()
+        self._released = False
+        self.wait_seconds = wait_seconds
+
+    def release(self) -> None:
+        """Give the slot back; safe to call more than once."""
+        if not self._released:
+            self._released = True
+            self._scheduler._release(time.monotonic() - self._started)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class GenerationScheduler:
+    """Bounded, per-user round-robin queue in front of the Ollama client."""
+
+    def __init__(self, max_in_flight=SCHEDULER_MAX_IN_FLIGHT, max_queue=SCHEDULER_MAX_QUEUE,
+                 max_wait_seconds=SCHEDULER_MAX_WAIT, max_priority_queue=SCHEDULER_MAX_PRIORITY_QUEUE):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_in_flight (int): Generations allowed to run at once
+            max_queue (int): Requests allowed to wait for a slot
+            max_wait_seconds (float): Longest a request may (be expected to) wait
+            max_priority_queue (int): Priority requests allowed to wait, on top of max_queue
+        """
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.max_priority_queue = max(0, max_priority_queue)
+        self.max_wait_seconds = max_wait_seconds
+
+        self._queues = OrderedDict()    # username -> deque of tickets, next user to serve first
+        self._priority = OrderedDict()  # the same for priority tickets, served before all of the above
+        self._queued = 0
+        self._priority_queued = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+        self._avg_service = None      # seconds a slot is held, moving average
+        self._avg_wait = 0.0          # seconds spent queued, moving average
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.prioritized = 0
+
+    def _estimated_wait(self, priority: bool = False) -> float:
+        """Expected queue wait for a new request; caller holds the lock."""
+        if self._in_flight < self.max_in_flight or self._avg_service is None:
+            return 0.0
+        # A priority request only waits behind other priority requests
+        ahead = self._priority_queued if priority else self._queued + self._priority_queued
+        return (ahead // self.max_in_flight + 1) * self._avg_service
+
+    def _retry_after(self, priority: bool = False) -> int:
+        return max(1, math.ceil(self._estimated_wait(priority) or self.max_wait_seconds))
+
+    def _record_wait(self, wait_seconds: float) -> None:
+        self._avg_wait += EWMA_ALPHA * (wait_seconds - self._avg_wait)
+        self.admitted += 1
+
+    def _enqueue(self, username: str, priority: bool = False):
+        """Grant a slot immediately or queue a ticket; caller holds the lock."""
+        # A user jumps the queue with one request at a time, and only while there is room
+        # among the priority requests; otherwise the request waits its normal turn
+        priority = (priority and username not in self._priority
+                    and self._priority_queued < self.max_priority_queue)
+        if priority:
+            self.prioritized += 1
+        if self._in_flight < self.max_in_flight and not self._queued and not self._priority_queued:
+            self._in_flight += 1
+            self._record_wait(0.0)
+            return None
+
+        if not priority and self._queued >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerBusy(self._retry_after(priority), "queue full")
+        if self._estimated_wait(priority) > self.max_wait_seconds:
+            self.rejected += 1
+            raise SchedulerBusy(self._retry_after(priority), "expected wait exceeds budget")
+
+        ticket = _Ticket(username, priority)
+        if priority:
+            self._priority.setdefault(username, deque()).append(ticket)
+            self._priority_queued += 1
+        else:
+            self._queues.setdefault(username, deque()).append(ticket)
+            self._queued += 1
+        return ticket
+
+    @staticmethod
+    def _next_ticket(queues: OrderedDict):
+        """Take the next ticket round-robin from per-user queues; caller holds the lock."""
+        username, tickets = next(iter(queues.items()))
+        ticket = tickets.popleft()
+        if tickets:
+            queues.move_to_end(username)
+        else:
+            del queues[username]
+        return ticket
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiting users in round-robin order, priority users first; caller holds the lock."""
+        while self._in_flight < self.max_in_flight and (self._queued or self._priority_queued):
+            if self._priority_queued:
+                ticket = self._next_ticket(self._priority)
+                self._priority_queued -= 1
+            else:
+                ticket = self._next_ticket(self._queues)
+                self._queued -= 1
+
+            ticket.granted = True
+            self._in_flight += 1
+            self._record_wait(time.monotonic() - ticket.enqueued)
+            ticket.wake()
+
+    def _cancel(self, ticket, client_gone: bool = False) -> bool:
+        """
+        Withdraw a ticket that gave up waiting.
+
+        Args:
+            ticket: The waiting ticket
+            client_gone: True if the client disconnected, False if the wait timed out
+
+        Returns:
+            bool: False if the ticket was granted in the meantime (the caller owns a slot)
+        """
+        with self._lock:
+            if ticket.granted:
+                return False
+            queues = self._priority if ticket.priority else self._queues
+            tickets = queues.get(ticket.username)
+            if tickets is not None and ticket in tickets:
+                tickets.remove(ticket)
+                if ticket.priority:
+                    self._priority_queued -= 1
+                else:
+                    self._queued -= 1
+                if not tickets:
+                    del queues[ticket.username]
+            if client_gone:
+                self.cancelled += 1
+            else:
+                self.timed_out += 1
+            return True
+
+    def _release(self, service_seconds: Optional[float]) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if service_seconds is None:
+                pass
+            elif self._avg_service is None:
+                self._avg_service = service_seconds
+            else:
+                self._avg_service += EWMA_ALPHA * (service_seconds - self._avg_service)
+            self._dispatch()
+
+    def acquire(self, username: Optional[str] = None, is_cancelled: Optional[Callable[[], bool]] = None,
+                poll_seconds: float = 0.25, priority: bool = False) -> Lease:
+        """
+        Wait for a generation slot from a worker thread.
+
+        Args:
+            username (str): User the request belongs to, for round-robin fairness
+            is_cancelled: Optional check, polled while waiting, that returns True once the
+                client has gone away (see disconnect.py)
+            poll_seconds (float): Interval between is_cancelled checks
+            priority (bool): Serve the request before the round-robin queues, if the user has no
+                other priority request waiting and the priority queue has room
+
+        Returns:
+            Lease: The granted slot
+
+        Raises:
+            SchedulerBusy: If the slot cannot be granted within the wait budget
+            RequestCancelled: If is_cancelled reported the client gone while waiting
+        """
+        with self._lock:
+            ticket = self._enqueue(username or 'anonymous', priority)
+        if ticket is None:
+            return Lease(self, 0.0)
+
+        deadline = ticket.enqueued + self.max_wait_seconds
+        interval = poll_seconds if is_cancelled is not None else self.max_wait_seconds
+        while not ticket.event.wait(max(0.0, min(deadline - time.monotonic(), interval))):
+            if is_cancelled is not None and is_cancelled():
+                if not self._cancel(ticket, client_gone=True):
+                    self._release(None)
+                raise RequestCancelled("client disconnected while waiting for a slot")
+            if time.monotonic() >= deadline:
+                if self._cancel(ticket):
+                    raise SchedulerBusy(self._retry_after(ticket.priority), "timed out waiting for a slot")
+                break
+        return Lease(self, time.monotonic() - ticket.enqueued)
+
+    async def acquire_async(self, username: Optional[str] = None, priority: bool = False) -> Lease:
+        """Wait for a generation slot from a coroutine (see acquire)."""
+        with self._lock:
+            ticket = self._enqueue(username or 'anonymous', priority)
+            if ticket is not None:
+                ticket.loop = asyncio.get_running_loop()
+                ticket.future = ticket.loop.create_future()
+        if ticket is None:
+            return Lease(self, 0.0)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            if self._cancel(ticket):
+                raise SchedulerBusy(self._retry_after(ticket.priority), "timed out waiting for a slot")
+        except asyncio.CancelledError:
+            # Client went away while queued: withdraw, or give back a slot granted meanwhile
+            if not self._cancel(ticket, client_gone=True):
+                self._release(None)
+            raise
+        return Lease(self, time.monotonic() - ticket.enqueued)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, wait times and admission counters."""
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'max_in_flight': self.max_in_flight,
+                'queue_depth': self._queued,
+                'max_queue': self.max_queue,
+                'queued_users': len(self._queues),
+                'priority_queued': self._priority_queued,
+                'max_priority_queue': self.max_priority_queue,
+                'oldest_wait_ms': int(max(
+                    (time.monotonic() - tickets[0].enqueued
+                     for tickets in list(self._queues.values()) + list(self._priority.values())),
+                    default=0.0
+                ) * 1000),
+                'avg_wait_ms': int(self._avg_wait * 1000),
+                'avg_service_ms': int((self._avg_service or 0.0) * 1000),
+                'estimated_wait_ms': int(self._estimated_wait() * 1000),
+                'max_wait_ms': int(self.max_wait_seconds * 1000),
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'cancelled': self.cancelled,
+                'prioritized': self.prioritized,
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> GenerationScheduler:
+    """Return the process-wide scheduler, creating it on first use."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = GenerationScheduler()
+    return _scheduler
@@ -0,0 +1,178 @@
+"""
+Semantic Answer Cache for the RAG System
+
+This module caches generated RAG answers keyed by the embedding of the user's
+query. A stored answer is reused when a new query is close enough in meaning
+(cosine similarity above a threshold) and retrieval returned the same set of
+chunks, so near-paraphrases don't pay for another LLM generation.
+
+Configuration is read from the environment:
+    SEMANTIC_CACHE_THRESHOLD   Minimum cosine similarity for a hit (default 0.92)
+    SEMANTIC_CACHE_MAX_ENTRIES Maximum number of cached answers (default 1000)
+    SEMANTIC_CACHE_TTL         Seconds before an answer expires (default 3600)
+    SEMANTIC_CACHE_MAX_BYTES   Approximate memory budget in bytes (default 32 MB)
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Hashable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+SEMANTIC_CACHE_TTL = float(os.environ.get("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_MAX_BYTES = int(os.environ.get("SEMANTIC_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Rough per-entry bookkeeping cost on top of the vector and answer text
+ENTRY_OVERHEAD_BYTES = 256
+
+
+class _CacheEntry:
+    __slots__ = ("vector", "bucket", "answer", "created", "size")
+
+    def __init__(self, vector, bucket, answer, created):
+        self.vector = vector
+        self.bucket = bucket
+        self.answer = answer
+        self.created = created
+        self.size = vector.nbytes + len(answer.encode('utf-8')) + ENTRY_OVERHEAD_BYTES
+
+
+class SemanticAnswerCache:
+    """
+    Embedding-keyed answer cache with LRU and TTL eviction and a memory budget.
+
+    Entries are grouped into buckets by the set of retrieved chunks (plus any
+    caller-supplied scope such as the system prompt), so a lookup only compares
+    the query vector against answers that were generated from the same context.
+    """
+
+    def __init__(self, similarity_threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl_seconds=SEMANTIC_CACHE_TTL, max_bytes=SEMANTIC_CACHE_MAX_BYTES):
+        """
+        Initialize the cache.
+
+        Args:
+            similarity_threshold (float): Minimum cosine similarity to reuse an answer
+            max_entries (int): Maximum number of cached answers
+            ttl_seconds (float): Seconds after which an answer is no longer served
+            max_bytes (int): Approximate memory budget for vectors and answers
+        """
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()  # entry id -> _CacheEntry, least recently used first
+        self._buckets = {}             # bucket key -> set of entry ids
+        self._next_id = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        ids = self._buckets.get(entry.bucket)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._buckets[entry.bucket]
+        self._bytes -= entry.size
+
+    def lookup(self, query_vector, bucket: Hashable) -> Optional[str]:
+        """
+        Find a cached answer for a query.
+
+        Args:
+            query_vector: Embedding of the user's query
+            bucket: Key of the retrieved context (e.g. the set of chunk ids)
+
+        Returns:
+            str or None: The cached answer on a hit
+        """
+        vector = self._normalize(query_vector)
+        now = time.monotonic()
+
+        with self._lock:
+            best_id, best_score = None, self.similarity_threshold
+            for entry_id in list(self._buckets.get(bucket, ())):
+                entry = self._entries[entry_id]
+                if now - entry.created > self.ttl_seconds:
+                    self._remove(entry_id)
+                    continue
+                score = float(np.dot(vector, entry.vector))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id].answer
+
+    def store(self, query_vector, bucket: Hashable, answer: str) -> None:
+        """
+        Cache an answer for a query.
+
+        Args:
+            query_vector: Embedding of the user's query
+            bucket: Key of the retrieved context the answer was generated from
+            answer: The generated answer
+        """
+        if not answer:
+            return
+
+        entry = _CacheEntry(self._normalize(query_vector), bucket, answer, time.monotonic())
+        if entry.size > self.max_bytes:
+            return
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._buckets.setdefault(bucket, set()).add(entry_id)
+            self._bytes += entry.size
+
+            # Evict least recently used entries until both limits are respected
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every cached answer (e.g. after the knowledge base changes)."""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'similarity_threshold': self.similarity_threshold,
+            }
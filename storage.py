@@ -0,0 +1,648 @@
+"""
+Durable Storage for Users, Conversations, Timelines and Feedback
+
+Application state used to live in module-level dicts and lists, so it was lost
+on restart and grew without bound. This module keeps it in an embedded SQLite
+database (WAL mode) and in front of it a bounded, read-through LRU cache:
+
+    reads    cache -> writes not yet committed -> database
+    writes   update the cache and are queued; a writer thread commits everything
+             queued so far in one transaction (group commit), off the request path
+
+Conversation ids are allocated from an in-process counter under a lock, so they
+are unique without waiting for the database. Writes still queued when the
+process exits normally are committed by an atexit hook; a hard crash loses
+only the writes that were still queued, normally a few milliseconds' worth.
+If a group commit fails, its writes are retried one per transaction, so only
+the write that actually fails is lost; it is logged, counted as failed in
+stats(), and reported to flush() callers.
+
+Configuration is read from the environment:
+    APP_DB_PATH            SQLite database file (default data/app.sqlite3)
+    STORAGE_CACHE_ENTRIES  Records cached per table (default 10000)
+    STORAGE_MAX_BATCH      Writes per group commit (default 1000)
+"""
+
+import os
+import json
+import queue
+import atexit
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, Any, Optional, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+APP_DB_PATH = os.environ.get(
+    "APP_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "app.sqlite3")
+)
+STORAGE_CACHE_ENTRIES = int(os.environ.get("STORAGE_CACHE_ENTRIES", "10000"))
+STORAGE_MAX_BATCH = int(os.environ.get("STORAGE_MAX_BATCH", "1000"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_timelines (
+    username TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversation_states (
+    username TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS clinical_reports (
+    username TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY,
+    username TEXT,
+    timestamp TEXT NOT NULL,
+    user_message TEXT,
+    bot_response TEXT,
+    feedback INTEGER
+);
+CREATE INDEX IF NOT EXISTS conversations_username ON conversations (username, timestamp);
+CREATE INDEX IF NOT EXISTS conversations_timestamp ON conversations (timestamp);
+CREATE INDEX IF NOT EXISTS conversations_rated ON conversations (id) WHERE feedback IS NOT NULL;
+CREATE TABLE IF NOT EXISTS review_stats (
+    rating INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS feedback_ratings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pattern TEXT NOT NULL,
+    rating INTEGER NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS feedback_ratings_pattern ON feedback_ratings (pattern);
+CREATE TABLE IF NOT EXISTS feedback_patterns (
+    pattern TEXT PRIMARY KEY,
+    weight REAL NOT NULL,
+    total REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_unfinished ON jobs (kind, created_at) WHERE status IN ('queued', 'running');
+"""
+
+CONVERSATION_COLUMNS = ("id", "username", "timestamp", "user_message", "bot_response", "feedback")
+
+# Valid feedback ratings
+RATINGS = range(1, 6)
+
+# Sentinel for "not in the cache" (a cached None means the record does not exist)
+_MISSING = object()
+
+
+class _LRU:
+    """A small bounded mapping that forgets the least recently used key."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        return default
+
+    def put(self, key, value) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, key) -> None:
+        self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _FlushMarker:
+    """Queued by flush(); set once every write queued before it has been committed or has failed."""
+
+    __slots__ = ("done", "failed_before", "failed_at")
+
+    def __init__(self, failed_before: int):
+        self.done = threading.Event()
+        self.failed_before = failed_before
+        self.failed_at = failed_before
+
+
+class Storage:
+    """SQLite-backed application store with a writer thread and read-through caches."""
+
+    def __init__(self, path: str = APP_DB_PATH, cache_entries: int = STORAGE_CACHE_ENTRIES,
+                 max_batch: int = STORAGE_MAX_BATCH):
+        """
+        Open (or create) the database and start the writer thread.
+
+        Args:
+            path: SQLite database file
+            cache_entries: Records cached per table
+            max_batch: Maximum writes committed in one transaction
+        """
+        self.path = path
+        self.max_batch = max(1, max_batch)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._writer_db = self._connect()
+        self._writer_db.executescript(SCHEMA)
+        self._local = threading.local()
+
+        self._lock = threading.Lock()
+        self._caches = defaultdict(lambda: _LRU(cache_entries))
+        self._pending = {}  # (table, key) -> (version, value) of queued, uncommitted writes
+        self._reserved = set()  # (table, key) of inserts still checking the database; never read
+        self._version = 0
+        self._queue = queue.Queue()
+
+        row = self._writer_db.execute("SELECT max(id) FROM conversations").fetchone()
+        self._next_conversation_id = (row[0] + 1) if row[0] is not None else 0
+
+        # Ratings histogram, kept current by set_feedback() so review stats never scan conversations
+        self._feedback_lock = threading.Lock()
+        self._rating_counts = self._load_rating_counts()
+
+        self.commits = 0
+        self.writes = 0
+        self.failed_writes = 0
+        self.largest_batch = 0
+
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="storage-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @property
+    def _reader(self) -> sqlite3.Connection:
+        """One read connection per thread; WAL lets readers run alongside the writer."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = self._connect()
+        return db
+
+    # -- Writer --------------------------------------------------------------------
+
+    def _enqueue(self, sql: str, params: Tuple, table: Optional[str] = None, key=None, value=None,
+                 also: List[Tuple[str, Tuple]] = (), on_commit: Optional[Callable[[], None]] = None) -> None:
+        """
+        Queue a write; if it replaces a cached record, remember it as pending until committed.
+
+        Statements in `also` are committed in the same transaction as the write, and
+        `on_commit` is called by the writer thread once they are (not if the write fails).
+        """
+        with self._lock:
+            self._version += 1
+            version = self._version
+            if table is not None:
+                self._pending[(table, key)] = (version, value)
+                self._caches[table].put(key, value)
+        self._queue.put(([(sql, params)] + list(also), table, key, version, on_commit))
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(batch)
+            if any(op is None for op in batch):
+                return
+
+    def _execute(self, writes: List) -> None:
+        """Run writes in one transaction, rolling it back if any statement fails."""
+        try:
+            self._writer_db.execute("BEGIN")
+            for statements, _, _, _, _ in writes:
+                for sql, params in statements:
+                    self._writer_db.execute(sql, params)
+            self._writer_db.execute("COMMIT")
+        except Exception:
+            try:
+                self._writer_db.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            raise
+
+    def _commit(self, batch: List) -> None:
+        writes = [op for op in batch if isinstance(op, tuple)]
+        failed = set()  # ids of the writes that could not be committed
+        if writes:
+            try:
+                self._execute(writes)
+                commits = 1
+            except Exception as e:
+                # Replay one write per transaction so one bad write does not take the others with it
+                logger.error(f"Error committing {len(writes)} storage writes, retrying them one by one: {str(e)}")
+                for write in writes:
+                    try:
+                        self._execute([write])
+                    except Exception as e:
+                        failed.add(id(write))
+                        statements, table, key, _, _ = write
+                        target = f"{table} {key!r}" if table is not None else statements[0][0].split("(")[0].strip()
+                        logger.error(f"Dropped storage write ({target}): {str(e)}")
+                commits = len(writes) - len(failed)
+
+            with self._lock:
+                for write in writes:
+                    _, table, key, version, _ = write
+                    if table is not None and self._pending.get((table, key), (None,))[0] == version:
+                        del self._pending[(table, key)]
+                        if id(write) in failed:
+                            # The cached value was never stored; the next read goes to the database
+                            self._caches[table].discard(key)
+                self.commits += commits
+                self.writes += len(writes) - len(failed)
+                self.failed_writes += len(failed)
+                self.largest_batch = max(self.largest_batch, len(writes))
+
+            for write in writes:
+                on_commit = write[4]
+                if on_commit is not None and id(write) not in failed:
+                    try:
+                        on_commit()
+                    except Exception as e:
+                        logger.error(f"Error in storage commit callback: {str(e)}")
+
+        # Wake up flush() callers whose markers were in this batch, telling each about
+        # the failures among the writes queued before it
+        failed_so_far = self.failed_writes - len(failed)
+        for op in batch:
+            if isinstance(op, tuple) and id(op) in failed:
+                failed_so_far += 1
+            elif isinstance(op, _FlushMarker):
+                op.failed_at = failed_so_far
+                op.done.set()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every write queued so far is committed.
+
+        Returns:
+            bool: False if the wait timed out or one of the writes it waited for failed
+        """
+        if self._closed:
+            return True
+        with self._lock:
+            marker = _FlushMarker(self.failed_writes)
+        self._queue.put(marker)
+        return marker.done.wait(timeout) and marker.failed_at == marker.failed_before
+
+    def close(self) -> None:
+        """Commit queued writes and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+
+    # -- Keyed JSON records --------------------------------------------------------
+
+    def get_record(self, table: str, key: str, default=None):
+        """Read a JSON record (users, user_timelines, conversation_states) by key."""
+        with self._lock:
+            value = self._caches[table].get(key, _MISSING)
+            if value is _MISSING and (table, key) in self._pending:
+                value = self._pending[(table, key)][1]
+        if value is _MISSING:
+            row = self._reader.execute(f"SELECT data FROM {table} WHERE username = ?", (key,)).fetchone()
+            value = json.loads(row[0]) if row else None
+            with self._lock:
+                # A write may have landed while reading; it wins over the database row
+                if (table, key) not in self._pending:
+                    self._caches[table].put(key, value)
+                else:
+                    value = self._pending[(table, key)][1]
+        return default if value is None else value
+
+    def put_record(self, table: str, key: str, value: Dict[str, Any]) -> None:
+        """Insert or replace a JSON record."""
+        self._enqueue(f"INSERT OR REPLACE INTO {table} (username, data) VALUES (?, ?)",
+                      (key, json.dumps(value, default=str)), table, key, value)
+
+    def insert_record(self, table: str, key: str, value: Dict[str, Any]) -> bool:
+        """Insert a JSON record only if the key is new; returns False if it already exists."""
+        with self._lock:
+            if (self._caches[table].get(key) is not None or (table, key) in self._pending
+                    or (table, key) in self._reserved):
+                return False
+            # Hold the key while checking the database so concurrent inserts of it cannot both
+            # succeed; readers don't see the record until it is queued as a write
+            self._reserved.add((table, key))
+        try:
+            exists = self._reader.execute(f"SELECT 1 FROM {table} WHERE username = ?", (key,)).fetchone()
+            if exists:
+                return False
+            self.put_record(table, key, value)
+            return True
+        finally:
+            with self._lock:
+                self._reserved.discard((table, key))
+
+    # -- Conversations -------------------------------------------------------------
+
+    def add_conversation(self, user_message: str, bot_response: str, username: Optional[str] = None) -> int:
+        """Store a chat turn and return its id, allocated without waiting for the database."""
+        with self._lock:
+            conversation_id = self._next_conversation_id
+            self._next_conversation_id += 1
+        conversation = {
+            'id': conversation_id,
+            'username': username,
+            'timestamp': datetime.now().isoformat(),
+            'user_message': user_message,
+            'bot_response': bot_response,
+            'feedback': None
+        }
+        self._enqueue(
+            "INSERT INTO conversations (id, username, timestamp, user_message, bot_response, feedback) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            tuple(conversation[column] for column in CONVERSATION_COLUMNS),
+            "conversations", conversation_id, conversation
+        )
+        return conversation_id
+
+    def get_conversation(self, conversation_id: int) -> Optional[Dict[str, Any]]:
+        """Read a conversation by id, or None if there is no such conversation."""
+        with self._lock:
+            if conversation_id >= self._next_conversation_id or conversation_id < 0:
+                return None
+            conversation = self._caches["conversations"].get(conversation_id)
+            if conversation is None and ("conversations", conversation_id) in self._pending:
+                conversation = self._pending[("conversations", conversation_id)][1]
+        if conversation is None:
+            row = self._reader.execute(
+                f"SELECT {', '.join(CONVERSATION_COLUMNS)} FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            conversation = dict(zip(CONVERSATION_COLUMNS, row))
+            with self._lock:
+                pending = self._pending.get(("conversations", conversation_id))
+                if pending is not None:
+                    conversation = pending[1]
+                else:
+                    self._caches["conversations"].put(conversation_id, conversation)
+        return conversation
+
+    def set_feedback(self, conversation_id: int, rating: int) -> Optional[Dict[str, Any]]:
+        """
+        Rate (or re-rate) a conversation and update the review statistics in O(1).
+
+        Returns:
+            The updated conversation, or None if it does not exist
+        """
+        with self._feedback_lock:
+            conversation = self.get_conversation(conversation_id)
+            if conversation is None:
+                return None
+            previous = conversation['feedback']
+
+            # The histogram changes in the same transaction as the rating itself, and the
+            # in-memory copy only once that transaction has committed
+            deltas = [(rating, 1)] if previous is None else [(previous, -1), (rating, 1)]
+
+            def count_rating():
+                with self._lock:
+                    for value, delta in deltas:
+                        self._rating_counts[value] = self._rating_counts.get(value, 0) + delta
+
+            conversation = dict(conversation, feedback=rating)
+            self._enqueue(
+                "UPDATE conversations SET feedback = ? WHERE id = ?", (rating, conversation_id),
+                "conversations", conversation_id, conversation,
+                also=[("INSERT INTO review_stats (rating, count) VALUES (?, ?) "
+                       "ON CONFLICT (rating) DO UPDATE SET count = count + excluded.count", (value, delta))
+                      for value, delta in deltas],
+                on_commit=count_rating
+            )
+        return conversation
+
+    def _load_rating_counts(self) -> Dict[int, int]:
+        counts = dict.fromkeys(RATINGS, 0)
+        rows = self._writer_db.execute("SELECT rating, count FROM review_stats").fetchall()
+        if not rows:
+            # Databases created before review_stats existed: count once, then keep it incrementally
+            rows = self._writer_db.execute(
+                "SELECT feedback, count(*) FROM conversations WHERE feedback IS NOT NULL GROUP BY feedback"
+            ).fetchall()
+            self._writer_db.executemany("INSERT INTO review_stats (rating, count) VALUES (?, ?)", rows)
+        counts.update(rows)
+        return counts
+
+    def review_stats(self) -> Dict[str, Any]:
+        """Rating count, average, high (4-5) ratings and distribution, from the maintained histogram."""
+        with self._lock:
+            distribution = {rating: self._rating_counts.get(rating, 0) for rating in RATINGS}
+        total = sum(distribution.values())
+        return {
+            'total_reviews': total,
+            'average_rating': round(sum(r * n for r, n in distribution.items()) / total, 2) if total else 0,
+            'high_ratings': distribution[4] + distribution[5],
+            'rating_distribution': distribution,
+        }
+
+    def rated_conversations(self, before: Optional[int] = None, limit: int = 20) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        One page of rated conversations, newest first.
+
+        Args:
+            before: Cursor from the previous page (only conversations with a smaller id), or None
+            limit: Page size
+
+        Returns:
+            Tuple of the conversations and the cursor of the next page (None on the last page)
+        """
+        self.flush()
+        rows = self._reader.execute(
+            f"SELECT {', '.join(CONVERSATION_COLUMNS)} FROM conversations INDEXED BY conversations_rated "
+            f"WHERE feedback IS NOT NULL AND id < ? ORDER BY id DESC LIMIT ?",
+            (before if before is not None else self._next_conversation_id, limit + 1)
+        ).fetchall()
+        page = [dict(zip(CONVERSATION_COLUMNS, row)) for row in rows[:limit]]
+        return page, (page[-1]['id'] if len(rows) > limit else None)
+
+    # -- Feedback patterns ---------------------------------------------------------
+
+    def add_feedback_rating(self, pattern: str, rating: int, weight: float, total: float) -> None:
+        """
+        Record one rating of a response that showed a feedback pattern.
+
+        Args:
+            pattern: The feedback pattern
+            rating: The rating, appended to the ratings log
+            weight: The pattern's running rating weight after this rating
+            total: The pattern's running weighted rating sum after this rating
+        """
+        self._enqueue(
+            "INSERT INTO feedback_ratings (pattern, rating, timestamp) VALUES (?, ?, ?)",
+            (pattern, rating, datetime.now().isoformat()),
+            also=[("INSERT OR REPLACE INTO feedback_patterns (pattern, weight, total) VALUES (?, ?, ?)",
+                   (pattern, weight, total))]
+        )
+
+    def load_feedback_patterns(self) -> Dict[str, Tuple[float, float]]:
+        """Running (weight, weighted rating sum) of each pattern, in the order patterns were first seen."""
+        rows = self._reader.execute("SELECT pattern, weight, total FROM feedback_patterns ORDER BY rowid").fetchall()
+        if not rows:
+            # Databases from before the aggregates table: fold the ratings log once
+            rows = self._reader.execute(
+                "SELECT pattern, count(*), sum(rating) FROM feedback_ratings GROUP BY pattern ORDER BY min(id)"
+            ).fetchall()
+        return {pattern: (weight, total) for pattern, weight, total in rows}
+
+    # -- Background jobs -----------------------------------------------------------
+
+    def put_job(self, job: Dict[str, Any]) -> None:
+        """Insert or replace a job record (see job_queue.py)."""
+        self._enqueue(
+            "INSERT OR REPLACE INTO jobs (id, kind, status, created_at, data) VALUES (?, ?, ?, ?, ?)",
+            (job['id'], job['kind'], job['status'], job['created_at'], json.dumps(job, default=str)),
+            "jobs", job['id'], job
+        )
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Read a job by id, or None if there is no such job."""
+        with self._lock:
+            job = self._caches["jobs"].get(job_id)
+            if job is None and ("jobs", job_id) in self._pending:
+                job = self._pending[("jobs", job_id)][1]
+        if job is None:
+            row = self._reader.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = json.loads(row[0])
+            with self._lock:
+                pending = self._pending.get(("jobs", job_id))
+                if pending is not None:
+                    job = pending[1]
+                else:
+                    self._caches["jobs"].put(job_id, job)
+        return job
+
+    def unfinished_jobs(self, kind: str) -> List[Dict[str, Any]]:
+        """Jobs of a kind that were queued or running when the process last stopped, oldest first."""
+        self.flush()
+        rows = self._reader.execute(
+            "SELECT data FROM jobs WHERE kind = ? AND status IN ('queued', 'running') ORDER BY created_at",
+            (kind,)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def prune_jobs(self, max_age_seconds: float = 0, max_finished: int = 0) -> int:
+        """
+        Delete finished (done or failed) jobs, results included, that are past the retention limits.
+
+        Args:
+            max_age_seconds: Delete finished jobs submitted longer ago than this (0 for no age limit)
+            max_finished: Keep at most this many finished jobs, the newest (0 for no count limit)
+
+        Returns:
+            int: The number of jobs deleted
+        """
+        conditions, params = [], []
+        if max_age_seconds:
+            conditions.append("created_at < ?")
+            params.append((datetime.now() - timedelta(seconds=max_age_seconds)).isoformat())
+        if max_finished:
+            conditions.append("id NOT IN (SELECT id FROM jobs WHERE status IN ('done', 'failed') "
+                              "ORDER BY created_at DESC LIMIT ?)")
+            params.append(max_finished)
+        if not conditions:
+            return 0
+        self.flush()
+        rows = self._reader.execute(
+            f"SELECT id FROM jobs WHERE status IN ('done', 'failed') AND ({' OR '.join(conditions)})", params
+        ).fetchall()
+        job_ids = [row[0] for row in rows]
+        for start in range(0, len(job_ids), 500):
+            chunk = job_ids[start:start + 500]
+            self._enqueue(f"DELETE FROM jobs WHERE id IN ({', '.join('?' * len(chunk))})", tuple(chunk))
+        with self._lock:
+            for job_id in job_ids:
+                self._caches["jobs"].discard(job_id)
+        return len(job_ids)
+
+    def stats(self) -> Dict[str, Any]:
+        """Write batching and cache counters for monitoring."""
+        with self._lock:
+            return {
+                'queued_writes': self._queue.qsize(),
+                'pending_records': len(self._pending),
+                'commits': self.commits,
+                'writes': self.writes,
+                'failed_writes': self.failed_writes,
+                'avg_batch_size': round(self.writes / self.commits, 2) if self.commits else 0.0,
+                'largest_batch': self.largest_batch,
+                'cached_records': {table: len(cache) for table, cache in self._caches.items()},
+            }
+
+
+class RecordTable:
+    """
+    Dict-style view of one keyed table, so callers can keep using
+    `table.get(username)`, `username in table` and `table[username] = value`.
+    Changing a returned value in place is not persisted: assign it back.
+    """
+
+    def __init__(self, storage: Storage, table: str):
+        self.storage = storage
+        self.table = table
+
+    def get(self, key: str, default=None):
+        return self.storage.get_record(self.table, key, default)
+
+    def __contains__(self, key: str) -> bool:
+        return self.storage.get_record(self.table, key) is not None
+
+    def __getitem__(self, key: str):
+        value = self.storage.get_record(self.table, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Dict[str, Any]) -> None:
+        self.storage.put_record(self.table, key, value)
+
+    def insert(self, key: str, value: Dict[str, Any]) -> bool:
+        """Add a record only if the key is new (atomic check-and-insert)."""
+        return self.storage.insert_record(self.table, key, value)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    """Return the process-wide storage, opening the database on first use."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = Storage()
+                atexit.register(_storage.close)
+    return _storage
@@ -0,0 +1,167 @@
+"""
+Matrix Vector Store for the RAG System
+
+Exact nearest-neighbour search over chunk embeddings kept as one contiguous,
+L2-normalized float32 matrix. Cosine similarity is then a plain dot product, so
+scoring every chunk is a single matrix-vector product and a batch of queries is
+a single matrix-matrix product. Top-k selection uses argpartition, which is
+linear in the number of chunks instead of a full sort.
+
+The matrix may be a read-only memory map of an index artifact; it is never
+copied when it is already normalized. Rows can be hidden with a `live` mask,
+which is how deleted chunks disappear before the matrix is compacted.
+"""
+
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+
+def normalize_rows(matrix) -> np.ndarray:
+    """Return a contiguous float32 copy of `matrix` with every row scaled to unit length."""
+    matrix = np.array(matrix, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return np.ascontiguousarray(matrix)
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores in each row, best first.
+
+    Args:
+        scores: (queries, chunks) score matrix
+        k: Number of results per query
+
+    Returns:
+        np.ndarray: (queries, k) array of column indices
+    """
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), (scores.shape[0], k))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class MatrixVectorStore:
+    """Exact cosine-similarity search over a normalized embedding matrix."""
+
+    def __init__(self, texts: List[str], metadatas: Optional[List[Dict[str, Any]]], embeddings,
+                 normalized: bool = False, live: Optional[np.ndarray] = None):
+        """
+        Initialize the store.
+
+        Args:
+            texts: Chunk texts, one per row of `embeddings`
+            metadatas: Chunk metadata, one dict per chunk (defaults to empty dicts)
+            embeddings: (chunks, dimensions) matrix of chunk embeddings
+            normalized (bool): True if the rows are already float32 and unit length, so the
+                matrix (e.g. a memory map) is used as-is
+            live: Optional boolean mask, one entry per row; rows marked False are never returned
+        """
+        if normalized and isinstance(embeddings, np.ndarray) and embeddings.dtype == np.float32 \
+                and embeddings.flags['C_CONTIGUOUS']:
+            self.matrix = embeddings
+        else:
+            self.matrix = normalize_rows(embeddings)
+
+        self.texts = texts
+        self.metadatas = metadatas if metadatas is not None else [{} for _ in texts]
+        if not (self.matrix.shape[0] == len(self.texts) == len(self.metadatas)):
+            raise ValueError("texts, metadatas and embeddings must have the same length")
+
+        self.dead_rows = np.flatnonzero(~live) if live is not None else np.zeros(0, dtype=np.int64)
+        self.live = live if len(self.dead_rows) else None
+
+    def __len__(self):
+        return len(self.texts)
+
+    @property
+    def live_count(self) -> int:
+        return len(self.texts) - len(self.dead_rows)
+
+    @property
+    def dimensions(self) -> int:
+        return self.matrix.shape[1]
+
+    def hits_for(self, indices, scores) -> List[Dict[str, Any]]:
+        """Format chunk rows and their scores as search results (rows scored -inf are dropped)."""
+        return [
+            {
+                "content": self.texts[i],
+                "metadata": self.metadatas[i],
+                "score": float(score),
+                "index": int(i),
+            }
+            for i, score in zip(indices, scores)
+            if score > -np.inf
+        ]
+
+    def search(self, query_vector, k: int = 3) -> List[Dict[str, Any]]:
+        """
+        Find the chunks most similar to one query.
+
+        Args:
+            query_vector: Query embedding
+            k: Number of chunks to return
+
+        Returns:
+            List of dicts with 'content', 'metadata', 'score' (cosine similarity) and 'index'
+        """
+        return self.search_batch([query_vector], k)[0]
+
+    def search_batch(self, query_vectors, k: int = 3) -> List[List[Dict[str, Any]]]:
+        """
+        Find the most similar chunks for many queries with a single matrix product.
+
+        Args:
+            query_vectors: (queries, dimensions) matrix or list of query embeddings
+            k: Number of chunks to return per query
+
+        Returns:
+            One result list per query, in the format of search()
+        """
+        if self.live_count == 0:
+            return [[] for _ in range(len(query_vectors))]
+
+        queries = normalize_rows(query_vectors)
+        if len(queries) == 1:
+            # Matrix-vector product avoids a GEMM over the transposed matrix
+            scores = (self.matrix @ queries[0])[np.newaxis, :]
+        else:
+            scores = queries @ self.matrix.T
+        if len(self.dead_rows):
+            scores[:, self.dead_rows] = -np.inf
+        indices = top_k_rows(scores, k)
+        return [
+            self.hits_for(row, np.take(scores[q], row))
+            for q, row in enumerate(indices)
+        ]
+
+
+class VectorRetriever:
+    """Embeds questions and looks them up in a vector store."""
+
+    def __init__(self, store, embeddings, k: int = 3):
+        """
+        Initialize the retriever.
+
+        Args:
+            store: Object with search(vector, k) and search_batch(vectors, k), e.g. MatrixVectorStore
+            embeddings: Object with embed_query(text) and embed_queries(texts)
+            k: Number of chunks to return per question
+        """
+        self.store = store
+        self.embeddings = embeddings
+        self.k = k
+
+    def invoke(self, question: str) -> List[Dict[str, Any]]:
+        """Return the k chunks most relevant to a question."""
+        return self.store.search(self.embeddings.embed_query(question), self.k)
+
+    def batch(self, questions: List[str]) -> List[List[Dict[str, Any]]]:
+        """Return the k most relevant chunks for each of several questions."""
+        return self.store.search_batch(self.embeddings.embed_queries(questions), self.k)